@@ -1,124 +1,86 @@
 # -*- coding: utf-8 -*-
 """
 CTk — вкладка ТЕКСТ в стиле твоих скринов.
-Только интерфейс, без логики. Все места для API помечены TODO.
+Окно над общим конвейером: запросы к Replicate через очередь задач
+(jobs), история чатов, вложения в S3, учёт стоимости и журнал задач.
 Горячие клавиши: Ctrl/⌘+Enter — Отправить, Esc — Очистить поле.
+Запуск с --profile-startup печатает разбивку времени старта.
 """
-import tkinter as tk
-import customtkinter as ctk
-
-import os, glob, json
-from tkinter import messagebox as mb
-
-import threading
 import time
 
-try:
-    import replicate
-except Exception:
-    replicate = None
+import profiling
+from profiling import StartupProfiler
 
-# .env support
-try:
-    from dotenv import load_dotenv
+STARTUP = StartupProfiler()
 
-    load_dotenv()
-except Exception:
-    load_dotenv = None
+with STARTUP.stage("tkinter", group="import"):
+    import tkinter as tk
+    from tkinter import messagebox as mb
+with STARTUP.stage("customtkinter", group="import"):
+    import customtkinter as ctk
 
-APP_TITLE = "AI Workbench — Text (CTk)"
-APP_MIN_W, APP_MIN_H = 1240, 760
+import os
+import argparse
 
-# ---- helpers to format model output ----
-
-
-def _as_whisper_transcription(output):
-    if isinstance(output, dict):
-        t = output.get("transcription")
-        if isinstance(t, str) and t.strip():
-            return t
-    if isinstance(output, list) and output and isinstance(output[0], dict):
-        t = output[0].get("transcription")
-        if isinstance(t, str) and t.strip():
-            return t
-    return None
-
-
-def format_prediction_output(output) -> str:
-    t = _as_whisper_transcription(output)
-    if t is not None:
-        return t
-    if isinstance(output, list):
-        urls = [
-            x
-            for x in output
-            if isinstance(x, str) and x.startswith(("http://", "https://"))
-        ]
-        if urls:
-            return "\n".join(urls)
-        if len(output) == 1 and isinstance(output[0], str):
-            return output[0]
-        try:
-            import json as _json
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+
+import ui_monitor
+from ui_monitor import track
+from conversation import ConversationView
+import attachments
+import context
+import costs
+import hedge
+import jobs
+import logs
+import outputs
+import predictions
+import store
+import tracing
+import history
+import imageprep
+import jobdb
+from modelconf import apply_prompt, effective_input, read_model_configs
+from history import HistoryStore
 
-            return _json.dumps(output, ensure_ascii=False, indent=2)
-        except Exception:
-            return str(output)
-    if isinstance(output, str):
-        return output
+# .env support
+with STARTUP.stage("dotenv", group="import"):
     try:
-        import json as _json
+        from dotenv import load_dotenv
 
-        return _json.dumps(output, ensure_ascii=False, indent=2)
+        load_dotenv()
     except Exception:
-        return str(output)
+        load_dotenv = None
 
+# replicate (и S3-библиотеки) импортируются лениво — при первой отправке
+_replicate_mod = None
+_replicate_lock = threading.Lock()
+log = logs.get_logger("app")
 
-# ---- coercion helpers (bring types to what API expects) ----
-JSON_LIKE_KEYS = {
-    "tools",
-    "messages",
-    "documents",
-    "chat_template_kwargs",
-    "image_input",
-}
 
+def _get_replicate():
+    """Import replicate on first use; returns None if the package is missing."""
+    global _replicate_mod
+    with _replicate_lock:
+        if _replicate_mod is None:
+            with STARTUP.stage("replicate (lazy)", group="import"):
+                try:
+                    import replicate as _r
+                except Exception:
+                    return None
+            _replicate_mod = _r
+        return _replicate_mod
 
-def _parse_json_if_needed(val):
-    if isinstance(val, (dict, list)):
-        return val
-    if isinstance(val, str):
-        s = val.strip()
-        if (s.startswith("[") and s.endswith("]")) or (
-            s.startswith("{") and s.endswith("}")
-        ):
-            try:
-                return json.loads(s)
-            except Exception:
-                return val
-    return val
 
+APP_TITLE = "AI Workbench — Text (CTk)"
+APP_MIN_W, APP_MIN_H = 1240, 760
 
-def _coerce_value_by_type(ctrl_type: str, key: str, val):
-    """Coerce a single value based on control type and known json-like keys."""
-    if ctrl_type == "checkbox":
-        if isinstance(val, bool):
-            return val
-        return str(val).strip().lower() in ("1", "true", "yes", "on")
-    if ctrl_type == "slider":
-        try:
-            return float(val)
-        except Exception:
-            return val
-    if ctrl_type == "int":
-        try:
-            return int(float(val))
-        except Exception:
-            return val
-    # text/select: keep string, but parse JSON for known keys
-    if key in JSON_LIKE_KEYS:
-        return _parse_json_if_needed(val)
-    return val
+# кеш панелей настроек: суммарный бюджет виджетов по всем закешированным моделям
+SETTINGS_CACHE_MAX_WIDGETS = int(os.getenv("SETTINGS_CACHE_MAX_WIDGETS", "400"))
+# тайминги переключения — в лог на уровне DEBUG (AIHUB_LOG_LEVEL=DEBUG)
+SETTINGS_TIMING_DEBUG = os.getenv("SETTINGS_TIMING_DEBUG", "") not in ("", "0")
 
 
 class TextApp(ctk.CTk):
@@ -138,28 +100,158 @@ class TextApp(ctk.CTk):
         self.grid_rowconfigure(1, weight=1)
 
         # ======== TOP TABS (global) ========
-        self.top_tabs = TopTabs(self)
-        self.top_tabs.grid(
-            row=0, column=0, columnspan=3, sticky="we", padx=12, pady=(8, 0)
-        )
+        with STARTUP.stage("TopTabs"):
+            self.top_tabs = TopTabs(self, on_select=self.show_tab)
+            self.top_tabs.grid(
+                row=0, column=0, columnspan=3, sticky="we", padx=12, pady=(8, 0)
+            )
+
+        # ======== JOB QUEUE (fixed worker pool for sends) ========
+        self.jobs = jobs.JobQueue()
+        # журнал отправок: незавершённые доводятся при следующем запуске
+        with STARTUP.stage("jobdb"):
+            self.journal = jobdb.Recorder(jobdb.JobDB(), jobdb.APP)
+        self.jobs.subscribe(self.journal)
+
+        # ======== COSTS (цены из models_conf/prices.json) ========
+        with STARTUP.stage("costs"):
+            self.costs = costs.CostEngine()
+            self.spend = costs.SpendStore()
+
+        # ======== HISTORY (SQLite, запись в фоне) ========
+        with STARTUP.stage("HistoryStore"):
+            self.history = HistoryStore()
+        self.conversation_id: str | None = None
+        # галерея и кеш миниатюр создаются при первом открытии вкладки
+        self.gallery = None
+        self.thumbs = None
 
         # ======== LEFT SIDEBAR ========
-        self.left = LeftSidebar(self)
-        self.left.grid(row=1, column=0, sticky="nsw", padx=(12, 6), pady=12)
+        with STARTUP.stage("LeftSidebar"):
+            self.left = LeftSidebar(self)
+            self.left.grid(row=1, column=0, sticky="nsw", padx=(12, 6), pady=12)
+        self.jobs.subscribe(self._on_job_update)
 
         # ======== CENTER (hero + bottom prompt) ========
-        self.center = CenterText(self)
-        self.center.grid(row=1, column=1, sticky="nsew", padx=6, pady=12)
+        with STARTUP.stage("CenterText"):
+            self.center = CenterText(self)
+            self.center.grid(row=1, column=1, sticky="nsew", padx=6, pady=12)
 
         # ======== RIGHT RAIL (model & features) ========
-        self.rail = RightRailText(self)
-        self.rail.grid(row=1, column=2, sticky="ns", padx=(6, 12), pady=12)
+        # конфиги моделей читаются в фоне, панель настроек строится по готовности
+        with STARTUP.stage("RightRailText (shell)"):
+            self.rail = RightRailText(self)
+            self.rail.grid(row=1, column=2, sticky="ns", padx=(6, 12), pady=12)
 
         # хоткеи
         self.bind_all("<Control-Return>", lambda e: self.center.on_send())
         self.bind_all("<Command-Return>", lambda e: self.center.on_send())  # macOS
         self.bind_all("<Escape>", lambda e: self.center.clear_input())
 
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.after_idle(lambda: STARTUP.mark("first frame (idle)"))
+        self.rail.load_models_async("models_conf/text")
+        self.after(1000, self.resume_jobs)
+
+    def resume_jobs(self):
+        """Queue jobs left unfinished when the app was last closed."""
+        if not os.getenv("REPLICATE_API_KEY") or _get_replicate() is None:
+            return
+
+        def resume(rows: list[dict]):
+            for row in rows:
+                runner = self.center.resume_job(row)
+                self.jobs.submit(row["model"], row["input"], runner)
+
+        run_in_background(
+            self, lambda: self.journal.db.unfinished(origin=jobdb.APP), resume
+        )
+
+    def on_close(self):
+        # дописываем историю, которая ещё в очереди писателя
+        self.history.flush(timeout=5)
+        self.history.close()
+        self.jobs.shutdown()
+        self.center.attachments.shutdown()
+        if self.thumbs is not None:
+            self.thumbs.shutdown()
+        self.destroy()
+
+    def show_tab(self, name: str):
+        if name == "Изображение":
+            if self.gallery is None:
+                from gallery import ImageGallery, load_bytes
+                from thumbs import ThumbCache
+
+                # исходник для миниатюры тоже попадает в локальное хранилище
+                self.thumbs = ThumbCache(fetch=load_bytes)
+                self.gallery = ImageGallery(self, self.history, self.thumbs)
+            self.center.grid_remove()
+            self.gallery.grid(row=1, column=1, sticky="nsew", padx=6, pady=12)
+            self.history.flush(timeout=1)
+            self.gallery.refresh()
+        else:
+            if self.gallery is not None:
+                self.gallery.grid_remove()
+            self.center.grid()
+
+    def record_images(self, items, model: str, prediction_id: str, conv_id=None):
+        """Remember image outputs for the gallery (called from workers)."""
+        added = False
+        for it in items:
+            if it.kind == outputs.IMAGE and it.url:
+                self.history.add_image(
+                    it.url, model, prediction_id, it.s3_key, conv_id
+                )
+                added = True
+        if added and self.gallery is not None:
+
+            def refresh():
+                if self.gallery.winfo_ismapped():
+                    self.history.flush(timeout=1)
+                    self.gallery.refresh()
+
+            try:
+                self.after(0, refresh)
+            except Exception:
+                pass
+
+    def record_message(
+        self,
+        role: str,
+        content: str,
+        model: str | None = None,
+        prediction_id: str | None = None,
+    ):
+        """Append a message to the current conversation in the history store
+        (starting a new conversation if needed). Never blocks on disk."""
+        if self.conversation_id is None:
+            title = content.strip().splitlines()[0] if content.strip() else ""
+            self.conversation_id = self.history.new_conversation(title)
+            self.left.history.add_conversation(self.conversation_id, title[:120])
+        self.history.append(self.conversation_id, role, content, model, prediction_id)
+
+    def new_conversation(self):
+        self.conversation_id = None
+        self.center.conversation.clear()
+
+    def open_conversation(self, conv_id: str):
+        def show(messages: list[dict]):
+            self.conversation_id = conv_id
+            view = self.center.conversation
+            view.clear()
+            for m in messages:
+                view.append_message(m["role"], m["content"], meta=m["model"] or "")
+
+        run_in_background(self, lambda: self.history.messages(conv_id), show)
+
+    def _on_job_update(self, job: jobs.Job):
+        # вызывается из потоков пула — перекидываем в Tk-поток
+        try:
+            self.after(0, lambda: self.left.queue.update_job(job))
+        except Exception:
+            pass
+
 
 # ---------------- LEFT ----------------
 class LeftSidebar(ctk.CTkFrame):
@@ -167,26 +259,277 @@ class LeftSidebar(ctk.CTkFrame):
         super().__init__(master, corner_radius=16, fg_color=("gray10", "gray12"))
         self.configure(width=220)
         self.grid_propagate(False)
-        self.grid_rowconfigure(2, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(1, weight=1)
 
-        # «Нет данных» — заглушка под список проектов/чатов
-        box = ctk.CTkFrame(self, corner_radius=16, fg_color=("gray11", "gray13"))
-        box.grid(row=0, column=0, sticky="nsew", padx=12, pady=(12, 6))
-        box.grid_propagate(False)
-        box.configure(height=560)
-        ctk.CTkLabel(box, text="Нет данных", text_color=("gray70", "gray60")).place(
-            relx=0.5, rely=0.5, anchor="center"
-        )
+        # очередь отправок (пока задач нет — «Нет данных»)
+        self.queue = JobQueuePanel(self, master.jobs)
+        self.queue.grid(row=0, column=0, sticky="nsew", padx=12, pady=(12, 6))
+
+        # история диалогов: страницы подгружаются по мере прокрутки/«Ещё»
+        self.history = HistoryPanel(self, master.history, master.open_conversation)
+        self.history.grid(row=1, column=0, sticky="nsew", padx=12, pady=6)
 
         # нижние иконки (по желанию)
         bottom = ctk.CTkFrame(self, fg_color="transparent")
         bottom.grid(row=2, column=0, sticky="we", padx=12, pady=(6, 12))
-        ctk.CTkButton(bottom, text="Новый проект", command=lambda: None).pack(fill="x")
+        ctk.CTkButton(
+            bottom, text="Новый чат", command=master.new_conversation
+        ).pack(fill="x")
+
+
+def run_in_background(widget, fn, callback=None):
+    """Run fn() on a daemon thread and hand its result to callback on the
+    Tk thread."""
+
+    def worker():
+        try:
+            result = fn()
+        except Exception as e:
+            log.exception("фоновая задача упала: %s", e)
+            return
+        if callback is not None:
+            try:
+                widget.after(0, lambda: callback(result))
+            except Exception:
+                pass
+
+    threading.Thread(target=worker, daemon=True).start()
+
+
+class HistoryPanel(ctk.CTkFrame):
+    """Поиск и постраничный список прошлых диалогов из HistoryStore."""
+
+    def __init__(self, master, store: HistoryStore, on_open):
+        super().__init__(master, corner_radius=16, fg_color=("gray11", "gray13"))
+        self.store = store
+        self.on_open = on_open
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(1, weight=1)
+
+        self.search_var = tk.StringVar()
+        search = ctk.CTkEntry(
+            self, textvariable=self.search_var, placeholder_text="Поиск…"
+        )
+        search.grid(row=0, column=0, sticky="we", padx=8, pady=(8, 4))
+        search.bind("<KeyRelease>", lambda e: self._schedule_search())
+        self._search_after = None
+
+        self.list = ctk.CTkScrollableFrame(self, fg_color="transparent")
+        self.list.grid(row=1, column=0, sticky="nsew", padx=2, pady=(0, 6))
+        self._rows: dict[str, ctk.CTkButton] = {}
+        self._more_btn = None
+        self._last_updated: float | None = None
+        self._loading = False
+        self.load_more()
+
+    # ---- paging ----
+    def load_more(self):
+        if self._loading:
+            return
+        self._loading = True
+        before = self._last_updated
+        run_in_background(
+            self, lambda: self.store.list_conversations(before=before), self._add_page
+        )
+
+    def _add_page(self, page: list[dict]):
+        self._loading = False
+        if self.search_var.get().strip():
+            return  # пока показаны результаты поиска, страницы не доливаем
+        if self._more_btn is not None:
+            self._more_btn.destroy()
+            self._more_btn = None
+        for conv in page:
+            self._add_row(conv)
+        if page:
+            self._last_updated = page[-1]["updated_at"]
+        if len(page) >= history.PAGE_SIZE:
+            self._more_btn = ctk.CTkButton(
+                self.list, text="Ещё…", fg_color="transparent", command=self.load_more
+            )
+            self._more_btn.pack(fill="x", pady=4)
+
+    def _add_row(self, conv: dict, top: bool = False, snippet: str = ""):
+        if conv["id"] in self._rows:
+            return
+        text = conv["title"]
+        if snippet:
+            text += "\n" + snippet
+        btn = ctk.CTkButton(
+            self.list,
+            text=text,
+            anchor="w",
+            fg_color="transparent",
+            hover_color=("gray20", "gray20"),
+            command=lambda cid=conv["id"]: self.on_open(cid),
+        )
+        if top and self._rows:
+            btn.pack(fill="x", pady=1, before=next(iter(self._rows.values())))
+        else:
+            btn.pack(fill="x", pady=1)
+        if top:
+            self._rows = {conv["id"]: btn, **self._rows}
+        else:
+            self._rows[conv["id"]] = btn
+
+    def add_conversation(self, conv_id: str, title: str):
+        """A conversation was just created locally: show it on top."""
+        if not self.search_var.get().strip():
+            self._add_row({"id": conv_id, "title": title}, top=True)
+
+    def _clear_rows(self):
+        for btn in self._rows.values():
+            btn.destroy()
+        self._rows = {}
+        if self._more_btn is not None:
+            self._more_btn.destroy()
+            self._more_btn = None
+
+    # ---- search ----
+    def _schedule_search(self):
+        if self._search_after is not None:
+            self.after_cancel(self._search_after)
+        self._search_after = self.after(250, self._run_search)
+
+    def _run_search(self):
+        self._search_after = None
+        q = self.search_var.get().strip()
+        self._clear_rows()
+        if not q:
+            self._last_updated = None
+            self.load_more()
+            return
+        run_in_background(
+            self, lambda: self.store.search(q), lambda res: self._show_search(q, res)
+        )
+
+    def _show_search(self, q: str, results: list[dict]):
+        if q != self.search_var.get().strip():
+            return  # пользователь уже ввёл другой запрос
+        self._clear_rows()
+        for conv in results:
+            self._add_row(conv, snippet=conv.get("snippet") or "")
+
+
+JOB_STATE_STYLE = {
+    jobs.QUEUED: ("в очереди", "gray60"),
+    jobs.CREATING: ("создание", "#b8b8ff"),
+    jobs.RUNNING: ("выполняется", "#8ab4ff"),
+    jobs.UPLOADING: ("загрузка", "#8ad4ff"),
+    jobs.DONE: ("готово", "#8aff9a"),
+    jobs.FAILED: ("ошибка", "#ff8a8a"),
+    jobs.CANCELLED: ("отменено", "gray50"),
+}
+MAX_FINISHED_JOB_ROWS = 30
+
+
+class JobQueuePanel(ctk.CTkScrollableFrame):
+    """Список задач из JobQueue: состояние, время, отмена и «вперёд»."""
+
+    def __init__(self, master, queue: jobs.JobQueue):
+        super().__init__(
+            master, corner_radius=16, fg_color=("gray11", "gray13"), height=170
+        )
+        self.queue = queue
+        self._rows: dict[int, dict] = {}
+        self._finished: deque = deque()
+        self._ticking = False
+        self._empty = ctk.CTkLabel(
+            self, text="Нет данных", text_color=("gray70", "gray60")
+        )
+        self._empty.pack(pady=60)
+
+    def update_job(self, job: jobs.Job):
+        row = self._rows.get(job.id)
+        if row is None:
+            row = self._make_row(job)
+        label, color = JOB_STATE_STYLE.get(job.state, (job.state, "gray60"))
+        if job.state == jobs.RUNNING and job.status:
+            label = f"{label} · {job.status}"
+        row["state"].configure(text=label, text_color=color)
+        row["time"].configure(text=f"{job.elapsed:.0f} c")
+        if job.finished:
+            row["cancel"].configure(state="disabled")
+            if job.id not in self._finished:
+                self._finished.append(job.id)
+                self._trim_finished()
+        if job.state != jobs.QUEUED:
+            row["up"].configure(state="disabled")
+        if not job.finished and not self._ticking:
+            self._ticking = True
+            self.after(1000, self._tick)
+
+    def _make_row(self, job: jobs.Job) -> dict:
+        self._empty.pack_forget()
+        frame = ctk.CTkFrame(self, fg_color=("gray14", "gray16"), corner_radius=10)
+        frame.grid_columnconfigure(0, weight=1)
+        ctk.CTkLabel(
+            frame,
+            text=f"#{job.id} {job.model.split('/')[-1]}",
+            anchor="w",
+            font=ctk.CTkFont(size=12, weight="bold"),
+        ).grid(row=0, column=0, columnspan=2, padx=8, pady=(6, 0), sticky="we")
+        state = ctk.CTkLabel(frame, text="", anchor="w")
+        state.grid(row=1, column=0, padx=8, pady=(0, 6), sticky="we")
+        tm = ctk.CTkLabel(frame, text="", text_color=("gray70", "gray60"))
+        tm.grid(row=1, column=1, padx=(0, 4), pady=(0, 6))
+        up = ctk.CTkButton(
+            frame,
+            text="↑",
+            width=26,
+            command=lambda: self.queue.prioritize(job.id),
+        )
+        up.grid(row=0, column=2, padx=(0, 6), pady=(6, 0))
+        cancel = ctk.CTkButton(
+            frame,
+            text="✕",
+            width=26,
+            fg_color="gray30",
+            command=lambda: self.queue.cancel(job.id),
+        )
+        cancel.grid(row=1, column=2, padx=(0, 6), pady=(0, 6))
+        # новые задачи — сверху
+        if self._rows:
+            frame.pack(fill="x", padx=4, pady=3, before=self._newest_frame())
+        else:
+            frame.pack(fill="x", padx=4, pady=3)
+        row = {"frame": frame, "state": state, "time": tm, "up": up, "cancel": cancel}
+        self._rows[job.id] = row
+        return row
+
+    def _newest_frame(self):
+        return self._rows[max(self._rows)]["frame"]
+
+    def _trim_finished(self):
+        while len(self._finished) > MAX_FINISHED_JOB_ROWS:
+            jid = self._finished.popleft()
+            row = self._rows.pop(jid, None)
+            if row is not None:
+                row["frame"].destroy()
+            self.queue.forget(jid)
+
+    def _tick(self):
+        # обновляем таймеры активных задач раз в секунду
+        active = [j for j in self.queue.jobs() if not j.finished]
+        for job in active:
+            row = self._rows.get(job.id)
+            if row is not None:
+                row["time"].configure(text=f"{job.elapsed:.0f} c")
+        if active:
+            self.after(1000, self._tick)
+        else:
+            self._ticking = False
 
 
 class TopTabs(ctk.CTkFrame):
-    def __init__(self, master):
+    # вкладки, у которых уже есть своё содержимое
+    ENABLED = ("Текст", "Изображение")
+
+    def __init__(self, master, on_select=None):
         super().__init__(master, corner_radius=16, fg_color=("gray10", "gray12"))
+        self.on_select = on_select
+        self.labels: dict[str, ctk.CTkLabel] = {}
         self.grid_columnconfigure(0, weight=1)
         bar = ctk.CTkFrame(self, fg_color="transparent")
         bar.grid(row=0, column=0, sticky="w", padx=8, pady=8)
@@ -206,15 +549,30 @@ class TopTabs(ctk.CTkFrame):
                 font=ctk.CTkFont(size=13, weight="bold" if active else "normal"),
             )
             lab.grid(row=0, column=col, padx=(0, 16), sticky="w")
+            if name in self.ENABLED:
+                lab.configure(cursor="hand2")
+                lab.bind("<Button-1>", lambda e, n=name: self.select(n))
+            self.labels[name] = lab
             col += 1
 
+    def select(self, name: str):
+        for n, lab in self.labels.items():
+            active = n == name
+            lab.configure(
+                text_color=("white" if active else "gray70"),
+                font=ctk.CTkFont(size=13, weight="bold" if active else "normal"),
+            )
+        if self.on_select is not None:
+            self.on_select(name)
+
 
 # ---------------- CENTER ----------------
 class CenterText(ctk.CTkFrame):
     def __init__(self, master):
         super().__init__(master, corner_radius=16, fg_color=("gray10", "gray12"))
-        self.grid_rowconfigure(0, weight=1)  # hero
-        self.grid_rowconfigure(1, weight=0)  # prompt bar
+        self.grid_rowconfigure(0, weight=1)  # hero / лента диалога
+        self.grid_rowconfigure(1, weight=0)  # превью видео/аудио
+        self.grid_rowconfigure(2, weight=0)  # prompt bar
         self.grid_columnconfigure(0, weight=1)
 
         # центральный «чистый экран» с логотипом и фразой
@@ -223,50 +581,41 @@ class CenterText(ctk.CTkFrame):
         hero.grid_rowconfigure(0, weight=1)
         hero.grid_columnconfigure(0, weight=1)
 
-        # логотип «кольцо» простым Canvas
-        cnv = tk.Canvas(hero, bg="#0f0f13", highlightthickness=0)
-        cnv.grid(row=0, column=0, sticky="nsew")
-
-        def draw():
-            cnv.delete("all")
-            w = cnv.winfo_width() or 800
-            h = cnv.winfo_height() or 480
-            cx, cy = w // 2, h // 2 - 10
-            r1, r2 = 36, 20
-            cnv.create_oval(
-                cx - r1, cy - r1, cx + r1, cy + r1, outline="#a8a8b3", width=2
-            )
-            cnv.create_oval(
-                cx - r2, cy - r2, cx + r2, cy + r2, outline="#a8a8b3", width=2
-            )
-            cnv.create_text(
-                cx,
-                cy + 54,
-                text="Чем я могу помочь?",
-                fill="#d8d8e0",
-                font=("Arial", 14),
-            )
-
-        cnv.bind("<Configure>", lambda e: draw())
-        self.hero_canvas = cnv
+        # лента диалога; пока сообщений нет — рисует «кольцо» с фразой
+        self.conversation = ConversationView(hero)
+        self.conversation.grid(row=0, column=0, sticky="nsew", padx=4, pady=4)
 
         # нижняя панель ввода
         self.prompt = PromptBar(
             self, on_send=self.on_send, on_attach=self.on_attach, on_mic=self.on_mic
         )
-        self.prompt.grid(row=1, column=0, sticky="we", padx=14, pady=14)
+        self.prompt.grid(row=2, column=0, sticky="we", padx=14, pady=14)
+
+        # постер и длительность видео/аудио, пока копия едет в S3
+        self.previews = PreviewStrip(self)
+        # вложения грузятся в S3 в фоне сразу после выбора
+        self.attachments = attachments.AttachmentManager()
+        self.attachments.on_change = self._on_attachment_change
+        self.prompt.on_remove_chip = self.attachments.remove
+
+        # оценка стоимости обновляется по мере ввода (с задержкой)
+        self._estimate_after = None
+        self.prompt.input.bind("<KeyRelease>", lambda e: self._schedule_estimate())
+
+    def _schedule_estimate(self):
+        if self._estimate_after is not None:
+            self.after_cancel(self._estimate_after)
+        self._estimate_after = self.after(
+            250, lambda: self.master.rail.show_estimate(self.prompt.get_text())
+        )
 
-    # ----- actions (TODO: подключение API) -----
+    # ----- actions -----
     def on_send(self):
         text = self.prompt.get_text().strip()
         model_key = self.master.rail.model_var.get()
         input_payload = self.master.rail.get_effective_input()
         # перезапишем prompt текстом из поля, если он есть в конфиге; иначе добавим
-        if text:
-            if "prompt" in input_payload:
-                input_payload["prompt"] = text
-            else:
-                input_payload["user_prompt"] = text
+        apply_prompt(input_payload, text)
 
         # --- Показать предварительно собранный запрос ---
         try:
@@ -279,9 +628,14 @@ class CenterText(ctk.CTkFrame):
             )
         except Exception:
             preview = str({"model": model_key, "input": input_payload})
-        mb.showinfo("Запрос (preview)", preview)
-
-        # проверим наличие клиента replicate
+        # история до этой отправки — из неё воркер соберёт `messages`
+        conv_id = self.master.conversation_id
+        model_cfg = self.master.rail._current_cfg
+        sent_at = time.time()
+
+        # проверки до того, как забрать вложения: при ошибке настройки
+        # они остаются в поле ввода
+        replicate = _get_replicate()
         if replicate is None:
             mb.showerror(
                 "Ошибка",
@@ -297,67 +651,302 @@ class CenterText(ctk.CTkFrame):
                 "Не найден REPLICATE_API_KEY (добавьте в .env или окружение)",
             )
             return
-        client = replicate.Client(api_token=REPLICATE_API_KEY)
 
-        def worker():
+        # вложения уходят с этой отправкой; ждать будем только незагруженные
+        atts = self.attachments.take()
+        self.prompt.clear_chips()
+        attach_to = None
+        if atts:
+            attach_to = attachments.attach_key(model_cfg, input_payload)
+        if atts and attach_to is None:
+            self.conversation.append_message(
+                "error", "Эта модель не принимает вложения — они не отправлены"
+            )
+            atts = []
+        if text:
+            self.conversation.append_message("user", text, meta=model_key)
+            self.master.record_message("user", text, model_key)
+        self.conversation.append_message("meta", preview)
+        client = predictions.get_client()
+
+        def on_status(job, queue, prediction):
+            # статусы и тики поллинга логирует predictions.wait_for
+            queue.set_state(
+                job,
+                jobs.RUNNING,
+                prediction_id=prediction.id,
+                status=prediction.status,
+            )
+
+        def build_context(job):
+            # многоходовый чат: прошлые реплики в пределах бюджета модели
+            store = self.master.history
+            store.flush(timeout=2)
+            budget, strategy = context.context_budget(model_cfg)
+            recent = (
+                m for m in store.iter_recent(conv_id) if m["created_at"] < sent_at
+            )
+            messages, stats = context.build_messages(
+                recent,
+                text,
+                budget,
+                system_prompt=input_payload.get("system_prompt") or None,
+                strategy=strategy,
+            )
+            input_payload["messages"] = messages
+            # текст уже последним сообщением в messages — без этого модель,
+            # принимающая и prompt, получила бы реплику дважды
+            for key in ("prompt", "user_prompt"):
+                input_payload.pop(key, None)
+            job.prompt_tokens = stats.tokens
+
+        def worker(job, queue):
+            # корневой спан запроса; prediction id добавится после create
+            with logs.context(model=model_key, job=job.id), tracing.span(
+                "request", model=model_key, job=job.id
+            ):
+                with profiling.request_profile(model_key, job=job.id):
+                    run_job(job, queue)
+
+        def run_job(job, queue):
+            role = "assistant"
+            more = None
+            state = jobs.DONE
             try:
-                # Создаём предикшн
-                prediction = client.predictions.create(
-                    model=model_key,
-                    input=input_payload,
+                if text and conv_id is not None and "messages" in input_payload:
+                    with tracing.span("context.build"):
+                        build_context(job)
+                if atts:
+                    queue.set_state(job, jobs.UPLOADING, status="вложения")
+                    with tracing.span("attachments.resolve", count=len(atts)):
+                        urls = attachments.resolve(atts, timeout=600)
+                    input_payload[attach_to] = urls
+                # в журнал до create: после закрытия окна prediction доведём
+                self.master.journal.attach(job, conv_id=conv_id)
+                # Создаём предикшн и поллим статус; если в конфиге модели
+                # есть "hedge" — при долгом старте уходит дубль (hedge.py)
+                queue.set_state(job, jobs.CREATING)
+                prediction = hedge.run(
+                    client,
+                    model_key,
+                    input_payload,
+                    cfg=model_cfg,
+                    on_status=lambda p: on_status(job, queue, p),
+                    cancel_event=job.cancel_event,
+                    stream=False,
+                ).prediction
+
+                role, state, msg, more = self._collect(
+                    job, queue, prediction, model_key, input_payload, conv_id
                 )
-                # Поллинг статуса (как в твоём примере)
-                while prediction.status not in ("succeeded", "failed"):
-                    print("Статус:", prediction.status)
-                    time.sleep(1)
-                    prediction = client.predictions.get(prediction.id)
-
-                if prediction.status == "succeeded":
-                    out = prediction.output
-                    # Whisper-частный случай
-                    whisper_text = _as_whisper_transcription(out)
-                    if whisper_text is not None:
-                        msg = whisper_text
-                    else:
-                        # Если список ссылок — соберём их
-                        urls = []
-                        if isinstance(out, list):
-                            for item in out:
-                                if isinstance(item, str) and item.startswith(
-                                    ("http://", "https://")
-                                ):
-                                    urls.append(item)
-                            if not urls and len(out) == 1 and isinstance(out[0], str):
-                                urls = [out[0]]
-                        elif isinstance(out, str) and out.startswith(
-                            ("http://", "https://")
-                        ):
-                            urls = [out]
-
-                        if urls:
-                            msg = "\n".join(urls)
-                        else:
-                            # fallback
-                            msg = format_prediction_output(out)
-                else:
-                    msg = f"Статус: {prediction.status}\nОшибка: {getattr(prediction, 'error', None)}"
 
+            except predictions.Cancelled:
+                role = "meta"
+                state = jobs.CANCELLED
+                msg = "Запрос отменён"
             except Exception as e:
+                log.exception("исключение при запросе")
+                role = "error"
+                state = jobs.FAILED
                 msg = f"Исключение при запросе: {e}"
 
+            queue.set_state(
+                job, state, result=msg, error=msg if state == jobs.FAILED else None
+            )
             # показать результат в главном потоке
             try:
-                self.master.after(0, lambda: mb.showinfo("Ответ модели", msg))
+                self.master.after(
+                    0,
+                    lambda: self.show_result(
+                        msg, model_key, role, job.prediction_id, more
+                    ),
+                )
             except Exception:
                 pass
 
-        threading.Thread(target=worker, daemon=True).start()
+        self.master.jobs.submit(model_key, input_payload, worker)
         # очистим поле сразу
         self.prompt.clear_input()
 
+    def _record_cost(self, model_key: str, prediction):
+        app = self.master
+        metrics = getattr(prediction, "metrics", None) or {}
+        cost = app.costs.actual(model_key, metrics, prediction.output)
+        if cost is not None:
+            # spend_log по prediction.id — повтор после возобновления не удвоит
+            app.spend.record(prediction.id, model_key, cost, metrics)
+        today = app.spend.total()
+        app.after(0, lambda: app.rail.show_actual(cost, today))
+
+    def _collect(self, job, queue, prediction, model_key, input_payload, conv_id):
+        """Outputs of a finished prediction → cost, S3, gallery, store.
+        Returns (role, state, msg, more) for show_result (worker thread)."""
+        if prediction.status != "succeeded":
+            msg = (
+                f"Статус: {prediction.status}\n"
+                f"Ошибка: {getattr(prediction, 'error', None)}"
+            )
+            return "error", jobs.FAILED, msg, None
+        self._record_cost(model_key, prediction)
+        # тип вывода — по первым байтам; медиа копируем в S3,
+        # ссылки доставки провайдера живут недолго
+        with tracing.span("outputs.classify"):
+            items = outputs.classify(prediction.output)
+        self.start_previews(items)
+        if outputs.s3_configured() and any(i.is_media for i in items):
+            queue.set_state(job, jobs.UPLOADING, status="S3")
+            with tracing.span("outputs.persist"):
+                outputs.persist(items, prediction.id)
+        self.master.record_images(items, model_key, prediction.id, conv_id)
+        store.get_store().record_items(items, prediction.id, model_key, input_payload)
+        msg = outputs.render_text(items)
+        more = next((i.more for i in items if i.more), None)
+        return "assistant", jobs.DONE, msg, more
+
+    def resume_job(self, row: dict):
+        """Runner for a job the previous session left unfinished (jobdb row):
+        poll its prediction by id and collect outputs — no new create."""
+        model_key = row["model"]
+        input_payload = row["input"]
+        conv_id = (row.get("context") or {}).get("conv_id")
+        client = predictions.get_client()
+
+        def worker(job, queue):
+            self.master.journal.adopt(job, row["id"])
+            with logs.context(model=model_key, job=job.id, resumed=True), tracing.span(
+                "request", model=model_key, job=job.id, resumed=True
+            ):
+                run_job(job, queue)
+
+        def run_job(job, queue):
+            more = None
+            try:
+                if not row["prediction_id"]:
+                    # create мог и не дойти до Replicate — повторять не будем
+                    raise RuntimeError("окно закрылось во время создания prediction")
+                queue.set_state(job, jobs.RUNNING, prediction_id=row["prediction_id"])
+                prediction = predictions.resume(
+                    client,
+                    row["prediction_id"],
+                    on_status=lambda p: queue.set_state(
+                        job, jobs.RUNNING, status=p.status
+                    ),
+                    cancel_event=job.cancel_event,
+                ).prediction
+                role, state, msg, more = self._collect(
+                    job, queue, prediction, model_key, input_payload, conv_id
+                )
+            except predictions.Cancelled:
+                role, state, msg = "meta", jobs.CANCELLED, "Запрос отменён"
+            except Exception as e:
+                log.exception("не удалось продолжить запрос")
+                role, state = "error", jobs.FAILED
+                msg = f"Не удалось продолжить запрос: {e}"
+            queue.set_state(
+                job, state, result=msg, error=msg if state == jobs.FAILED else None
+            )
+            try:
+                self.master.after(
+                    0,
+                    lambda: self.show_resumed(
+                        msg, model_key, role, job.prediction_id, conv_id, more
+                    ),
+                )
+            except Exception:
+                pass
+
+        return worker
+
+    def show_resumed(self, msg, model_key, role, prediction_id, conv_id, more=None):
+        """Result of a job from the previous session: shown in the feed and
+        saved to the conversation it was sent from."""
+        if conv_id is None or conv_id == self.master.conversation_id:
+            self.show_result(msg, model_key, role, prediction_id, more)
+            return
+        self.conversation.append_message(
+            "meta", f"Ответ на запрос из прошлой сессии ({model_key}):"
+        )
+        msg_id = self.conversation.append_message(role, msg, meta=model_key)
+        if role != "meta":
+            self.master.history.append(conv_id, role, msg, model_key, prediction_id)
+        if more is not None:
+            self._offer_more(msg_id, model_key, more)
+
+    def start_previews(self, items):
+        """Probe video/audio outputs in the background (ranged reads only);
+        cards appear while the S3 copy is still running."""
+        import preview
+
+        for it in items:
+            if it.kind in (outputs.VIDEO, outputs.AUDIO) and it.url:
+
+                def ready(info):
+                    try:
+                        self.after(0, lambda: self.previews.add(info))
+                    except Exception:
+                        pass
+
+                preview.submit(it.url, it.kind, ready)
+
+    @track("render result")
+    def show_result(
+        self,
+        msg: str,
+        model_key: str = "",
+        role: str = "assistant",
+        prediction_id: str | None = None,
+        more=None,
+    ):
+        # длинный текст лента добавляет порциями, UI не блокируется
+        msg_id = self.conversation.append_message(role, msg, meta=model_key)
+        if role != "meta":
+            self.master.record_message(role, msg, model_key, prediction_id)
+        if more is not None:
+            self._offer_more(msg_id, model_key, more)
+
+    def _offer_more(self, msg_id: int, model_key: str, stream):
+        """Truncated structured output: next pages on demand (context menu)."""
+        view = self.conversation
+        kb = stream.shown_bytes // 1024
+        view.set_meta(msg_id, f"{model_key} · показано {kb} КБ, ПКМ → ещё")
+
+        def load_more():
+            view.set_more(msg_id, None)  # не даём запустить дважды
+
+            def shown(page: str):
+                view.extend_message(msg_id, page)
+                if stream.exhausted:
+                    view.set_meta(msg_id, model_key)
+                else:
+                    self._offer_more(msg_id, model_key, stream)
+
+            # следующую страницу форматируем не в Tk-потоке
+            run_in_background(self, stream.next_page, shown)
+
+        view.set_more(msg_id, load_more)
+
     def on_attach(self):
-        # TODO: выбор файла
-        pass
+        from tkinter import filedialog
+
+        paths = filedialog.askopenfilenames(
+            title="Вложения",
+            filetypes=[
+                ("Изображения", "*.png *.jpg *.jpeg *.webp *.gif *.bmp"),
+                ("Все файлы", "*.*"),
+            ],
+        )
+        if paths:
+            # загрузка стартует сразу, пока пользователь пишет промпт;
+            # уменьшение/перекодирование — по конфигу текущей модели
+            opts = imageprep.options(self.master.rail._current_cfg)
+            self.attachments.add(paths, preprocess=opts)
+
+    def _on_attachment_change(self, att: attachments.Attachment):
+        # из потоков загрузки — в Tk-поток
+        try:
+            self.after(0, lambda: self.prompt.update_chip(att))
+        except Exception:
+            pass
 
     def on_mic(self):
         # TODO: голосовой ввод
@@ -367,6 +956,69 @@ class CenterText(ctk.CTkFrame):
         self.prompt.clear_input()
 
 
+class PreviewStrip(ctk.CTkFrame):
+    """Cards with a poster frame and duration for video/audio outputs."""
+
+    MAX_CARDS = 4
+
+    def __init__(self, master):
+        super().__init__(master, fg_color="transparent")
+        self._cards: list[ctk.CTkFrame] = []
+
+    def add(self, info):
+        if not self._cards:
+            self.grid(row=1, column=0, sticky="we", padx=14, pady=(0, 2))
+        card = ctk.CTkFrame(self, corner_radius=10, fg_color=("gray16", "gray16"))
+        card.pack(side="left", padx=(0, 8))
+        if info.poster:
+            try:
+                from PIL import Image
+
+                with Image.open(info.poster) as im:
+                    im.thumbnail((160, 90))
+                    img = ctk.CTkImage(im.copy(), size=im.size)
+                ctk.CTkLabel(card, text="", image=img).pack(padx=6, pady=(6, 2))
+            except Exception:
+                pass
+        text = info.summary if not info.error else f"{info.summary} · нет превью"
+        ctk.CTkLabel(card, text=text, text_color="gray70").pack(padx=8)
+        row = ctk.CTkFrame(card, fg_color="transparent")
+        row.pack(padx=6, pady=(2, 6))
+        ctk.CTkButton(
+            row,
+            text="Открыть",
+            width=70,
+            height=24,
+            command=lambda: self._open(info.url),
+        ).pack(side="left", padx=(0, 4))
+        ctk.CTkButton(
+            row,
+            text="✕",
+            width=28,
+            height=24,
+            fg_color="gray25",
+            command=lambda: self._remove(card),
+        ).pack(side="left")
+        self._cards.append(card)
+        while len(self._cards) > self.MAX_CARDS:
+            self._remove(self._cards[0])
+
+    @staticmethod
+    def _open(url: str):
+        import webbrowser
+
+        # локальная копия, если вывод уже скачивали
+        path = store.get_store().local_path(url=url)
+        webbrowser.open("file://" + path if path else url)
+
+    def _remove(self, card):
+        if card in self._cards:
+            self._cards.remove(card)
+            card.destroy()
+        if not self._cards:
+            self.grid_remove()
+
+
 class PromptBar(ctk.CTkFrame):
     def __init__(self, master, on_send, on_attach, on_mic):
         super().__init__(master, corner_radius=16, fg_color=("gray11", "gray13"))
@@ -384,6 +1036,49 @@ class PromptBar(ctk.CTkFrame):
         self.send_btn = ctk.CTkButton(self, text="▶", width=56, command=on_send)
         self.send_btn.grid(row=0, column=3, padx=(6, 10), pady=10)
 
+        # «чипы» вложений: имя и состояние загрузки, ✕ — убрать
+        self.chips = ctk.CTkFrame(self, fg_color="transparent")
+        self._chips: dict[int, ctk.CTkButton] = {}
+        self.on_remove_chip = None
+
+    def update_chip(self, att):
+        icon = {
+            attachments.PENDING: "⏳",
+            attachments.UPLOADED: "✓",
+            attachments.FAILED: "⚠",
+        }.get(att.state, "")
+        chip = self._chips.get(id(att))
+        if chip is None:
+            if not self._chips:
+                self.chips.grid(
+                    row=1, column=0, columnspan=4, sticky="w", padx=10, pady=(0, 8)
+                )
+            chip = ctk.CTkButton(
+                self.chips,
+                text="",
+                height=24,
+                fg_color="gray25",
+                command=lambda: self._remove_chip(att),
+            )
+            chip.pack(side="left", padx=(0, 6))
+            self._chips[id(att)] = chip
+        chip.configure(text=f"{icon} {att.name}  ✕")
+
+    def _remove_chip(self, att):
+        chip = self._chips.pop(id(att), None)
+        if chip is not None:
+            chip.destroy()
+        if self.on_remove_chip is not None:
+            self.on_remove_chip(att)
+        if not self._chips:
+            self.chips.grid_forget()
+
+    def clear_chips(self):
+        for chip in self._chips.values():
+            chip.destroy()
+        self._chips.clear()
+        self.chips.grid_forget()
+
     def get_text(self) -> str:
         return self.input.get()
 
@@ -391,7 +1086,206 @@ class PromptBar(ctk.CTkFrame):
         self.input.delete(0, "end")
 
 
+# ---------------- COMPARE ----------------
+COMPARE_MAX_MODELS = 6
+
+
+class CompareWindow(ctk.CTkToplevel):
+    """Один промпт — несколько текстовых моделей одновременно, ответы в
+    параллельных колонках с задержкой, TTFT, токенами и стоимостью."""
+
+    def __init__(self, app: "TextApp"):
+        super().__init__(app)
+        self.app = app
+        self.title("Сравнение моделей")
+        self.geometry("1280x760")
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(2, weight=1)
+        self._queue: jobs.JobQueue | None = None
+        self._run_started = 0.0
+        self._pending = 0
+
+        # выбор моделей
+        picks = ctk.CTkFrame(self, fg_color=("gray11", "gray13"), corner_radius=12)
+        picks.grid(row=0, column=0, sticky="we", padx=12, pady=(12, 6))
+        self.model_vars: dict[str, tk.BooleanVar] = {}
+        confs = getattr(app.rail, "_model_confs", {})
+        current = app.rail.model_var.get()
+        for i, mid in enumerate(sorted(confs)):
+            var = tk.BooleanVar(value=(mid == current))
+            self.model_vars[mid] = var
+            ctk.CTkCheckBox(picks, text=mid, variable=var).grid(
+                row=i // 3, column=i % 3, padx=10, pady=6, sticky="w"
+            )
+
+        # промпт
+        bar = ctk.CTkFrame(self, fg_color=("gray11", "gray13"), corner_radius=12)
+        bar.grid(row=1, column=0, sticky="we", padx=12, pady=6)
+        bar.grid_columnconfigure(0, weight=1)
+        self.prompt = ctk.CTkEntry(bar, placeholder_text="Промпт для всех моделей…")
+        self.prompt.insert(0, app.center.prompt.get_text())
+        self.prompt.grid(row=0, column=0, sticky="we", padx=10, pady=10)
+        self.prompt.bind("<Return>", lambda e: self.run())
+        ctk.CTkButton(bar, text="Сравнить ▶", width=110, command=self.run).grid(
+            row=0, column=1, padx=(6, 10), pady=10
+        )
+        self.total_label = ctk.CTkLabel(bar, text="", text_color=("gray70", "gray60"))
+        self.total_label.grid(row=0, column=2, padx=(0, 10))
+
+        self.columns_frame = ctk.CTkFrame(self, fg_color="transparent")
+        self.columns_frame.grid(row=2, column=0, sticky="nsew", padx=12, pady=(6, 12))
+        self.columns_frame.grid_rowconfigure(0, weight=1)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def run(self):
+        text = self.prompt.get().strip()
+        models = [m for m, v in self.model_vars.items() if v.get()]
+        if not text or not models:
+            return
+        if len(models) > COMPARE_MAX_MODELS:
+            mb.showwarning(
+                "Сравнение", f"Выберите не больше {COMPARE_MAX_MODELS} моделей"
+            )
+            return
+        if _get_replicate() is None or not os.getenv("REPLICATE_API_KEY"):
+            mb.showerror("Ошибка", "Нужны пакет replicate и REPLICATE_API_KEY")
+            return
+        if self._queue is not None:
+            self._queue.shutdown()
+
+        for w in self.columns_frame.winfo_children():
+            w.destroy()
+        # свой пул на всё сравнение: все модели стартуют сразу, общее время
+        # равно самой медленной модели, а не сумме
+        self._queue = jobs.JobQueue(max_workers=len(models))
+        self._run_started = time.perf_counter()
+        self._pending = len(models)
+        self.total_label.configure(text="…")
+        for col, mid in enumerate(models):
+            self.columns_frame.grid_columnconfigure(col, weight=1, uniform="cmp")
+            self._start_column(col, mid, text)
+
+    def _start_column(self, col: int, mid: str, text: str):
+        frame = ctk.CTkFrame(
+            self.columns_frame, fg_color=("gray10", "gray12"), corner_radius=12
+        )
+        frame.grid(row=0, column=col, sticky="nsew", padx=4)
+        frame.grid_rowconfigure(2, weight=1)
+        frame.grid_columnconfigure(0, weight=1)
+        ctk.CTkLabel(
+            frame, text=mid, font=ctk.CTkFont(size=12, weight="bold")
+        ).grid(row=0, column=0, padx=10, pady=(8, 0), sticky="w")
+        stats = ctk.CTkLabel(frame, text="в очереди", text_color=("gray70", "gray60"))
+        stats.grid(row=1, column=0, padx=10, sticky="w")
+        view = ConversationView(frame, empty_text="")
+        view.grid(row=2, column=0, sticky="nsew", padx=6, pady=6)
+        msg_id = view.append_message("assistant", "", meta=mid)
+
+        payload = self.app.rail.effective_input_for(mid)
+        apply_prompt(payload, text)
+        ui = self.app
+
+        def on_tk(fn):
+            # окно сравнения могли закрыть, пока модель ещё отвечала
+            ui.after(0, lambda: fn() if view.winfo_exists() else None)
+
+        def on_text(chunk: str):
+            on_tk(lambda: view.extend_message(msg_id, chunk))
+
+        def worker(job, queue):
+            with logs.context(model=mid, job=job.id, compare=True), tracing.span(
+                "request", model=mid, job=job.id, compare=True
+            ):
+                with profiling.request_profile(mid, job=job.id, compare=True):
+                    run_job(job, queue)
+
+        def run_job(job, queue):
+            queue.set_state(job, jobs.RUNNING)
+            on_tk(lambda: stats.configure(text="выполняется…"))
+            try:
+                res = predictions.run(
+                    predictions.get_client(),
+                    mid,
+                    payload,
+                    on_text=on_text,
+                    cancel_event=job.cancel_event,
+                )
+            except Exception as e:
+                err = f"Исключение при запросе: {e}"
+                on_tk(lambda: self._finish_column(view, msg_id, stats, err, "ошибка"))
+                raise
+            pred = res.prediction
+            metrics = getattr(pred, "metrics", None) or {}
+            cost = None
+            if pred.status == "succeeded":
+                cost = ui.costs.actual(mid, metrics, pred.output)
+                if cost is not None:
+                    ui.spend.record(pred.id, mid, cost, metrics)
+                streamed = res.first_output is not None
+                final = ""
+                if not streamed:
+                    items = outputs.classify(pred.output)
+                    store.get_store().record_items(items, pred.id, mid, payload)
+                    final = outputs.render_text(items)
+            else:
+                final = f"Статус: {pred.status}\nОшибка: {getattr(pred, 'error', None)}"
+            line = _compare_stats_line(res, metrics, cost)
+            on_tk(lambda: self._finish_column(view, msg_id, stats, final, line))
+
+        self._queue.submit(mid, payload, worker)
+
+    def _finish_column(self, view, msg_id, stats, final: str, line: str):
+        if final:
+            view.extend_message(msg_id, final)
+        stats.configure(text=line)
+        self._pending -= 1
+        if self._pending <= 0:
+            wall = time.perf_counter() - self._run_started
+            self.total_label.configure(text=f"всего {wall:.1f} c")
+
+    def on_close(self):
+        if self._queue is not None:
+            for job in self._queue.jobs():
+                self._queue.cancel(job.id)
+            self._queue.shutdown()
+        self.destroy()
+
+
+def _compare_stats_line(res, metrics: dict, cost: float | None) -> str:
+    parts = []
+    if res.latency is not None:
+        parts.append(f"⏱ {res.latency:.1f} c")
+    if res.ttft is not None:
+        parts.append(f"TTFT {res.ttft:.2f} c")
+    tin, tout = metrics.get("input_token_count"), metrics.get("output_token_count")
+    if tin is not None or tout is not None:
+        parts.append(f"{tin or 0}→{tout or 0} ток")
+    parts.append(costs.format_cost(cost))
+    return " · ".join(parts)
+
+
 # ---------------- RIGHT ----------------
+@dataclass
+class _SettingsPanel:
+    """A built settings panel for one model, kept alive between switches."""
+
+    frame: ctk.CTkFrame
+    cfg: dict | None
+    vars: dict = field(default_factory=dict)
+    hidden_defaults: dict = field(default_factory=dict)
+    widget_count: int = 0
+
+
+def _count_widgets(widget) -> int:
+    n = 0
+    stack = list(widget.winfo_children())
+    while stack:
+        w = stack.pop()
+        n += 1
+        stack.extend(w.winfo_children())
+    return n
+
+
 class RightRailText(ctk.CTkFrame):
     def __init__(self, master):
         super().__init__(master, corner_radius=16, fg_color=("gray10", "gray12"))
@@ -406,9 +1300,8 @@ class RightRailText(ctk.CTkFrame):
         ctk.CTkLabel(header, text="Стоимость").grid(
             row=0, column=0, padx=10, pady=10, sticky="w"
         )
-        ctk.CTkLabel(header, text="⚡ 0.00", text_color="#b8b8ff").grid(
-            row=0, column=1, padx=10, pady=10, sticky="e"
-        )
+        self.cost_label = ctk.CTkLabel(header, text="⚡ 0.00", text_color="#b8b8ff")
+        self.cost_label.grid(row=0, column=1, padx=10, pady=10, sticky="e")
 
         # Выпадашка выбора модели
         model_block = ctk.CTkFrame(
@@ -424,17 +1317,21 @@ class RightRailText(ctk.CTkFrame):
             variable=self.model_var,
             values=[],  # values will be loaded from JSON configs only
         )
-        self._model_menu.grid(row=1, column=0, padx=12, pady=(0, 12), sticky="we")
+        self._model_menu.grid(
+            row=1, column=0, columnspan=2, padx=12, pady=(0, 12), sticky="we"
+        )
+        model_block.grid_columnconfigure(0, weight=1)
+        ctk.CTkButton(
+            model_block,
+            text="Сравнить…",
+            width=90,
+            height=24,
+            fg_color="gray30",
+            command=lambda: CompareWindow(self.master),
+        ).grid(row=0, column=1, padx=12, pady=(12, 6), sticky="e")
 
-        # Load external model configs (JSON) and extend the models list
-        self.load_models_from_dir("models_conf/text")
-        # If any configs are present, select the first one by default
-        try:
-            vals = list(self._model_menu.cget("values"))
-            if vals:
-                self.model_var.set(vals[0])
-        except Exception:
-            pass
+        # Конфиги моделей (JSON) подгружаются через load_models_async() после
+        # того, как окно уже показано
 
         # Контейнер для настроек
         self.settings_container = ctk.CTkScrollableFrame(
@@ -447,6 +1344,12 @@ class RightRailText(ctk.CTkFrame):
         self._current_cfg: dict | None = None
         self._hidden_defaults: dict[str, object] = {}
 
+        # LRU-кеш панелей настроек: model_id -> _SettingsPanel
+        self._panels: "OrderedDict[str, _SettingsPanel]" = OrderedDict()
+        self._active_panel: _SettingsPanel | None = None
+        # (model_id, ms, cached) последних переключений модели
+        self.switch_timings: deque = deque(maxlen=200)
+
         # ----- вспомогательные элементы -----
         def _slider_row(
             parent,
@@ -500,27 +1403,24 @@ class RightRailText(ctk.CTkFrame):
                 tb.insert("1.0", var.get())
                 tb.pack(fill="x", padx=12)
 
+                @track("textbox <KeyRelease> sync")
                 def sync(*_):
                     var.set(tb.get("1.0", "end").strip())
 
                 tb.bind("<KeyRelease>", sync)
 
-        def _rebuild_settings(*_):
+        def _build_panel(mid: str) -> _SettingsPanel:
             # Build strictly from JSON config; if none, show hint
-            for w in list(self.settings_container.winfo_children()):
-                w.destroy()
-            self.current_vars = {}
-            self._hidden_defaults = {}
-
-            mid = self.model_var.get()
             cfg = getattr(self, "_model_confs", {}).get(mid)
-            self._current_cfg = cfg
+            frame = ctk.CTkFrame(self.settings_container, fg_color="transparent")
+            panel = _SettingsPanel(frame=frame, cfg=cfg)
             if not cfg:
                 ctk.CTkLabel(
-                    self.settings_container,
+                    frame,
                     text="Нет конфига для этой модели (добавьте JSON в models_conf/text)",
                 ).pack(padx=12, pady=12, anchor="w")
-                return
+                panel.widget_count = _count_widgets(frame)
+                return panel
 
             for c in cfg.get("controls", []):
                 t = c.get("type")
@@ -533,15 +1433,15 @@ class RightRailText(ctk.CTkFrame):
 
                 if hidden:
                     # не рисуем контрол, но запоминаем значение для итогового input
-                    self._hidden_defaults[key] = default
+                    panel.hidden_defaults[key] = default
                     continue
 
                 # рисуем только видимые контролы
                 if t == "slider":
                     var = tk.DoubleVar(value=float(c.get("default", 0.0)))
-                    self.current_vars[key] = var
+                    panel.vars[key] = var
                     _slider_row(
-                        self.settings_container,
+                        frame,
                         key,
                         var,
                         float(c.get("min", 0.0)),
@@ -550,40 +1450,109 @@ class RightRailText(ctk.CTkFrame):
                     )
                 elif t == "int":
                     var = tk.StringVar(value=str(c.get("default", 0)))
-                    self.current_vars[key] = var
-                    _int_entry(
-                        self.settings_container, key, var, str(c.get("default", 0))
-                    )
+                    panel.vars[key] = var
+                    _int_entry(frame, key, var, str(c.get("default", 0)))
                 elif t == "checkbox":
                     var = tk.BooleanVar(value=bool(c.get("default", False)))
-                    self.current_vars[key] = var
-                    _checkbox(self.settings_container, key, var)
+                    panel.vars[key] = var
+                    _checkbox(frame, key, var)
                 elif t == "select":
                     var = tk.StringVar(value=str(c.get("default", "")))
-                    self.current_vars[key] = var
-                    _text_entry(self.settings_container, key, var, rows=1)
+                    panel.vars[key] = var
+                    _text_entry(frame, key, var, rows=1)
                 else:
                     var = tk.StringVar(value=str(c.get("default", "")))
-                    self.current_vars[key] = var
-                    _text_entry(self.settings_container, key, var, rows=2)
+                    panel.vars[key] = var
+                    _text_entry(frame, key, var, rows=2)
+
+            panel.widget_count = _count_widgets(frame)
+            return panel
+
+        @track("_rebuild_settings")
+        def _rebuild_settings(*_):
+            # Панели кешируются по модели: повторное переключение только
+            # скрывает/показывает готовый фрейм, состояние переменных сохраняется.
+            t0 = time.perf_counter()
+            mid = self.model_var.get()
+
+            if self._active_panel is not None:
+                self._active_panel.frame.pack_forget()
+
+            panel = self._panels.get(mid)
+            cached = panel is not None
+            if cached:
+                self._panels.move_to_end(mid)
+            else:
+                panel = _build_panel(mid)
+                self._panels[mid] = panel
+
+            panel.frame.pack(fill="x")
+            self._active_panel = panel
+            if not cached:
+                self._evict_panels()
+            self.current_vars = panel.vars
+            self._hidden_defaults = panel.hidden_defaults
+            self._current_cfg = panel.cfg
+
+            ms = (time.perf_counter() - t0) * 1000.0
+            self.show_estimate(self.master.center.prompt.get_text())
+            self.switch_timings.append((mid, ms, cached))
+            if SETTINGS_TIMING_DEBUG:
+                log.debug(
+                    "переключение настроек",
+                    extra={
+                        "model": mid,
+                        "ms": round(ms, 1),
+                        "cached": cached,
+                        "widgets_cached": self._cached_widget_count(),
+                    },
+                )
 
         self._model_menu.configure(command=lambda choice=None: _rebuild_settings())
-        _rebuild_settings()
+        self._rebuild_settings = _rebuild_settings
+        self._loading_label = ctk.CTkLabel(
+            self.settings_container,
+            text="Загрузка моделей…",
+            text_color=("gray70", "gray60"),
+        )
+        self._loading_label.pack(padx=12, pady=12, anchor="w")
+
+    def load_models_async(self, dirpath: str):
+        """Read configs in a background thread, then apply them on the Tk thread."""
+
+        def worker():
+            with STARTUP.stage(f"read {dirpath}", group="background"):
+                found = read_model_configs(dirpath)
+            try:
+                self.after(0, lambda: self._on_models_loaded(found))
+            except Exception:
+                pass
+
+        threading.Thread(target=worker, daemon=True, name="config-loader").start()
+
+    def _on_models_loaded(self, found: dict):
+        with STARTUP.stage("apply model configs"):
+            self._apply_model_configs(found)
+            # If any configs are present, select the first one by default
+            try:
+                vals = list(self._model_menu.cget("values"))
+                if vals:
+                    self.model_var.set(vals[0])
+            except Exception:
+                pass
+            if self._loading_label is not None:
+                self._loading_label.destroy()
+                self._loading_label = None
+            self._rebuild_settings()
+        STARTUP.mark("models ready")
+        self.event_generate("<<ModelsLoaded>>", when="tail")
 
     def load_models_from_dir(self, dirpath: str):
         """Read all *.json model configs, register them, and extend the OptionMenu values."""
+        self._apply_model_configs(read_model_configs(dirpath))
+
+    def _apply_model_configs(self, found: dict):
         self._model_confs = getattr(self, "_model_confs", {})
-        found = {}
-        for path in glob.glob(os.path.join(dirpath, "*.json")):
-            try:
-                with open(path, "r", encoding="utf-8") as f:
-                    cfg = json.load(f)
-            except Exception:
-                continue
-            mid = cfg.get("model_id")
-            if not mid:
-                continue
-            found[mid] = cfg
         if not found:
             return
         self._model_confs.update(found)
@@ -600,8 +1569,69 @@ class RightRailText(ctk.CTkFrame):
         except Exception:
             pass
 
+    def show_estimate(self, prompt: str):
+        """Pre-send estimate for the current model and prompt text."""
+        app = self.master
+        mid = self.model_var.get()
+        if not app.costs.has_price(mid):
+            self.cost_label.configure(text="⚡ —")
+            return
+        system = ""
+        var = self.current_vars.get("system_prompt")
+        if var is not None:
+            system = str(var.get())
+        tokens = context.count_tokens(prompt) + context.count_tokens(system)
+        est = app.costs.estimate(mid, tokens, app.spend.avg_output_tokens(mid))
+        self.cost_label.configure(
+            text=f"⚡ ≈ {costs.format_cost(est)} · сегодня "
+            f"{costs.format_cost(app.spend.total())}"
+        )
+
+    def show_actual(self, cost: float | None, today: float):
+        self.cost_label.configure(
+            text=f"⚡ {costs.format_cost(cost)} · сегодня {costs.format_cost(today)}"
+        )
+
+    def _cached_widget_count(self) -> int:
+        return sum(p.widget_count for p in self._panels.values())
+
+    def _evict_panels(self):
+        """Drop least recently used panels until the cache fits the widget budget.
+        The active panel is never evicted."""
+        while self._cached_widget_count() > SETTINGS_CACHE_MAX_WIDGETS:
+            victim = next(
+                (m for m, p in self._panels.items() if p is not self._active_panel),
+                None,
+            )
+            if victim is None:
+                break
+            self._panels.pop(victim).frame.destroy()
+
+    def drop_panel_cache(self):
+        """Forget all cached panels (e.g. after configs were reloaded)."""
+        for panel in self._panels.values():
+            panel.frame.destroy()
+        self._panels.clear()
+        self._active_panel = None
+
+    def switch_stats(self) -> dict:
+        """Summary of recent model switch latencies, split by cache hit/miss."""
+        out = {}
+        for label, flag in (("cached", True), ("built", False)):
+            xs = sorted(ms for _, ms, c in self.switch_timings if c is flag)
+            if xs:
+                out[label] = {
+                    "count": len(xs),
+                    "avg_ms": sum(xs) / len(xs),
+                    "max_ms": xs[-1],
+                }
+        out["widgets_cached"] = self._cached_widget_count()
+        out["panels_cached"] = len(self._panels)
+        return out
+
     def build_from_config(self, cfg: dict):
         """(Optional helper) Build UI from a given config dict."""
+        self.drop_panel_cache()
         for w in list(self.settings_container.winfo_children()):
             w.destroy()
         self.current_vars = {}
@@ -627,38 +1657,14 @@ class RightRailText(ctk.CTkFrame):
     def get_effective_input(self) -> dict:
         """Собрать словарь input из текущей модели: скрытые поля берём из JSON,
         видимые — из значений виджетов. Приводим типы под API (int/float/bool/json)."""
-        result = {}
-        cfg = self._current_cfg or {}
-        controls = cfg.get("controls", [])
-
-        # 1) положим дефолты (включая скрытые) с приведением типов
-        for c in controls:
-            k = c.get("key")
-            if not k:
-                continue
-            ctype = (c.get("type") or "text").lower()
-            default_val = c.get("default")
-            result[k] = _coerce_value_by_type(ctype, k, default_val)
-
-        # 2) перезапишем видимыми значениями
-        for k, var in (self.current_vars or {}).items():
-            cdesc = next((c for c in controls if c.get("key") == k), None)
-            ctype = (cdesc or {}).get("type", "text").lower()
-            try:
-                if isinstance(var, tk.BooleanVar) or ctype == "checkbox":
-                    val = bool(var.get())
-                elif ctype == "slider":
-                    val = float(var.get())
-                elif ctype == "int":
-                    sval = var.get()
-                    val = int(float(sval))
-                else:
-                    val = var.get()
-            except Exception:
-                val = var.get()
-            result[k] = _coerce_value_by_type(ctype, k, val)
+        return effective_input(self._current_cfg, self.current_vars)
 
-        return result
+    def effective_input_for(self, mid: str) -> dict:
+        """Effective input for any loaded model: values from its cached panel
+        if the user has tuned it, config defaults otherwise."""
+        panel = self._panels.get(mid)
+        cfg = getattr(self, "_model_confs", {}).get(mid)
+        return effective_input(cfg, panel.vars if panel is not None else None)
 
     def collect_params(self) -> dict:
         """Собрать значения текущей панели в обычный dict."""
@@ -678,6 +1684,48 @@ class RightRailText(ctk.CTkFrame):
         return out
 
 
+def _parse_args(argv=None):
+    ap = argparse.ArgumentParser(description=APP_TITLE)
+    ap.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="print import/construction timings once the models are loaded",
+    )
+    ap.add_argument(
+        "--profile-requests",
+        action="store_true",
+        help="write a cProfile + tracemalloc dump for every request",
+    )
+    ap.add_argument(
+        "--monitor-ui",
+        action="store_true",
+        default=ui_monitor.UI_MONITOR_ENABLED,
+        help=f"record Tk event-loop stalls to {ui_monitor.UI_REPORT_PATH}",
+    )
+    ap.add_argument(
+        "--ui-overlay",
+        action="store_true",
+        help="show the frame-budget overlay (implies --monitor-ui)",
+    )
+    return ap.parse_args(argv)
+
+
 if __name__ == "__main__":
+    args = _parse_args()
     app = TextApp()
+    STARTUP.mark("TextApp constructed")
+    if args.profile_requests:
+        profiling.enable_requests()
+    if args.profile_startup:
+        app.bind(
+            "<<ModelsLoaded>>", lambda e: app.after_idle(STARTUP.print_report), add="+"
+        )
+    if args.monitor_ui or args.ui_overlay:
+        monitor = ui_monitor.StallMonitor(app, overlay=args.ui_overlay).start()
+
+        def _on_close():
+            monitor.stop()
+            app.on_close()
+
+        app.protocol("WM_DELETE_WINDOW", _on_close)
     app.mainloop()
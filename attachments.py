@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Вложения для кнопки 📎: загрузка в S3 начинается сразу после выбора файла,
+параллельно для нескольких файлов. При отправке ждём только те загрузки,
+которые ещё не закончились, и подставляем presigned-ссылки в input
+(по умолчанию в `image_input`).
+
+Ключ объекта — attachments/<sha256[:16]>/<имя файла>: повторное
+вложение того же файла в рамках сессии не загружается заново.
+Если в конфиге модели задан "preprocess", изображение перед загрузкой
+уменьшается и перекодируется (см. imageprep.py).
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+import imageprep
+
+ATTACH_WORKERS = int(os.getenv("AIHUB_ATTACH_WORKERS", "4"))
+# presigned-ссылку повторно используем, пока она заведомо не истекла
+URL_REUSE_S = int(os.getenv("S3_URL_TTL", "3600")) * 0.8
+DEFAULT_ATTACH_KEY = "image_input"
+
+PENDING = "pending"
+UPLOADED = "uploaded"
+FAILED = "failed"
+
+
+def file_sha256(path: str, chunk: int = 1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def s3_upload(path: str, object_name: str) -> str:
+    """Upload a local file via S3Client and return a presigned URL."""
+    from s3 import S3Client  # aioboto3/boto3 грузим только при первом вложении
+
+    return asyncio.run(S3Client().upload_file(path, None, None, object_name))
+
+
+@dataclass
+class Attachment:
+    path: str
+    state: str = PENDING
+    url: str | None = None
+    error: str | None = None
+    started_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+    future: object = None
+    preprocess: dict | None = None
+    upload_path: str | None = None  # что реально ушло в S3 (после imageprep)
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.path)
+
+
+class AttachmentManager:
+    """Background uploader for the prompt bar.
+
+    on_change(att) is called from worker threads on every state change."""
+
+    def __init__(self, upload=s3_upload, max_workers: int = ATTACH_WORKERS):
+        self._upload = upload
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="attach"
+        )
+        self._lock = threading.Lock()
+        self._items: list[Attachment] = []
+        # sha256[:параметры imageprep] -> (url, uploaded_at):
+        # не грузим один и тот же файл дважды
+        self._by_hash: dict[str, tuple[str, float]] = {}
+        self.on_change = None
+
+    def add(self, paths, preprocess: dict | None = None) -> list[Attachment]:
+        added = []
+        for p in paths:
+            att = Attachment(path=p, preprocess=preprocess)
+            with self._lock:
+                self._items.append(att)
+            att.future = self._pool.submit(self._run, att)
+            added.append(att)
+            self._emit(att)
+        return added
+
+    def remove(self, att: Attachment):
+        with self._lock:
+            if att in self._items:
+                self._items.remove(att)
+        if att.future is not None:
+            att.future.cancel()
+
+    def items(self) -> list[Attachment]:
+        with self._lock:
+            return list(self._items)
+
+    def take(self) -> list[Attachment]:
+        """Detach the current attachments (they go with the next send)."""
+        with self._lock:
+            items, self._items = self._items, []
+        return items
+
+    def _run(self, att: Attachment):
+        try:
+            digest = file_sha256(att.path)
+            cache_key = digest
+            if att.preprocess:
+                cache_key += ":" + imageprep.signature(att.preprocess)
+            cached = self._by_hash.get(cache_key)
+            if cached and time.time() - cached[1] < URL_REUSE_S:
+                url = cached[0]
+            else:
+                att.upload_path = imageprep.prepare(att.path, att.preprocess, digest)
+                name = imageprep.upload_name(att.name, att.upload_path)
+                key = f"attachments/{digest[:16]}/{name}"
+                url = self._upload(att.upload_path, key)
+                if not url:
+                    raise RuntimeError("S3 не вернул ссылку")
+                self._by_hash[cache_key] = (url, time.time())
+            att.url = url
+            att.state = UPLOADED
+        except Exception as e:
+            att.error = str(e)
+            att.state = FAILED
+        att.finished_at = time.time()
+        self._emit(att)
+
+    def _emit(self, att: Attachment):
+        cb = self.on_change
+        if cb is not None:
+            try:
+                cb(att)
+            except Exception:
+                pass
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def resolve(
+    attachments: list[Attachment], timeout: float | None = None
+) -> list[str]:
+    """Wait only for uploads that are still running; return URLs in order.
+    Raises RuntimeError if any upload failed or timed out."""
+    unfinished = [a.future for a in attachments if a.state == PENDING and a.future]
+    if unfinished:
+        _, not_done = wait(unfinished, timeout=timeout)
+        if not_done:
+            raise RuntimeError("вложения не успели загрузиться")
+    failed = [a for a in attachments if a.state != UPLOADED]
+    if failed:
+        names = ", ".join(f"{a.name} ({a.error})" for a in failed)
+        raise RuntimeError(f"не удалось загрузить: {names}")
+    return [a.url for a in attachments]
+
+
+def attach_key(cfg: dict | None, payload: dict) -> str | None:
+    """Input field that receives attachment URLs for this model.
+    Config may set "attachments": {"key": "..."}; otherwise image_input
+    if the model has it."""
+    key = ((cfg or {}).get("attachments") or {}).get("key")
+    if key:
+        return key
+    return DEFAULT_ATTACH_KEY if DEFAULT_ATTACH_KEY in payload else None
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Сборка поля `messages` для многоходового чата в пределах бюджета токенов.
+
+- count_tokens(): tiktoken, если установлен, иначе оценка ~4 символа/токен;
+  число токенов считается один раз при записи сообщения в историю
+  (history.token_count) и дальше берётся из кеша;
+- build_messages(): идёт от новых реплик к старым, пока влезает в бюджет;
+  старые реплики отбрасываются («truncate») или сворачиваются в короткую
+  выжимку («summarize»), размер которой тоже ограничен.
+
+Бюджет задаётся в конфиге модели:
+    "context": {"max_tokens": 6000, "strategy": "summarize"}
+"""
+import math
+import os
+import re
+from dataclasses import dataclass
+
+CONTEXT_DEFAULT_TOKENS = int(os.getenv("AIHUB_CONTEXT_TOKENS", "4000"))
+MESSAGE_OVERHEAD_TOKENS = 4  # роль и разметка одного сообщения
+SUMMARY_MAX_TOKENS = 300
+CHAT_ROLES = ("user", "assistant")
+
+try:
+    import tiktoken
+
+    _enc = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _enc = None
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _enc is not None:
+        try:
+            return len(_enc.encode(text, disallowed_special=()))
+        except Exception:
+            pass
+    return math.ceil(len(text) / 4)
+
+
+@dataclass
+class ContextStats:
+    included: int = 0
+    dropped: int = 0
+    summarized: int = 0
+    tokens: int = 0
+    budget: int = 0
+
+
+def context_budget(cfg: dict | None) -> tuple[int, str]:
+    ctx = (cfg or {}).get("context") or {}
+    try:
+        budget = int(ctx.get("max_tokens", CONTEXT_DEFAULT_TOKENS))
+    except (TypeError, ValueError):
+        budget = CONTEXT_DEFAULT_TOKENS
+    strategy = ctx.get("strategy", "truncate")
+    return budget, strategy
+
+
+def _tokens_of(m: dict) -> int:
+    n = m.get("token_count")
+    if n is None:
+        n = count_tokens(m.get("content") or "")
+        m["token_count"] = n
+    return n + MESSAGE_OVERHEAD_TOKENS
+
+
+def _truncate_to(text: str, tokens: int) -> str:
+    if tokens <= 0:
+        return ""
+    if count_tokens(text) <= tokens:
+        return text
+    # грубо режем по символам, затем подрезаем до бюджета
+    cut = text[: tokens * 4]
+    while cut and count_tokens(cut) > tokens:
+        cut = cut[: int(len(cut) * 0.9)]
+    return cut.rstrip() + " …"
+
+
+_SENTENCE = re.compile(r"(.+?[.!?…])(\s|$)", re.S)
+
+
+def summarize_turns(turns: list[dict], max_tokens: int = SUMMARY_MAX_TOKENS) -> str:
+    """Local extractive summary: first sentence of each dropped turn,
+    newest turns kept when the summary itself is over budget."""
+    lines = []
+    for m in turns:
+        text = " ".join((m.get("content") or "").split())
+        if not text:
+            continue
+        match = _SENTENCE.match(text)
+        first = match.group(1) if match else text
+        if len(first) > 200:
+            first = first[:200] + "…"
+        who = "User" if m.get("role") == "user" else "Assistant"
+        lines.append(f"{who}: {first}")
+    while lines and count_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    if not lines:
+        return ""
+    return "Summary of the earlier conversation:\n" + "\n".join(lines)
+
+
+def build_messages(
+    history_newest_first,
+    prompt: str,
+    budget: int,
+    system_prompt: str | None = None,
+    strategy: str = "truncate",
+) -> tuple[list[dict], ContextStats]:
+    """Assemble chat `messages` within `budget` tokens.
+
+    history_newest_first — iterable of {"role", "content", "token_count"}
+    dicts from the newest turn backwards (may be lazy: stops reading once
+    the budget is exhausted). The current prompt and system prompt are
+    always included; older turns are dropped or summarized. The dropped
+    count is a lower bound: reading stops at the first turn over budget."""
+    stats = ContextStats(budget=budget)
+    head: list[dict] = []
+    used = 0
+    if system_prompt:
+        head.append({"role": "system", "content": system_prompt})
+        used += count_tokens(system_prompt) + MESSAGE_OVERHEAD_TOKENS
+
+    prompt_tokens = count_tokens(prompt) + MESSAGE_OVERHEAD_TOKENS
+    room = budget - used - prompt_tokens
+    if room < 0:
+        # даже промпт не влезает — режем его, историю не берём
+        prompt = _truncate_to(
+            prompt, max(1, budget - used - MESSAGE_OVERHEAD_TOKENS)
+        )
+        prompt_tokens = count_tokens(prompt) + MESSAGE_OVERHEAD_TOKENS
+        room = 0
+    summary_room = 0
+    if strategy == "summarize":
+        summary_room = min(SUMMARY_MAX_TOKENS, room // 4)
+
+    kept: list[dict] = []
+    dropped: list[dict] = []
+    total = used + prompt_tokens
+    for m in history_newest_first:
+        if m.get("role") not in CHAT_ROLES:
+            continue
+        if dropped:
+            # окно истории непрерывное: после первой невлезшей реплики только
+            # собираем материал для выжимки (последние 50 хватит)
+            if strategy != "summarize" or len(dropped) >= 50:
+                break
+            dropped.append(m)
+            continue
+        t = _tokens_of(m)
+        if t <= room - summary_room:
+            kept.append({"role": m["role"], "content": m["content"]})
+            room -= t
+            total += t
+        else:
+            dropped.append(m)
+            if strategy != "summarize":
+                break
+
+    messages = list(head)
+    if dropped and summary_room > 0:
+        summary = summarize_turns(list(reversed(dropped)), summary_room)
+        if summary:
+            messages.append({"role": "system", "content": summary})
+            stats.summarized = len(dropped)
+            total += count_tokens(summary) + MESSAGE_OVERHEAD_TOKENS
+
+    messages.extend(reversed(kept))
+    messages.append({"role": "user", "content": prompt})
+    stats.included = len(kept)
+    stats.dropped = len(dropped)
+    stats.tokens = total
+    return messages, stats
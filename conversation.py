@@ -0,0 +1,538 @@
+# -*- coding: utf-8 -*-
+"""
+Лента диалога для центральной панели (вместо модальных mb.showinfo).
+
+Как устроено:
+- каждое сообщение режется на блоки по BLOCK_CHARS символов; блок = строка
+  виртуального списка с оценённой высотой;
+- на Canvas рисуются только строки, попавшие в видимую область (+запас),
+  остальные элементы Canvas удаляются при прокрутке;
+- текст закрытых блоков лежит во временном spool-файле, в памяти — только
+  LRU-кеш недавно показанных блоков (CACHE_CHARS);
+- длинный текст добавляется порциями по INGEST_CHARS_PER_TICK за тик
+  цикла событий, так что мегабайтный ответ не блокирует UI.
+"""
+import math
+import tempfile
+import tkinter as tk
+import tkinter.font as tkfont
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
+from itertools import count
+
+import customtkinter as ctk
+
+from ui_monitor import track
+
+BLOCK_CHARS = 4000
+INGEST_CHARS_PER_TICK = 64 * 1024
+CACHE_CHARS = 2 * 1024 * 1024
+RENDER_MARGIN_PX = 600
+
+BG = "#0f0f13"
+PAD_X, PAD_Y, GAP = 18, 10, 12
+HEADER_H = 22
+ROLE_STYLE = {
+    # role: (заголовок, цвет текста, фон «пузыря»)
+    "user": ("Вы", "#e8e8f0", "#1c1c26"),
+    "assistant": ("Модель", "#d8d8e0", "#15151c"),
+    "meta": ("Запрос", "#8a8a99", "#121218"),
+    "error": ("Ошибка", "#ff9a9a", "#221316"),
+}
+
+
+class _Row:
+    """One block of one message, i.e. one row of the virtual list."""
+
+    __slots__ = (
+        "id",
+        "msg",
+        "first",
+        "text",
+        "line_lens",
+        "spool_off",
+        "spool_len",
+        "y",
+        "h",
+        "measured_w",
+    )
+
+    def __init__(self, rid: int, msg: "_Message", first: bool):
+        self.id = rid
+        self.msg = msg
+        self.first = first
+        self.text = ""  # только у открытого (последнего, дополняемого) блока
+        self.line_lens = array("I")
+        self.spool_off = -1
+        self.spool_len = 0
+        self.y = 0  # верхняя координата на Canvas
+        self.h = 0
+        self.measured_w = 0  # ширина, при которой h измерена по факту
+
+    @property
+    def closed(self) -> bool:
+        return self.spool_off >= 0
+
+
+class _Message:
+    __slots__ = ("id", "role", "rows", "pending", "meta", "more")
+
+    def __init__(self, mid: int, role: str):
+        self.id = mid
+        self.role = role
+        self.rows: list[_Row] = []
+        self.pending = 0  # символов в очереди на добавление
+        self.meta = ""  # подпись справа от заголовка (модель, время…)
+        self.more = None  # колбэк «Загрузить ещё» для обрезанного вывода
+
+
+class ConversationView(tk.Frame):
+    def __init__(self, master, empty_text: str = "Чем я могу помочь?"):
+        super().__init__(master, bg=BG, highlightthickness=0)
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+        self.empty_text = empty_text
+
+        self.canvas = tk.Canvas(self, bg=BG, highlightthickness=0)
+        self.canvas.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar = ctk.CTkScrollbar(self, command=self._on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.canvas.configure(yscrollcommand=self._on_yscroll)
+
+        self.font = ("Arial", 12)
+        self.header_font = ("Arial", 10, "bold")
+        self._char_w = 7.0
+        self._line_h = 17
+
+        self._ids = count(1)
+        self._messages: dict[int, _Message] = {}
+        self._rows: list[_Row] = []  # упорядочены по y
+        self._total_h = 0
+        self._rendered: dict[int, tuple[_Row, list[int]]] = {}
+        self._cache: OrderedDict[int, str] = OrderedDict()
+        self._cache_chars = 0
+        self._spool = tempfile.TemporaryFile()
+        self._spool_end = 0
+
+        self._ingest_q: deque = deque()  # (msg, text)
+        self._ingest_scheduled = False
+        self._render_scheduled = False
+        self._follow = True  # автопрокрутка, пока пользователь внизу
+        self._width = 0
+
+        self.canvas.bind("<Configure>", self._on_configure)
+        self.canvas.bind("<MouseWheel>", self._on_wheel)
+        self.canvas.bind("<Button-4>", lambda e: self._scroll_units(-3))
+        self.canvas.bind("<Button-5>", lambda e: self._scroll_units(3))
+        self.canvas.bind("<Button-3>", self._on_context_menu)
+        self.canvas.bind("<Button-2>", self._on_context_menu)  # macOS
+
+    # ---------- public API ----------
+    def append_message(self, role: str, text: str = "", meta: str = "") -> int:
+        """Add a message; long text is ingested incrementally. Returns its id."""
+        msg = _Message(next(self._ids), role)
+        msg.meta = meta
+        self._messages[msg.id] = msg
+        self._new_row(msg)
+        if text:
+            self.extend_message(msg.id, text)
+        else:
+            self._schedule_render()
+        return msg.id
+
+    def extend_message(self, msg_id: int, text: str):
+        """Append text to an existing message (e.g. streamed output)."""
+        msg = self._messages.get(msg_id)
+        if msg is None or not text:
+            return
+        msg.pending += len(text)
+        self._ingest_q.append((msg, text))
+        self._schedule_ingest()
+
+    def set_meta(self, msg_id: int, meta: str):
+        msg = self._messages.get(msg_id)
+        if msg is None:
+            return
+        msg.meta = meta
+        self._rerender_row(msg.rows[0])
+
+    def set_more(self, msg_id: int, callback):
+        """Offer "load more" for a truncated message (None removes it)."""
+        msg = self._messages.get(msg_id)
+        if msg is not None:
+            msg.more = callback
+
+    def message_text(self, msg_id: int) -> str:
+        msg = self._messages.get(msg_id)
+        if msg is None:
+            return ""
+        return "".join(self._row_text(r) for r in msg.rows)
+
+    def clear(self):
+        self._ingest_q.clear()
+        self.canvas.delete("all")
+        self._messages.clear()
+        self._rows.clear()
+        self._total_h = 0
+        self._rendered.clear()
+        self._cache.clear()
+        self._cache_chars = 0
+        self._spool.seek(0)
+        self._spool.truncate()
+        self._spool_end = 0
+        self._follow = True
+        self._schedule_render()
+
+    def __len__(self):
+        return len(self._messages)
+
+    # ---------- rows & layout ----------
+    def _new_row(self, msg: _Message) -> _Row:
+        row = _Row(next(self._ids), msg, first=not msg.rows)
+        msg.rows.append(row)
+        # строки сообщения всегда непрерывны: вставляем после последней строки
+        # этого сообщения (обычно это конец списка)
+        if len(msg.rows) > 1:
+            at = self._index_of(msg.rows[-2]) + 1
+        else:
+            at = len(self._rows)
+        row.h = self._estimate_h(row)
+        self._rows.insert(at, row)
+        self._relayout_from(at)
+        return row
+
+    def _index_of(self, row: _Row) -> int:
+        # y строго возрастает по списку, поэтому достаточно бинарного поиска
+        return bisect_left(self._rows, row.y, key=lambda r: r.y)
+
+    def _relayout_from(self, start: int):
+        prev = self._rows[start - 1] if start > 0 else None
+        y = prev.y + prev.h if prev is not None else GAP
+        for i in range(start, len(self._rows)):
+            row = self._rows[i]
+            old = row.y
+            row.y = y
+            entry = self._rendered.get(row.id)
+            if entry is not None and old != y:
+                for item in entry[1]:
+                    self.canvas.move(item, 0, y - old)
+            y += row.h
+        self._total_h = y + GAP
+        self._update_scrollregion()
+
+    def _estimate_h(self, row: _Row) -> int:
+        wrap_w = max(100, self._width - 2 * PAD_X - 24)
+        per_line = max(1, int(wrap_w / self._char_w))
+        lines = 0
+        for n in row.line_lens:
+            lines += max(1, math.ceil(n / per_line))
+        lines = max(1, lines)
+        h = lines * self._line_h + 2 * PAD_Y
+        if row.first:
+            h += HEADER_H + GAP
+        return h
+
+    def _update_scrollregion(self):
+        w = max(1, self._width)
+        h = max(self._total_h, self.canvas.winfo_height())
+        self.canvas.configure(scrollregion=(0, 0, w, h))
+
+    # ---------- ingest ----------
+    def _schedule_ingest(self):
+        if not self._ingest_scheduled:
+            self._ingest_scheduled = True
+            self.after(1, self._ingest_tick)
+
+    @track("conversation ingest")
+    def _ingest_tick(self):
+        self._ingest_scheduled = False
+        budget = INGEST_CHARS_PER_TICK
+        while self._ingest_q and budget > 0:
+            msg, text = self._ingest_q[0]
+            part, rest = text[:budget], text[budget:]
+            if rest:
+                self._ingest_q[0] = (msg, rest)
+            else:
+                self._ingest_q.popleft()
+            budget -= len(part)
+            msg.pending -= len(part)
+            self._feed(msg, part)
+        self._schedule_render()
+        if self._ingest_q:
+            self._schedule_ingest()
+
+    def _feed(self, msg: _Message, text: str):
+        row = msg.rows[-1]
+        if row.closed:
+            row = self._new_row(msg)
+        while text:
+            room = BLOCK_CHARS - len(row.text)
+            if room <= 0:
+                self._close_row(row)
+                row = self._new_row(msg)
+                continue
+            piece = text[:room]
+            # режем блок по переводу строки, если он есть недалеко от края
+            if len(text) > room:
+                nl = piece.rfind("\n", max(0, room - 400))
+                if nl >= 0:
+                    piece = piece[: nl + 1]
+            text = text[len(piece) :]
+            row.text += piece
+            if len(row.text) >= BLOCK_CHARS or (text and piece.endswith("\n")):
+                self._refresh_row_layout(row)
+                self._close_row(row)
+                if text:
+                    row = self._new_row(msg)
+        if not row.closed:
+            self._refresh_row_layout(row)
+
+    def _refresh_row_layout(self, row: _Row):
+        row.line_lens = array("I", (len(l) for l in row.text.split("\n")))
+        new_h = self._estimate_h(row)
+        row.measured_w = 0
+        i = self._index_of(row)
+        if row.id in self._rendered:
+            self._unrender(row)
+        if new_h != row.h:
+            row.h = new_h
+            self._relayout_from(i)
+
+    def _close_row(self, row: _Row):
+        data = row.text.encode("utf-8")
+        self._spool.seek(self._spool_end)
+        self._spool.write(data)
+        row.spool_off = self._spool_end
+        row.spool_len = len(data)
+        self._spool_end += len(data)
+        self._cache_put(row.id, row.text)
+        row.text = ""
+
+    def _row_text(self, row: _Row) -> str:
+        if not row.closed:
+            return row.text
+        txt = self._cache.get(row.id)
+        if txt is not None:
+            self._cache.move_to_end(row.id)
+            return txt
+        self._spool.seek(row.spool_off)
+        txt = self._spool.read(row.spool_len).decode("utf-8", errors="replace")
+        self._cache_put(row.id, txt)
+        return txt
+
+    def _cache_put(self, rid: int, txt: str):
+        old = self._cache.pop(rid, None)
+        if old is not None:
+            self._cache_chars -= len(old)
+        self._cache[rid] = txt
+        self._cache_chars += len(txt)
+        while self._cache_chars > CACHE_CHARS and len(self._cache) > 1:
+            _, dropped = self._cache.popitem(last=False)
+            self._cache_chars -= len(dropped)
+
+    # ---------- rendering ----------
+    def _schedule_render(self):
+        if not self._render_scheduled:
+            self._render_scheduled = True
+            self.after_idle(self._render)
+
+    @track("conversation render")
+    def _render(self):
+        self._render_scheduled = False
+        if not self._rows or not self._messages:
+            self._draw_empty()
+            return
+        self.canvas.delete("empty")
+
+        if self._follow:
+            self.canvas.yview_moveto(1.0)
+        top = self.canvas.canvasy(0) - RENDER_MARGIN_PX
+        bottom = self.canvas.canvasy(self.canvas.winfo_height()) + RENDER_MARGIN_PX
+
+        first = max(0, bisect_right(self._rows, top, key=lambda r: r.y) - 1)
+        visible = set()
+        i = first
+        while i < len(self._rows) and self._rows[i].y <= bottom:
+            row = self._rows[i]
+            visible.add(row.id)
+            if row.id not in self._rendered:
+                self._render_row(i)
+            i += 1
+
+        # выгружаем всё, что ушло за пределы видимой области
+        for rid in [rid for rid in self._rendered if rid not in visible]:
+            self._unrender(self._rendered[rid][0])
+
+    def _render_row(self, i: int):
+        row = self._rows[i]
+        y = row.y
+        title, fg, bubble = ROLE_STYLE.get(row.msg.role, ROLE_STYLE["assistant"])
+        x0, x1 = PAD_X, max(PAD_X + 100, self._width - PAD_X)
+        items = []
+        rect = self.canvas.create_rectangle(
+            x0, y, x1, y + row.h, fill=bubble, outline=bubble
+        )
+        items.append(rect)
+        ty = y + PAD_Y
+        if row.first:
+            items.append(
+                self.canvas.create_text(
+                    x0 + 12,
+                    y + PAD_Y,
+                    text=title,
+                    anchor="nw",
+                    fill="#9a9aff",
+                    font=self.header_font,
+                )
+            )
+            if row.msg.meta:
+                items.append(
+                    self.canvas.create_text(
+                        x1 - 12,
+                        y + PAD_Y,
+                        text=row.msg.meta,
+                        anchor="ne",
+                        fill="#6a6a7a",
+                        font=self.header_font,
+                    )
+                )
+            ty += HEADER_H
+        body = self.canvas.create_text(
+            x0 + 12,
+            ty,
+            text=self._row_text(row).rstrip("\n") or " ",
+            anchor="nw",
+            fill=fg,
+            font=self.font,
+            width=max(100, x1 - x0 - 24),
+        )
+        items.append(body)
+        self._rendered[row.id] = (row, items)
+
+        # уточняем высоту по факту отрисовки
+        if row.measured_w != self._width:
+            bbox = self.canvas.bbox(body)
+            if bbox:
+                real = (bbox[3] - y) + PAD_Y
+                row.measured_w = self._width
+                if real != row.h:
+                    self._resize_row(i, real)
+
+    def _resize_row(self, i: int, h: int):
+        row = self._rows[i]
+        delta = h - row.h
+        row.h = h
+        items = self._rendered[row.id][1]
+        x0, y0, x1, _ = self.canvas.coords(items[0])
+        self.canvas.coords(items[0], x0, y0, x1, y0 + h)
+        view_top = self.canvas.canvasy(0)
+        self._relayout_from(i + 1)
+        # строка выше видимой области выросла — компенсируем, чтобы не прыгало
+        if row.y + h <= view_top and not self._follow and self._total_h:
+            self.canvas.yview_moveto((view_top + delta) / self._total_h)
+
+    def _unrender(self, row: _Row):
+        entry = self._rendered.pop(row.id, None)
+        if entry is None:
+            return
+        for item in entry[1]:
+            self.canvas.delete(item)
+
+    def _rerender_row(self, row: _Row):
+        if row.id in self._rendered:
+            self._unrender(row)
+            self._schedule_render()
+
+    @track("hero <Configure> redraw")
+    def _draw_empty(self):
+        # пустой экран: «кольцо» и фраза, как раньше на hero-канвасе
+        cnv = self.canvas
+        cnv.delete("all")
+        w = cnv.winfo_width() or 800
+        h = cnv.winfo_height() or 480
+        cx, cy = w // 2, h // 2 - 10
+        r1, r2 = 36, 20
+        for r in (r1, r2):
+            cnv.create_oval(
+                cx - r,
+                cy - r,
+                cx + r,
+                cy + r,
+                outline="#a8a8b3",
+                width=2,
+                tags="empty",
+            )
+        cnv.create_text(
+            cx,
+            cy + 54,
+            text=self.empty_text,
+            fill="#d8d8e0",
+            font=("Arial", 14),
+            tags="empty",
+        )
+        cnv.configure(scrollregion=(0, 0, w, h))
+
+    # ---------- events ----------
+    def _on_configure(self, e):
+        first_time = self._width == 0
+        if e.width == self._width and not first_time:
+            self._schedule_render()
+            return
+        self._width = e.width
+        if first_time:
+            f = tkfont.Font(font=self.font)
+            self._char_w = max(1.0, f.measure("abcdefghijklmnopqrstuvwxyz") / 26)
+            self._line_h = f.metrics("linespace")
+        # ширина поменялась: переоцениваем высоты, перерисовываем видимое
+        for rid in list(self._rendered):
+            self._unrender(self._rendered[rid][0])
+        for row in self._rows:
+            row.h = self._estimate_h(row)
+            row.measured_w = 0
+        if self._rows:
+            self._relayout_from(0)
+        self._schedule_render()
+
+    def _on_yscroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self._schedule_render()
+
+    def _on_scrollbar(self, *args):
+        self.canvas.yview(*args)
+        self._user_scrolled()
+
+    def _on_wheel(self, e):
+        step = int(e.delta / 120) if abs(e.delta) >= 120 else e.delta
+        self._scroll_units(-step)
+
+    def _scroll_units(self, n: int):
+        self.canvas.yview_scroll(n, "units")
+        self._user_scrolled()
+
+    def _user_scrolled(self):
+        # автопрокрутка включена, только пока пользователь остаётся внизу
+        self._follow = self.canvas.yview()[1] >= 0.999
+
+    def _message_at(self, y: float) -> _Message | None:
+        i = bisect_right(self._rows, y, key=lambda r: r.y) - 1
+        if 0 <= i < len(self._rows):
+            return self._rows[i].msg
+        return None
+
+    def _on_context_menu(self, e):
+        msg = self._message_at(self.canvas.canvasy(e.y))
+        if msg is None:
+            return
+        menu = tk.Menu(self, tearoff=0)
+        if msg.more is not None:
+            menu.add_command(label="Загрузить ещё", command=msg.more)
+        menu.add_command(
+            label="Копировать сообщение",
+            command=lambda: self._copy(self.message_text(msg.id)),
+        )
+        menu.tk_popup(e.x_root, e.y_root)
+
+    def _copy(self, text: str):
+        self.clipboard_clear()
+        self.clipboard_append(text)
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+Учёт стоимости запросов.
+
+Цены лежат рядом с конфигами моделей, в models_conf/prices.json:
+    input_per_mtok / output_per_mtok — за миллион токенов,
+    per_second                       — за секунду predict_time (железо),
+    per_output                       — за каждый выходной файл (картинки).
+
+estimate() — оценка до отправки по числу токенов промпта, actual() — по
+prediction.metrics после завершения. SpendStore агрегирует расходы по
+пользователю, модели и дню в локальной SQLite.
+"""
+import getpass
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from paths import data_path
+
+PRICES_PATH = os.getenv(
+    "AIHUB_PRICES",
+    os.path.join(os.path.dirname(__file__), "models_conf", "prices.json"),
+)
+DEFAULT_OUTPUT_TOKENS = 400  # ожидаемый ответ, пока нет своей статистики
+
+
+def current_user() -> str:
+    user = os.getenv("AIHUB_USER")
+    if user:
+        return user
+    try:
+        return getpass.getuser()
+    except Exception:
+        return "unknown"
+
+
+def load_prices(path: str = PRICES_PATH) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("models", {})
+    except Exception:
+        return {}
+
+
+class CostEngine:
+    def __init__(self, prices: dict | None = None):
+        self.prices = load_prices() if prices is None else prices
+
+    def has_price(self, model: str) -> bool:
+        return model in self.prices
+
+    def estimate(
+        self,
+        model: str,
+        input_tokens: int,
+        output_tokens: int | None = None,
+        outputs: int = 1,
+    ) -> float | None:
+        """Pre-send estimate; None when the model has no price entry."""
+        p = self.prices.get(model)
+        if p is None:
+            return None
+        if output_tokens is None:
+            output_tokens = DEFAULT_OUTPUT_TOKENS
+        cost = input_tokens * p.get("input_per_mtok", 0.0) / 1e6
+        cost += output_tokens * p.get("output_per_mtok", 0.0) / 1e6
+        cost += outputs * p.get("per_output", 0.0)
+        return cost
+
+    def actual(self, model: str, metrics: dict | None, output=None) -> float | None:
+        """Cost from prediction.metrics (token counts, predict_time)."""
+        p = self.prices.get(model)
+        if p is None:
+            return None
+        m = metrics or {}
+        tin = m.get("input_token_count") or 0
+        tout = m.get("output_token_count") or 0
+        cost = tin * p.get("input_per_mtok", 0.0) / 1e6
+        cost += tout * p.get("output_per_mtok", 0.0) / 1e6
+        cost += (m.get("predict_time") or 0.0) * p.get("per_second", 0.0)
+        if p.get("per_output"):
+            cost += _count_outputs(output) * p["per_output"]
+        return cost
+
+
+def _count_outputs(output) -> int:
+    if output is None:
+        return 0
+    if isinstance(output, list):
+        return len(output)
+    return 1
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS spend (
+    day TEXT NOT NULL,
+    user TEXT NOT NULL,
+    model TEXT NOT NULL,
+    predictions INTEGER NOT NULL DEFAULT 0,
+    cost REAL NOT NULL DEFAULT 0,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    predict_time REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, user, model)
+);
+CREATE TABLE IF NOT EXISTS spend_log (
+    prediction_id TEXT PRIMARY KEY,
+    day TEXT NOT NULL,
+    user TEXT NOT NULL,
+    model TEXT NOT NULL,
+    cost REAL NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+class SpendStore:
+    """Per user / model / day aggregates. record() is idempotent per
+    prediction id, so a retried upload never double-counts."""
+
+    def __init__(self, path: str | None = None):
+        self.path = (
+            path or os.getenv("AIHUB_SPEND_DB") or data_path("spend.sqlite3")
+        )
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def record(
+        self,
+        prediction_id: str,
+        model: str,
+        cost: float,
+        metrics: dict | None = None,
+        user: str | None = None,
+        at: float | None = None,
+    ) -> bool:
+        m = metrics or {}
+        user = user or current_user()
+        day = time.strftime("%Y-%m-%d", time.localtime(at or time.time()))
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO spend_log VALUES (?, ?, ?, ?, ?, ?)",
+                (prediction_id, day, user, model, cost, time.time()),
+            )
+            if cur.rowcount == 0:
+                return False
+            self._conn.execute(
+                """
+                INSERT INTO spend(day, user, model, predictions, cost,
+                                  input_tokens, output_tokens, predict_time)
+                VALUES (?, ?, ?, 1, ?, ?, ?, ?)
+                ON CONFLICT(day, user, model) DO UPDATE SET
+                    predictions = predictions + 1,
+                    cost = cost + excluded.cost,
+                    input_tokens = input_tokens + excluded.input_tokens,
+                    output_tokens = output_tokens + excluded.output_tokens,
+                    predict_time = predict_time + excluded.predict_time
+                """,
+                (
+                    day,
+                    user,
+                    model,
+                    cost,
+                    int(m.get("input_token_count") or 0),
+                    int(m.get("output_token_count") or 0),
+                    float(m.get("predict_time") or 0.0),
+                ),
+            )
+        return True
+
+    def total(self, day: str | None = None, user: str | None = None) -> float:
+        day = day or time.strftime("%Y-%m-%d")
+        user = user or current_user()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COALESCE(SUM(cost), 0) FROM spend"
+                " WHERE day = ? AND user = ?",
+                (day, user),
+            ).fetchone()
+        return float(row[0])
+
+    def by_model(self, day: str | None = None) -> list[dict]:
+        day = day or time.strftime("%Y-%m-%d")
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user, model, predictions, cost, input_tokens,"
+                " output_tokens, predict_time FROM spend WHERE day = ?"
+                " ORDER BY cost DESC",
+                (day,),
+            ).fetchall()
+        keys = (
+            "user",
+            "model",
+            "predictions",
+            "cost",
+            "input_tokens",
+            "output_tokens",
+            "predict_time",
+        )
+        return [dict(zip(keys, r)) for r in rows]
+
+    def avg_output_tokens(self, model: str) -> int | None:
+        """Typical answer length for this model, used by estimates."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT SUM(output_tokens), SUM(predictions) FROM spend"
+                " WHERE model = ?",
+                (model,),
+            ).fetchone()
+        if not row or not row[1] or not row[0]:
+            return None
+        return int(row[0] / row[1])
+
+
+def format_cost(cost: float | None) -> str:
+    if cost is None:
+        return "—"
+    if cost < 0.01:
+        return f"${cost:.4f}"
+    return f"${cost:.2f}"
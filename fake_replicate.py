@@ -0,0 +1,572 @@
+# -*- coding: utf-8 -*-
+"""
+Локальный поддельный Replicate API для нагрузочных прогонов без трат.
+
+Повторяет то, чем пользуется клиент: create (по модели и по версии), get,
+cancel, SSE-стрим вывода и вебхуки. Статус считается от времени создания
+(очередь → выполнение → итог), поэтому сотни «предсказаний» не держат
+ни одного потока. Медиа-выводы раздаются самим сервером (/files/...)
+с поддержкой Range — sniff/превью работают как с настоящей CDN.
+
+Задержки задаются распределениями:
+    0.5 | const:0.5 | uniform:0.2,1.5 | exp:0.4 | lognormal:1.2,0.5
+(lognormal — медиана и sigma). Вид вывода — по имени модели
+(fake/text, fake/image, fake/audio, fake/video), иначе --output.
+
+    python fake_replicate.py --port 8765 --run lognormal:1.5,0.5 --fail-rate 0.05
+    REPLICATE_BASE_URL=http://127.0.0.1:8765 python main.py
+
+Служебное: GET /__stats — счётчики вызовов, POST /__reset — сброс.
+"""
+import argparse
+import heapq
+import itertools
+import json
+import math
+import random
+import secrets
+import struct
+import sys
+import threading
+import time
+import urllib.request
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TEXT, IMAGE, AUDIO, VIDEO = "text", "image", "audio", "video"
+OUTPUT_KINDS = (TEXT, IMAGE, AUDIO, VIDEO)
+WEBHOOK_TIMEOUT = 5
+WEBHOOK_WORKERS = 8
+CANCEL_POLL_S = 0.05  # как часто стрим проверяет отмену
+
+WORDS = (
+    "perplexity measures how well a model predicts a sample of text and"
+    " lower values mean the model is less surprised by the data"
+).split()
+
+
+def parse_dist(spec: str):
+    """Sampler for a latency spec ('exp:0.4', 'uniform:a,b', ...)."""
+    spec = str(spec).strip()
+    name, _, args = spec.partition(":")
+    if not args:
+        name, args = "const", name
+    a = [float(x) for x in args.split(",")]
+    if name == "const":
+        return lambda rng: a[0]
+    if name == "uniform":
+        return lambda rng: rng.uniform(a[0], a[1])
+    if name == "exp":
+        return lambda rng: rng.expovariate(1 / a[0]) if a[0] > 0 else 0.0
+    if name == "lognormal":
+        mu, sigma = math.log(a[0]), a[1] if len(a) > 1 else 0.5
+        return lambda rng: rng.lognormvariate(mu, sigma)
+    raise ValueError(f"неизвестное распределение: {spec}")
+
+
+# ---------------- медиа ----------------
+def _png(w: int = 64, h: int = 64) -> bytes:
+    def chunk(tag, data):
+        crc = zlib.crc32(tag + data) & 0xFFFFFFFF
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", crc)
+
+    rows = b"".join(b"\x00" + bytes((x * 4 % 256, 96, 160)) * w for x in range(h))
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(rows))
+        + chunk(b"IEND", b"")
+    )
+
+
+def _wav(seconds: float = 3.0, rate: int = 8000) -> bytes:
+    data = b"\x00\x00" * int(seconds * rate)
+    fmt = struct.pack("<HHIIHH", 1, 1, rate, rate * 2, 2, 16)
+    body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt
+    body += b"data" + struct.pack("<I", len(data)) + data
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+def _mp4(seconds: float = 5.0, size: int = 256 * 1024) -> bytes:
+    # ftyp + moov/mvhd в начале (как после faststart) + mdat-заглушка
+    def box(tag, data):
+        return struct.pack(">I", 8 + len(data)) + tag + data
+
+    mvhd = struct.pack(">B3xIIII", 0, 0, 0, 1000, int(seconds * 1000))
+    mvhd += b"\x00" * 80
+    head = box(b"ftyp", b"isom\x00\x00\x02\x00isomiso2mp41")
+    head += box(b"moov", box(b"mvhd", mvhd))
+    return head + box(b"mdat", b"\x00" * max(0, size - len(head) - 8))
+
+
+MEDIA = {
+    IMAGE: ("png", "image/png", _png),
+    AUDIO: ("wav", "audio/wav", _wav),
+    VIDEO: ("mp4", "video/mp4", _mp4),
+}
+
+
+# ---------------- состояние ----------------
+@dataclass
+class FakeConfig:
+    queue: str = "exp:0.3"  # starting → processing
+    run: str = "lognormal:1.5,0.5"  # processing → итог
+    fail_rate: float = 0.0  # доля предсказаний со статусом failed
+    error_rate: float = 0.0  # доля create, отвечающих 500
+    throttle_rate: float = 0.0  # доля create, отвечающих 429
+    output: str = TEXT  # text / image / audio / video / mix
+    tokens: int = 64
+    media_count: int = 1
+    stream: bool = True
+    seed: int | None = None
+
+
+@dataclass
+class _Prediction:
+    id: str
+    model: str
+    version: str | None
+    input: dict
+    kind: str
+    created: float
+    queue_s: float
+    run_s: float
+    will_fail: bool
+    tokens: list[str]
+    webhook: str | None = None
+    webhook_events: tuple = ()
+    canceled_at: float | None = None
+
+    def status(self, now: float) -> str:
+        if self.canceled_at is not None:
+            return "canceled"
+        t = now - self.created
+        if t < self.queue_s:
+            return "starting"
+        if t < self.queue_s + self.run_s:
+            return "processing"
+        return "failed" if self.will_fail else "succeeded"
+
+    @property
+    def ends_at(self) -> float:
+        return self.created + self.queue_s + self.run_s
+
+
+@dataclass
+class FakeState:
+    config: FakeConfig
+    base_url: str = ""
+    predictions: dict = field(default_factory=dict)
+    calls: Counter = field(default_factory=Counter)
+    webhooks: Counter = field(default_factory=Counter)
+
+    def __post_init__(self):
+        self.rng = random.Random(self.config.seed)
+        self.queue_dist = parse_dist(self.config.queue)
+        self.run_dist = parse_dist(self.config.run)
+        self.lock = threading.Lock()
+        self.media = {}
+        self._timers: list = []
+        self._seq = itertools.count()
+        self._cv = threading.Condition(self.lock)
+        self._pool = ThreadPoolExecutor(
+            max_workers=WEBHOOK_WORKERS, thread_name_prefix="webhook"
+        )
+        threading.Thread(target=self._webhook_loop, daemon=True).start()
+
+    def media_bytes(self, kind: str) -> bytes:
+        if kind not in self.media:
+            self.media[kind] = MEDIA[kind][2]()
+        return self.media[kind]
+
+    # ---- предсказания ----
+    def create(self, model: str, version: str | None, body: dict) -> _Prediction:
+        cfg = self.config
+        name = (model or "").rsplit("/", 1)[-1]
+        with self.lock:
+            kind = name if name in OUTPUT_KINDS else cfg.output
+            if kind == "mix":
+                kind = self.rng.choice(OUTPUT_KINDS)
+            inp = body.get("input") or {}
+            n = int(inp.get("max_tokens") or cfg.tokens) if kind == TEXT else 0
+            p = _Prediction(
+                id=secrets.token_hex(10),
+                model=model,
+                version=version,
+                input=inp,
+                kind=kind,
+                created=time.time(),
+                queue_s=max(0.0, self.queue_dist(self.rng)),
+                run_s=max(0.0, self.run_dist(self.rng)),
+                will_fail=self.rng.random() < cfg.fail_rate,
+                tokens=[
+                    ("" if i == 0 else " ") + WORDS[i % len(WORDS)]
+                    for i in range(min(n, 4096))
+                ],
+                webhook=body.get("webhook"),
+                webhook_events=tuple(
+                    body.get("webhook_events_filter") or ("start", "completed")
+                ),
+            )
+            self.predictions[p.id] = p
+            if p.webhook:
+                if "start" in p.webhook_events:
+                    self._schedule(p.created + p.queue_s, p.id, "start")
+                if "completed" in p.webhook_events:
+                    self._schedule(p.ends_at, p.id, "completed")
+        return p
+
+    def cancel(self, p: _Prediction):
+        with self.lock:
+            if p.status(time.time()) in ("starting", "processing"):
+                p.canceled_at = time.time()
+                if p.webhook and "completed" in p.webhook_events:
+                    self._schedule(p.canceled_at, p.id, "canceled")
+
+    def output(self, p: _Prediction, status: str, now: float):
+        if p.kind == TEXT:
+            if status == "processing":
+                done = (now - p.created - p.queue_s) / max(p.run_s, 1e-9)
+                return p.tokens[: int(len(p.tokens) * done)]
+            return p.tokens if status == "succeeded" else None
+        if status != "succeeded":
+            return None
+        ext = MEDIA[p.kind][0]
+        urls = [
+            f"{self.base_url}/files/{p.id}/{i}.{ext}"
+            for i in range(self.config.media_count)
+        ]
+        return urls[0] if len(urls) == 1 else urls
+
+    def to_json(self, p: _Prediction) -> dict:
+        now = time.time()
+        status = p.status(now)
+        urls = {
+            "get": f"{self.base_url}/v1/predictions/{p.id}",
+            "cancel": f"{self.base_url}/v1/predictions/{p.id}/cancel",
+        }
+        if p.kind == TEXT and self.config.stream:
+            urls["stream"] = f"{self.base_url}/stream/{p.id}"
+        started = p.created + p.queue_s
+        d = {
+            "id": p.id,
+            "model": p.model,
+            "version": p.version or "fake",
+            "input": p.input,
+            "status": status,
+            "output": self.output(p, status, now),
+            "logs": "",
+            "error": "fake failure" if status == "failed" else None,
+            "metrics": {},
+            "created_at": _iso(p.created),
+            "started_at": _iso(started) if now >= started else None,
+            "completed_at": None,
+            "urls": urls,
+        }
+        if status in ("succeeded", "failed", "canceled"):
+            end = p.canceled_at or p.ends_at
+            d["completed_at"] = _iso(end)
+            d["metrics"] = {"predict_time": round(max(0.0, end - started), 3)}
+            if p.kind == TEXT and status == "succeeded":
+                d["metrics"]["input_token_count"] = len(str(p.input)) // 4
+                d["metrics"]["output_token_count"] = len(p.tokens)
+        return d
+
+    # ---- вебхуки ----
+    def _schedule(self, due: float, pid: str, event: str):
+        # вызывается под self.lock
+        heapq.heappush(self._timers, (due, next(self._seq), pid, event))
+        self._cv.notify()
+
+    def _webhook_loop(self):
+        while True:
+            with self._cv:
+                while not self._timers or self._timers[0][0] > time.time():
+                    wait = self._timers[0][0] - time.time() if self._timers else None
+                    self._cv.wait(wait)
+                _, _, pid, event = heapq.heappop(self._timers)
+                p = self.predictions.get(pid)
+            if p is None:
+                continue
+            if event != "canceled" and p.canceled_at is not None:
+                # у отменённого итог уходит в момент отмены
+                continue
+            self._pool.submit(self._send_webhook, p)
+
+    def _send_webhook(self, p: _Prediction):
+        body = json.dumps(self.to_json(p)).encode("utf-8")
+        req = urllib.request.Request(
+            p.webhook, data=body, headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=WEBHOOK_TIMEOUT) as resp:
+                resp.read()
+            self.webhooks["sent"] += 1
+        except Exception:
+            self.webhooks["failed"] += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            by_status = Counter(
+                p.status(time.time()) for p in self.predictions.values()
+            )
+            return {
+                "calls": dict(self.calls),
+                "predictions": len(self.predictions),
+                "by_status": dict(by_status),
+                "webhooks": dict(self.webhooks),
+            }
+
+    def reset(self):
+        with self.lock:
+            self.predictions.clear()
+            self.calls.clear()
+            self.webhooks.clear()
+            self._timers.clear()
+
+
+def _iso(ts: float) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(ts)) + (
+        f".{int(ts % 1 * 1e6):06d}Z"
+    )
+
+
+# ---------------- HTTP ----------------
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: FakeState = None  # задаётся в make_server
+
+    def log_message(self, format, *args):
+        pass
+
+    def _count(self, route: str):
+        with self.state.lock:
+            self.state.calls[f"{self.command} {route}"] += 1
+
+    def _json(self, code: int, obj, headers: dict | None = None):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> dict:
+        n = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(n) if n else b""
+        return json.loads(raw or b"{}")
+
+    def _find(self, pid: str):
+        p = self.state.predictions.get(pid)
+        if p is None:
+            self._json(404, {"detail": "Not found."})
+        return p
+
+    def _authorized(self) -> bool:
+        if self.headers.get("Authorization", "").startswith(("Bearer ", "Token ")):
+            return True
+        self._json(401, {"detail": "Invalid token."})
+        return False
+
+    def do_POST(self):
+        parts = self.path.split("?")[0].strip("/").split("/")
+        if parts == ["__reset"]:
+            self.state.reset()
+            return self._json(200, {"ok": True})
+        if not self._authorized():
+            return
+        if len(parts) == 5 and parts[:2] == ["v1", "models"]:
+            self._count("create")
+            return self._create(f"{parts[2]}/{parts[3]}", None)
+        if parts == ["v1", "predictions"]:
+            self._count("create")
+            body = self._body()
+            return self._create(None, body.get("version"), body)
+        if len(parts) == 4 and parts[:2] == ["v1", "predictions"]:
+            self._count("cancel")
+            p = self._find(parts[2])
+            if p is not None:
+                self.state.cancel(p)
+                self._json(200, self.state.to_json(p))
+            return
+        self._json(404, {"detail": "Not found."})
+
+    def _create(self, model, version, body=None):
+        body = body if body is not None else self._body()
+        cfg, rng = self.state.config, self.state.rng
+        roll = rng.random()
+        if roll < cfg.throttle_rate:
+            return self._json(
+                429, {"detail": "Request was throttled."}, {"Retry-After": "1"}
+            )
+        if roll < cfg.throttle_rate + cfg.error_rate:
+            return self._json(500, {"detail": "Internal server error (fake)."})
+        p = self.state.create(model, version, body)
+        self._json(201, self.state.to_json(p))
+
+    def do_GET(self):
+        parts = self.path.split("?")[0].strip("/").split("/")
+        if parts == ["__stats"]:
+            return self._json(200, self.state.stats())
+        if parts[0] == "files" and len(parts) == 3:
+            self._count("file")
+            return self._file(parts[1], parts[2])
+        if not self._authorized():
+            return
+        if len(parts) == 3 and parts[:2] == ["v1", "predictions"]:
+            self._count("get")
+            p = self._find(parts[2])
+            if p is not None:
+                self._json(200, self.state.to_json(p))
+            return
+        if len(parts) == 2 and parts[0] == "stream":
+            self._count("stream")
+            p = self._find(parts[1])
+            if p is not None:
+                self._stream(p)
+            return
+        self._json(404, {"detail": "Not found."})
+
+    def _file(self, pid: str, name: str):
+        p = self.state.predictions.get(pid)
+        if p is None or p.kind not in MEDIA:
+            return self._json(404, {"detail": "Not found."})
+        _, mime, _ = MEDIA[p.kind]
+        data = self.state.media_bytes(p.kind)
+        start, end = 0, len(data) - 1
+        rng = self.headers.get("Range", "")
+        code = 200
+        if rng.startswith("bytes="):
+            a, _, b = rng[6:].partition("-")
+            start = int(a or 0)
+            end = min(int(b), end) if b else end
+            code = 206
+        self.send_response(code)
+        self.send_header("Content-Type", mime)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        if code == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data[start : end + 1])
+
+    do_HEAD = do_GET
+
+    def _stream(self, p: _Prediction):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-store")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        seq = itertools.count(1)
+
+        def send(event: str, data: str):
+            lines = "".join(f"data: {line}\n" for line in data.split("\n"))
+            msg = f"event: {event}\nid: {next(seq)}\n{lines}\n"
+            self.wfile.write(msg.encode("utf-8"))
+            self.wfile.flush()
+
+        def wait(due: float) -> bool:
+            # отмена прерывает ожидание — как у Replicate, стрим сразу закрывается
+            while p.canceled_at is None and time.time() < due:
+                time.sleep(min(CANCEL_POLL_S, max(0.0, due - time.time())))
+            return p.canceled_at is None
+
+        try:
+            wait(p.created + p.queue_s)
+            step = p.run_s / max(1, len(p.tokens))
+            for i, tok in enumerate(p.tokens):
+                due = p.created + p.queue_s + step * (i + 1)
+                if p.will_fail and due >= p.ends_at - step:
+                    break
+                if not wait(due):
+                    break
+                send("output", tok)
+            if p.canceled_at is not None:
+                send("done", json.dumps({"reason": "canceled"}))
+            elif p.will_fail:
+                send("error", json.dumps({"detail": "fake failure"}))
+            else:
+                send("done", "{}")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # сотни одновременных подключений
+
+
+def make_server(
+    config: FakeConfig, host: str = "127.0.0.1", port: int = 0
+) -> FakeServer:
+    state = FakeState(config)
+    handler = type("FakeHandler", (Handler,), {"state": state})
+    server = FakeServer((host, port), handler)
+    state.base_url = f"http://{host}:{server.server_address[1]}"
+    server.url = state.base_url
+    server.state = state
+    return server
+
+
+def start(config: FakeConfig | None = None, host="127.0.0.1", port=0):
+    """Serve in a daemon thread; returns the server (server.url)."""
+    server = make_server(config or FakeConfig(), host, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_config_args(ap: argparse.ArgumentParser):
+    d = FakeConfig()
+    ap.add_argument("--queue", default=d.queue, help="время в очереди, c")
+    ap.add_argument("--run", default=d.run, help="время выполнения, c")
+    ap.add_argument("--fail-rate", type=float, default=d.fail_rate)
+    ap.add_argument("--error-rate", type=float, default=d.error_rate)
+    ap.add_argument("--throttle-rate", type=float, default=d.throttle_rate)
+    ap.add_argument("--output", default=d.output, choices=OUTPUT_KINDS + ("mix",))
+    ap.add_argument("--tokens", type=int, default=d.tokens)
+    ap.add_argument("--media-count", type=int, default=d.media_count)
+    ap.add_argument("--no-stream", action="store_true")
+    ap.add_argument("--seed", type=int, default=None)
+
+
+def config_from_args(args) -> FakeConfig:
+    return FakeConfig(
+        queue=args.queue,
+        run=args.run,
+        fail_rate=args.fail_rate,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        output=args.output,
+        tokens=args.tokens,
+        media_count=args.media_count,
+        stream=not args.no_stream,
+        seed=args.seed,
+    )
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Поддельный Replicate API")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765, help="0 — любой свободный")
+    add_config_args(ap)
+    args = ap.parse_args(argv)
+    server = make_server(config_from_args(args), args.host, args.port)
+    # первая строка stdout — адрес (её читает loadtest.py)
+    print(server.url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+"""
+Галерея сгенерированных изображений для вкладки «Изображение».
+
+- список изображений читается из HistoryStore постранично, следующая
+  страница подгружается, когда прокрутка подходит к концу;
+- сетка виртуальная: на Canvas есть элементы только для строк в видимой
+  области (+запас), PhotoImage ушедших строк освобождаются;
+- миниатюры берутся из ThumbCache (память → диск → сеть), полноразмерное
+  изображение — только при открытии, из локального хранилища (store.py),
+  иначе из копии в S3, иначе по исходной ссылке.
+"""
+import io
+import threading
+import time
+import tkinter as tk
+
+import customtkinter as ctk
+
+import logs
+from ui_monitor import track
+
+BG = "#0f0f13"
+TILE_BG = "#17171f"
+GAP = 12
+CAPTION_H = 18
+RENDER_MARGIN_PX = 400
+PAGE_SIZE = 60
+LOAD_MORE_PX = 800  # до конца ленты осталось меньше — грузим следующую страницу
+
+log = logs.get_logger("gallery")
+
+
+def load_bytes(item: dict) -> bytes:
+    """Image content from the local output store; on a miss it is fetched
+    from the S3 copy (fresh presigned link) or the original URL."""
+    from store import get_store
+
+    return get_store().read(item["url"], item.get("s3_key"))
+
+
+class ImageGallery(tk.Frame):
+    def __init__(self, master, store, thumbs, on_open=None):
+        super().__init__(master, bg=BG, highlightthickness=0)
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+        self.store = store
+        self.thumbs = thumbs
+        self.on_open = on_open or (lambda item: ImageViewer(self, item))
+        self.tile = thumbs.size
+
+        self.canvas = tk.Canvas(self, bg=BG, highlightthickness=0)
+        self.canvas.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar = ctk.CTkScrollbar(self, command=self.canvas.yview)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.canvas.configure(yscrollcommand=self._on_yscroll)
+
+        self._items: list[dict] = []
+        self._exhausted = False
+        self._loading = False
+        self._generation = 0  # refresh() отбрасывает ответы старых загрузок
+        self._cols = 1
+        self._rendered: dict[int, tuple[list[int], object]] = {}
+        self._render_scheduled = False
+
+        self.canvas.bind("<Configure>", lambda e: self._relayout())
+        self.canvas.bind(
+            "<MouseWheel>",
+            lambda e: self.canvas.yview_scroll(
+                -(int(e.delta / 120) if abs(e.delta) >= 120 else e.delta), "units"
+            ),
+        )
+        self.canvas.bind("<Button-4>", lambda e: self.canvas.yview_scroll(-3, "units"))
+        self.canvas.bind("<Button-5>", lambda e: self.canvas.yview_scroll(3, "units"))
+
+    # ---------- public ----------
+    def refresh(self):
+        """Reload from the newest image (e.g. after a new generation)."""
+        self._generation += 1
+        self._items = []
+        self._exhausted = False
+        self._loading = False
+        self._unrender_all()
+        self.canvas.yview_moveto(0)
+        self._load_more()
+
+    # ---------- data ----------
+    def _load_more(self):
+        if self._loading or self._exhausted:
+            return
+        self._loading = True
+        gen = self._generation
+        before = self._items[-1]["id"] if self._items else None
+
+        def work():
+            try:
+                rows = self.store.list_images(before_id=before, limit=PAGE_SIZE)
+            except Exception as e:
+                log.error("ошибка чтения: %s", e)
+                rows = []
+            try:
+                self.after(0, lambda: self._on_page(gen, rows))
+            except Exception:
+                pass
+
+        threading.Thread(target=work, daemon=True).start()
+
+    def _on_page(self, gen: int, rows: list[dict]):
+        if gen != self._generation:
+            return
+        self._loading = False
+        self._items.extend(rows)
+        if len(rows) < PAGE_SIZE:
+            self._exhausted = True
+        self._update_scrollregion()
+        self._schedule_render()
+
+    # ---------- layout ----------
+    @property
+    def _row_h(self) -> int:
+        return self.tile + CAPTION_H + GAP
+
+    def _relayout(self):
+        width = max(1, self.canvas.winfo_width())
+        cols = max(1, (width - GAP) // (self.tile + GAP))
+        if cols != self._cols:
+            self._cols = cols
+            self._unrender_all()
+        self._update_scrollregion()
+        self._schedule_render()
+
+    def _update_scrollregion(self):
+        rows = -(-len(self._items) // self._cols)
+        height = GAP + rows * self._row_h
+        width = max(1, self.canvas.winfo_width())
+        self.canvas.configure(scrollregion=(0, 0, width, height))
+        if not self._items:
+            self._draw_empty()
+        else:
+            self.canvas.delete("empty")
+
+    def _draw_empty(self):
+        self.canvas.delete("empty")
+        if self._loading:
+            return
+        self.canvas.create_text(
+            self.canvas.winfo_width() // 2,
+            120,
+            text="Здесь появятся сгенерированные изображения",
+            fill="#6a6a78",
+            font=("Arial", 13),
+            tags=("empty",),
+        )
+
+    def _tile_xy(self, idx: int) -> tuple[int, int]:
+        r, c = divmod(idx, self._cols)
+        return GAP + c * (self.tile + GAP), GAP + r * self._row_h
+
+    # ---------- render ----------
+    def _on_yscroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self._schedule_render()
+
+    def _schedule_render(self):
+        if not self._render_scheduled:
+            self._render_scheduled = True
+            self.after_idle(self._render)
+
+    @track("gallery render")
+    def _render(self):
+        self._render_scheduled = False
+        top = self.canvas.canvasy(0)
+        bottom = self.canvas.canvasy(self.canvas.winfo_height())
+        first_row = max(0, int((top - RENDER_MARGIN_PX) // self._row_h))
+        last_row = int((bottom + RENDER_MARGIN_PX) // self._row_h)
+        lo = first_row * self._cols
+        hi = min(len(self._items), (last_row + 1) * self._cols)
+
+        for idx in [i for i in self._rendered if i < lo or i >= hi]:
+            self._unrender(idx)
+        for idx in range(lo, hi):
+            if idx not in self._rendered:
+                self._render_tile(idx)
+
+        total_h = GAP + -(-len(self._items) // self._cols) * self._row_h
+        if total_h - bottom < LOAD_MORE_PX:
+            self._load_more()
+
+    def _render_tile(self, idx: int):
+        item = self._items[idx]
+        x, y = self._tile_xy(idx)
+        tag = f"tile{idx}"
+        ids = [
+            self.canvas.create_rectangle(
+                x, y, x + self.tile, y + self.tile, fill=TILE_BG, width=0, tags=(tag,)
+            ),
+            self.canvas.create_text(
+                x + 2,
+                y + self.tile + 3,
+                anchor="nw",
+                text=(item.get("model") or "")[: self.tile // 7],
+                fill="#8a8a99",
+                font=("Arial", 9),
+                tags=(tag,),
+            ),
+        ]
+        self.canvas.tag_bind(tag, "<Button-1>", lambda e, it=item: self.on_open(it))
+        self._rendered[idx] = (ids, None)
+
+        key = self._key(item)
+        img = self.thumbs.get(key)
+        if img is not None:
+            self._place_thumb(idx, img)
+        else:
+            gen = self._generation
+            self.thumbs.request(
+                key,
+                lambda: item,
+                lambda k, im: self._thumb_ready(gen, idx, im),
+            )
+
+    def _thumb_ready(self, gen: int, idx: int, img):
+        # вызывается из пула миниатюр — переходим в Tk-поток
+        def apply():
+            if gen == self._generation and idx in self._rendered:
+                if img is not None:
+                    self._place_thumb(idx, img)
+                else:
+                    self._mark_broken(idx)
+
+        try:
+            self.after(0, apply)
+        except Exception:
+            pass
+
+    def _place_thumb(self, idx: int, img):
+        from PIL import ImageTk
+
+        ids, photo = self._rendered[idx]
+        if photo is not None:
+            return
+        photo = ImageTk.PhotoImage(img)
+        x, y = self._tile_xy(idx)
+        cx = x + self.tile // 2
+        cy = y + self.tile // 2
+        ids.append(
+            self.canvas.create_image(cx, cy, image=photo, tags=(f"tile{idx}",))
+        )
+        self._rendered[idx] = (ids, photo)
+
+    def _mark_broken(self, idx: int):
+        x, y = self._tile_xy(idx)
+        ids, photo = self._rendered[idx]
+        ids.append(
+            self.canvas.create_text(
+                x + self.tile // 2,
+                y + self.tile // 2,
+                text="⚠ не загрузилось",
+                fill="#ff9a9a",
+                font=("Arial", 10),
+                tags=(f"tile{idx}",),
+            )
+        )
+
+    def _unrender(self, idx: int):
+        ids, _ = self._rendered.pop(idx)
+        for i in ids:
+            self.canvas.delete(i)
+
+    def _unrender_all(self):
+        for idx in list(self._rendered):
+            self._unrender(idx)
+
+    @staticmethod
+    def _key(item: dict) -> str:
+        from thumbs import thumb_key
+
+        return thumb_key(item.get("s3_key") or item["url"])
+
+
+class ImageViewer(ctk.CTkToplevel):
+    """Full-resolution view; the original is downloaded only on open."""
+
+    def __init__(self, master, item: dict):
+        super().__init__(master)
+        self.title(item.get("model") or "Изображение")
+        self.geometry("900x700")
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+        self._photo = None
+        self._image = None
+        self._fit_job = None
+        self.label = tk.Label(self, bg=BG, fg="#8a8a99", text="Загрузка…")
+        self.label.grid(row=0, column=0, sticky="nsew")
+        self.info = ctk.CTkLabel(self, text="", text_color="gray60")
+        self.info.grid(row=1, column=0, sticky="w", padx=10, pady=6)
+        self.bind("<Configure>", self._on_configure)
+        threading.Thread(target=self._download, args=(item,), daemon=True).start()
+
+    def _download(self, item: dict):
+        t0 = time.perf_counter()
+        try:
+            from PIL import Image
+
+            data = load_bytes(item)
+            img = Image.open(io.BytesIO(data))
+            img.load()
+            err = None
+        except Exception as e:
+            img, data, err = None, b"", str(e)
+        dt = time.perf_counter() - t0
+
+        def show():
+            if not self.winfo_exists():
+                return
+            if img is None:
+                self.label.configure(text=f"Не удалось загрузить: {err}")
+                return
+            self._image = img
+            self.info.configure(
+                text=f"{img.width}×{img.height}, {len(data) / 1e6:.1f} МБ,"
+                f" {dt:.1f} c"
+            )
+            self._fit()
+
+        try:
+            self.after(0, show)
+        except Exception:
+            pass
+
+    def _on_configure(self, e):
+        # пересэмплирование полного размера дорогое — ждём конца ресайза
+        if e.widget is not self:
+            return
+        if self._fit_job is not None:
+            self.after_cancel(self._fit_job)
+        self._fit_job = self.after(120, self._fit)
+
+    def _fit(self):
+        self._fit_job = None
+        if self._image is None:
+            return
+        from PIL import Image, ImageTk
+
+        w = max(1, self.label.winfo_width())
+        h = max(1, self.label.winfo_height())
+        img = self._image.copy()
+        img.thumbnail((w, h), Image.LANCZOS)
+        self._photo = ImageTk.PhotoImage(img)
+        self.label.configure(image=self._photo, text="")
@@ -0,0 +1,637 @@
+# -*- coding: utf-8 -*-
+"""
+Дублирующие запросы (hedging) против хвоста задержки текстовых моделей.
+
+Изредка prediction надолго застревает в очереди или на холодном старте.
+Для моделей с блоком "hedge" в конфиге run() ведёт себя как
+predictions.run(), но если за порог запрос не дошёл до processing и не
+выдал ни куска вывода, отправляется дубль (той же или равноценной
+модели). Побеждает первый, кто начал выдавать вывод или успешно
+завершился; второй отменяется на стороне Replicate.
+
+Порог — перцентиль времени старта по последним замерам этой модели
+(пока замеров мало — fallback_s), в пределах [min_s, max_s]. Дубли
+ограничены бюджетом: доп. расход (стоимость отменённого запроса) за день
+не больше budget этой модели (без него — общего AIHUB_HEDGE_BUDGET, $,
+по всем моделям) и не больше AIHUB_HEDGE_MAX_PER_DAY дублей.
+Оценка стоимости резервируется при отправке дубля, после гонки её
+заменяет фактическая.
+
+    "hedge": {"percentile": 95, "min_s": 2, "max_s": 30,
+              "fallback_s": 10, "alternate": "owner/model", "budget": 0.5}
+
+Замеры и итог каждого запроса пишутся в локальную SQLite; отчёт о том,
+как часто дубли отправлялись и выигрывали:
+
+    python hedge.py --days 7
+"""
+import argparse
+import contextvars
+import json
+import os
+import queue as queue_mod
+import sqlite3
+import sys
+import threading
+import time
+from dataclasses import dataclass
+
+import logs
+import predictions
+import profiling
+
+HEDGE_DB = os.getenv("AIHUB_HEDGE_DB")
+HEDGE_BUDGET = float(os.getenv("AIHUB_HEDGE_BUDGET", "1.0"))
+HEDGE_MAX_PER_DAY = int(os.getenv("AIHUB_HEDGE_MAX_PER_DAY", "200"))
+SAMPLES = 500  # сколько последних замеров берётся для перцентиля
+THRESHOLD_TTL = 60.0  # порог пересчитывается не чаще раза в минуту
+SETTLE_TIMEOUT = 30.0
+
+log = logs.get_logger("hedge")
+
+
+@dataclass
+class Policy:
+    percentile: float = 95.0
+    min_s: float = 2.0
+    max_s: float = 30.0
+    fallback_s: float = 10.0
+    min_samples: int = 20
+    alternate: str | None = None  # равноценная модель для дубля
+    budget: float | None = None  # $ в день на дубли этой модели
+
+
+def policy(cfg: dict | None) -> Policy | None:
+    """Hedging policy from a model config, or None if not enabled."""
+    raw = (cfg or {}).get("hedge")
+    if not raw or raw.get("enabled") is False:
+        return None
+    p = Policy()
+    for name in ("percentile", "min_s", "max_s", "fallback_s", "budget"):
+        if raw.get(name) is not None:
+            setattr(p, name, float(raw[name]))
+    if raw.get("min_samples") is not None:
+        p.min_samples = int(raw["min_samples"])
+    p.alternate = raw.get("alternate") or None
+    return p
+
+
+_configs: dict | None = None
+_configs_lock = threading.Lock()
+
+
+def _config(model: str) -> dict | None:
+    # сервису и воркерам пула конфиги нужны только здесь — читаем один раз
+    global _configs
+    with _configs_lock:
+        if _configs is None:
+            import modelconf
+
+            try:
+                _configs = modelconf.read_all()
+            except OSError:
+                _configs = {}
+        return _configs.get(model)
+
+
+# ---------------- замеры и журнал ----------------
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS latency (
+    id INTEGER PRIMARY KEY,
+    model TEXT NOT NULL,
+    start_s REAL NOT NULL,
+    total_s REAL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS latency_model ON latency(model, id);
+CREATE TABLE IF NOT EXISTS hedges (
+    id INTEGER PRIMARY KEY,
+    day TEXT NOT NULL,
+    model TEXT NOT NULL,
+    alternate TEXT,
+    threshold_s REAL,
+    fired INTEGER NOT NULL,
+    skipped TEXT,
+    winner TEXT,
+    extra_cost REAL NOT NULL DEFAULT 0,
+    primary_id TEXT,
+    hedge_id TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS hedges_day ON hedges(day, model);
+"""
+
+
+class HedgeStore:
+    def __init__(self, path: str | None = None):
+        if path is None:
+            from paths import data_path
+
+            path = HEDGE_DB or data_path("hedge.sqlite3")
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def add_latency(self, model: str, start_s: float, total_s: float | None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO latency(model, start_s, total_s, created_at)"
+                " VALUES (?, ?, ?, ?)",
+                (model, start_s, total_s, time.time()),
+            )
+
+    def start_times(self, model: str, limit: int = SAMPLES) -> list[float]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT start_s FROM latency WHERE model = ? ORDER BY id DESC"
+                " LIMIT ?",
+                (model, limit),
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def record(self, model: str, **fields):
+        cols = ["day", "model", "created_at", *fields]
+        values = [time.strftime("%Y-%m-%d"), model, time.time(), *fields.values()]
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO hedges({', '.join(cols)})"
+                f" VALUES ({', '.join('?' * len(cols))})",
+                values,
+            )
+
+    def update(self, row_id: int, **fields):
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE hedges SET {', '.join(c + ' = ?' for c in fields)}"
+                " WHERE id = ?",
+                (*fields.values(), row_id),
+            )
+
+    def spent_today(self, model: str | None = None) -> tuple[float, int]:
+        """Extra spend ($) and number of hedges fired today."""
+        with self._lock:
+            return self._spent(time.strftime("%Y-%m-%d"), model)
+
+    def _spent(self, day: str, model: str | None) -> tuple[float, int]:
+        sql = (
+            "SELECT COALESCE(SUM(extra_cost), 0), COALESCE(SUM(fired), 0)"
+            " FROM hedges WHERE day = ?"
+        )
+        params: list = [day]
+        if model is not None:
+            sql += " AND model = ?"
+            params.append(model)
+        row = self._conn.execute(sql, params).fetchone()
+        return float(row[0]), int(row[1])
+
+    def reserve(
+        self,
+        model: str,
+        cost: float,
+        budget: float,
+        per_model: bool,
+        max_count: int = HEDGE_MAX_PER_DAY,
+        **fields,
+    ) -> int | None:
+        """Check today's hedge spend and record a fired hedge with its
+        estimated cost in one transaction; None when over the budget
+        (per_model — this model's spend, else all models) or the count."""
+        day = time.strftime("%Y-%m-%d")
+        cols = ["day", "model", "created_at", "fired", "extra_cost", *fields]
+        values = [day, model, time.time(), 1, cost, *fields.values()]
+        with self._lock:
+            # IMMEDIATE: воркеры пула в других процессах ждут, а не читают
+            # ту же сумму одновременно с нами
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                spent = self._spent(day, model if per_model else None)[0]
+                fired = self._spent(day, None)[1]
+                if fired >= max_count or spent + cost > budget:
+                    self._conn.rollback()
+                    return None
+                cur = self._conn.execute(
+                    f"INSERT INTO hedges({', '.join(cols)})"
+                    f" VALUES ({', '.join('?' * len(cols))})",
+                    values,
+                )
+                self._conn.commit()
+                return cur.lastrowid
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def report(self, days: int = 7) -> list[dict]:
+        since = time.strftime("%Y-%m-%d", time.localtime(time.time() - days * 86400))
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT model,
+                       COUNT(*) AS requests,
+                       SUM(fired) AS fired,
+                       SUM(fired AND winner = 'hedge') AS hedge_won,
+                       SUM(skipped IS NOT NULL) AS skipped,
+                       COALESCE(SUM(extra_cost), 0) AS extra_cost,
+                       AVG(threshold_s) AS threshold_s
+                FROM hedges WHERE day >= ? GROUP BY model ORDER BY model
+                """,
+                (since,),
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+
+_store: HedgeStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> HedgeStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = HedgeStore()
+        return _store
+
+
+_thresholds: dict[str, tuple[float, float]] = {}
+_thresholds_lock = threading.Lock()
+
+
+def threshold(model: str, pol: Policy) -> float:
+    """Seconds to wait for the start before hedging (cached per model)."""
+    now = time.monotonic()
+    with _thresholds_lock:
+        hit = _thresholds.get(model)
+        if hit is not None and now - hit[1] < THRESHOLD_TTL:
+            return hit[0]
+    samples = get_store().start_times(model)
+    if len(samples) < pol.min_samples:
+        value = pol.fallback_s
+    else:
+        value = profiling.percentile(samples, pol.percentile)
+    value = min(pol.max_s, max(pol.min_s, value))
+    with _thresholds_lock:
+        _thresholds[model] = (value, now)
+    return value
+
+
+_costs = None
+
+
+def _engine():
+    global _costs
+    if _costs is None:
+        import costs
+
+        _costs = costs.CostEngine()
+    return _costs
+
+
+def _estimate(model: str, input: dict) -> float | None:
+    import context
+
+    tokens = context.count_tokens(json.dumps(input, ensure_ascii=False, default=str))
+    return _engine().estimate(model, tokens)
+
+
+def _actual(model: str, prediction) -> float | None:
+    return _engine().actual(
+        model, getattr(prediction, "metrics", None), getattr(prediction, "output", None)
+    )
+
+
+# ---------------- гонка ----------------
+class _Leg:
+    def __init__(self, name: str, model: str):
+        self.name = name
+        self.model = model
+        self.cancel = threading.Event()
+        self.last = None  # последний увиденный prediction
+        self.started_at: float | None = None  # processing или первый вывод
+        self.cancelled_at: float | None = None
+        self.finished_at: float | None = None
+        self.result: predictions.RunResult | None = None
+        self.error: BaseException | None = None
+        self.thread: threading.Thread | None = None
+
+    @property
+    def prediction_id(self) -> str | None:
+        return getattr(self.last, "id", None)
+
+    @property
+    def succeeded(self) -> bool:
+        return (
+            self.result is not None
+            and getattr(self.result.prediction, "status", None) == "succeeded"
+        )
+
+
+class _Race:
+    def __init__(
+        self, client, model, input, pol, on_text, on_status, cancel_event, stream
+    ):
+        self.client = client
+        self.model = model
+        self.input = input
+        self.pol = pol
+        self.on_text = on_text
+        self.on_status = on_status
+        self.cancel_event = cancel_event
+        self.stream = stream
+        self.events: queue_mod.Queue = queue_mod.Queue()
+        self.lock = threading.Lock()
+        self.winner: _Leg | None = None
+        self.t0 = time.perf_counter()
+        self.primary = _Leg("primary", model)
+        self.hedge: _Leg | None = None
+        self.skipped: str | None = None
+        self.reserved: int | None = None  # строка hedges с резервом расхода
+
+    # ---- потоки запросов ----
+    def _start(self, leg: _Leg):
+        def status(p):
+            leg.last = p
+            if leg.started_at is None and (p.status == "processing" or p.output):
+                leg.started_at = time.perf_counter()
+            with self.lock:
+                forward = leg is (self.winner or self.primary)
+            if forward and self.on_status is not None:
+                self.on_status(p)
+
+        def text(t):
+            if leg.started_at is None:
+                leg.started_at = time.perf_counter()
+            if self._claim(leg) and self.on_text is not None:
+                self.on_text(t)
+
+        def body():
+            # свой контекст логов: logs.bind() одного запроса не трогает другой
+            with logs.context(hedge=leg.name):
+                try:
+                    leg.result = predictions.run(
+                        self.client,
+                        leg.model,
+                        self.input,
+                        on_text=text,
+                        on_status=status,
+                        cancel_event=leg.cancel,
+                        stream=self.stream,
+                    )
+                    leg.last = leg.result.prediction
+                except BaseException as e:
+                    leg.error = e
+            leg.finished_at = time.perf_counter()
+            self.events.put(leg)
+
+        ctx = contextvars.copy_context()  # спан запроса, профиль, логи
+        leg.thread = threading.Thread(
+            target=ctx.run, args=(body,), daemon=True, name=f"hedge-{leg.name}"
+        )
+        leg.thread.start()
+
+    def _claim(self, leg: _Leg) -> bool:
+        """First leg with output (or success) wins; the other is cancelled."""
+        with self.lock:
+            if self.winner is not None:
+                return self.winner is leg
+            self.winner = leg
+        for other in (self.primary, self.hedge):
+            if other is not None and other is not leg:
+                self._cancel(other)
+        if leg is not self.primary and leg.last is not None and self.on_status:
+            # вызывающему — prediction победителя
+            self.on_status(leg.last)
+        return True
+
+    def _cancel(self, leg: _Leg):
+        if leg.cancel.is_set():
+            return
+        leg.cancel.set()
+        leg.cancelled_at = time.perf_counter()
+        # поток может висеть в SSE без событий — отменяем и здесь
+        if leg.prediction_id:
+            try:
+                self.client.predictions.cancel(leg.prediction_id)
+            except Exception:
+                pass
+
+    def _recheck(self, leg: _Leg) -> bool:
+        """Fresh status right before hedging: the last poll of a
+        stream=False leg can be up to POLL_INTERVAL old."""
+        if leg.prediction_id is None:
+            return False
+        try:
+            p = self.client.predictions.get(leg.prediction_id)
+        except Exception:
+            return False
+        if p.status == "starting" and not p.output:
+            return False
+        if leg.started_at is None:
+            leg.started_at = time.perf_counter()
+        return True
+
+    def _fire(self, limit: float):
+        model = self.pol.alternate or self.model
+        store = get_store()
+        # budget из конфига — на эту модель, AIHUB_HEDGE_BUDGET — на все
+        per_model = self.pol.budget is not None
+        budget = self.pol.budget if per_model else HEDGE_BUDGET
+        est = _estimate(model, self.input) or 0.0
+        # оценка резервируется сразу: параллельные запросы видят её до
+        # того, как станет известна реальная стоимость
+        self.reserved = store.reserve(
+            self.model,
+            est,
+            budget,
+            per_model,
+            max_count=HEDGE_MAX_PER_DAY,
+            alternate=model,
+            threshold_s=limit,
+        )
+        if self.reserved is None:
+            self.skipped = "budget"
+            spent, fired = store.spent_today(self.model if per_model else None)
+            log.info(
+                "дубль не отправлен: бюджет",
+                extra={"spent": round(spent, 4), "budget": budget, "hedges": fired},
+            )
+            return
+        self.hedge = _Leg("hedge", model)
+        log.info(
+            "дубль запроса",
+            extra={
+                "threshold_s": round(limit, 3),
+                "alternate": model,
+                "primary_id": self.primary.prediction_id,
+            },
+        )
+        self._start(self.hedge)
+
+    # ---- координатор ----
+    def run(self) -> predictions.RunResult:
+        limit = threshold(self.model, self.pol)
+        self._start(self.primary)
+        deadline = self.t0 + limit
+        pending = 1
+        try:
+            while True:
+                if self.cancel_event is not None and self.cancel_event.is_set():
+                    for leg in (self.primary, self.hedge):
+                        if leg is not None:
+                            self._cancel(leg)
+                    raise predictions.Cancelled(self.primary.prediction_id)
+                if (
+                    self.hedge is None
+                    and self.skipped is None
+                    and self.winner is None
+                    and self.primary.started_at is None
+                    and time.perf_counter() >= deadline
+                    and not self._recheck(self.primary)
+                ):
+                    self._fire(limit)
+                    if self.hedge is not None:
+                        pending += 1
+                try:
+                    leg = self.events.get(timeout=0.1)
+                except queue_mod.Empty:
+                    continue
+                pending -= 1
+                if leg.succeeded and self._claim(leg):
+                    return self._result(leg)
+                with self.lock:
+                    winner = self.winner
+                if winner is leg or pending == 0:
+                    # победитель упал после первого вывода или дубля нет
+                    return self._result(leg)
+                # один из двух упал — ждём второй
+        finally:
+            threading.Thread(
+                target=self._settle, args=(limit,), daemon=True, name="hedge-settle"
+            ).start()
+
+    def _result(self, leg: _Leg) -> predictions.RunResult:
+        if leg.error is not None:
+            raise leg.error
+        res = leg.result
+        # задержка — с точки зрения пользователя, от первого create
+        res.started = self.t0
+        return res
+
+    def _settle(self, limit: float):
+        """Record latency and the hedge outcome once both legs are done."""
+        legs = [leg for leg in (self.primary, self.hedge) if leg is not None]
+        for leg in legs:
+            leg.thread.join(SETTLE_TIMEOUT)
+        p = self.primary
+        # старт основного; если его отменили раньше — время до отмены
+        # (нижняя граница, иначе перцентиль занижался бы самими дублями)
+        start = p.started_at or p.cancelled_at or p.finished_at
+        winner = self.winner
+        total = None
+        if winner is not None and winner.finished_at is not None:
+            total = winner.finished_at - self.t0
+        store = get_store()
+        if start is not None:
+            store.add_latency(self.model, start - self.t0, total)
+        extra = 0.0
+        loser = None
+        if self.hedge is not None:
+            loser = self.hedge if winner is not self.hedge else p
+            extra = self._loser_cost(loser)
+        outcome = {
+            "winner": winner.name if winner else None,
+            "extra_cost": extra,
+            "primary_id": p.prediction_id,
+            "hedge_id": self.hedge.prediction_id if self.hedge else None,
+        }
+        if self.reserved is not None:
+            # резерв-оценка заменяется фактической стоимостью проигравшего
+            store.update(self.reserved, **outcome)
+        else:
+            store.record(
+                self.model, threshold_s=limit, fired=0, skipped=self.skipped, **outcome
+            )
+        if self.hedge is not None:
+            log.info(
+                "итог дубля",
+                extra={
+                    "winner": winner.name if winner else None,
+                    "extra_cost": round(extra, 6),
+                    "loser_id": loser.prediction_id,
+                },
+            )
+
+    def _loser_cost(self, leg: _Leg) -> float:
+        pred = leg.last
+        if leg.prediction_id:
+            try:
+                pred = self.client.predictions.get(leg.prediction_id)
+            except Exception:
+                pass
+        cost = _actual(leg.model, pred) if pred is not None else None
+        if cost is None:
+            cost = _estimate(leg.model, self.input) if leg.prediction_id else 0.0
+        return cost or 0.0
+
+
+def run(
+    client,
+    model: str,
+    input: dict,
+    cfg: dict | None = None,
+    on_text=None,
+    on_status=None,
+    cancel_event: threading.Event | None = None,
+    stream: bool = True,
+) -> predictions.RunResult:
+    """predictions.run() with hedging when the model config enables it
+    (cfg=None — look the config up in models_conf)."""
+    pol = policy(cfg if cfg is not None else _config(model))
+    if pol is None:
+        return predictions.run(
+            client, model, input, on_text, on_status, cancel_event, stream
+        )
+    return _Race(
+        client, model, input, pol, on_text, on_status, cancel_event, stream
+    ).run()
+
+
+# ---------------- отчёт ----------------
+def print_report(rows: list[dict], days: int):
+    if not rows:
+        print(f"За {days} дн. запросов с дублированием не было")
+        return
+    print(f"Дублирование запросов за {days} дн.:")
+    for r in rows:
+        fired = r["fired"] or 0
+        won = r["hedge_won"] or 0
+        print(
+            f"  {r['model']}: запросов {r['requests']},"
+            f" дублей {fired} ({100 * fired / r['requests']:.1f}%),"
+            f" дубль выиграл {won}"
+            + (f" ({100 * won / fired:.0f}% дублей)" if fired else "")
+            + f", пропущено по бюджету {r['skipped'] or 0},"
+            f" доп. расход ${r['extra_cost']:.4f},"
+            f" порог ~{r['threshold_s']:.1f} c"
+        )
+    spent, fired = get_store().spent_today()
+    print(f"Сегодня: дублей {fired}, доп. расход ${spent:.4f} из ${HEDGE_BUDGET:.2f}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Отчёт о дублирующих запросах")
+    ap.add_argument("--days", type=int, default=7)
+    ap.add_argument("--json", action="store_true", help="вывести JSON")
+    args = ap.parse_args(argv)
+    rows = get_store().report(args.days)
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        print_report(rows, args.days)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+Локальная история диалогов (SQLite).
+
+- запись только добавлением (INSERT) и только из фонового потока-писателя:
+  append() кладёт операцию в очередь и сразу возвращается;
+- полнотекстовый индекс FTS5 по промптам и ответам (если sqlite собран
+  без FTS5 — поиск через LIKE);
+- чтение постранично (keyset по updated_at), каждое обращение — на
+  отдельном соединении потока, WAL не даёт писателю блокировать чтение;
+- token_count сообщения считается один раз в потоке-писателе и дальше
+  используется сборщиком контекста (context.py) без пересчёта.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+import logs
+from context import count_tokens
+from paths import data_path
+
+HISTORY_DB = os.getenv("AIHUB_HISTORY_DB")
+PAGE_SIZE = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS conversations_updated ON conversations(updated_at);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    conversation_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    model TEXT,
+    content TEXT NOT NULL,
+    prediction_id TEXT,
+    created_at REAL NOT NULL,
+    token_count INTEGER
+);
+CREATE INDEX IF NOT EXISTS messages_conv ON messages(conversation_id, id);
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    conversation_id TEXT,
+    prediction_id TEXT,
+    model TEXT,
+    url TEXT NOT NULL,
+    s3_key TEXT,
+    created_at REAL NOT NULL
+);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts
+    USING fts5(content, content='messages', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+END;
+"""
+
+_STOP = object()
+log = logs.get_logger("history")
+
+
+class HistoryStore:
+    def __init__(self, path: str | None = None):
+        self.path = path or HISTORY_DB or data_path("history.sqlite3")
+        self._local = threading.local()
+        self._q: queue.Queue = queue.Queue()
+        self._pending = 0
+        self._pending_cv = threading.Condition()
+
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        cols = {r["name"] for r in conn.execute("PRAGMA table_info(messages)")}
+        if "token_count" not in cols:
+            conn.execute("ALTER TABLE messages ADD COLUMN token_count INTEGER")
+        had_fts = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'"
+        ).fetchone()
+        try:
+            conn.executescript(FTS_SCHEMA)
+            if not had_fts:
+                # история, записанная до появления индекса, тоже ищется
+                conn.execute("INSERT INTO messages_fts(messages_fts) VALUES('rebuild')")
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            self.has_fts = False
+        conn.commit()
+
+        self._writer = threading.Thread(
+            target=self._write_loop, daemon=True, name="history-writer"
+        )
+        self._writer.start()
+
+    # ---- connections ----
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ---- writes (non-blocking) ----
+    def new_conversation(self, title: str) -> str:
+        conv_id = uuid.uuid4().hex
+        now = time.time()
+        self._submit(
+            "INSERT INTO conversations(id, title, created_at, updated_at)"
+            " VALUES (?, ?, ?, ?)",
+            (conv_id, title.strip()[:120] or "Без названия", now, now),
+        )
+        return conv_id
+
+    def append(
+        self,
+        conversation_id: str,
+        role: str,
+        content: str,
+        model: str | None = None,
+        prediction_id: str | None = None,
+    ):
+        now = time.time()
+
+        def insert(conn):
+            # токены считаем здесь, в потоке-писателе, а не в UI
+            conn.execute(
+                "INSERT INTO messages(conversation_id, role, model, content,"
+                " prediction_id, created_at, token_count)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    conversation_id,
+                    role,
+                    model,
+                    content,
+                    prediction_id,
+                    now,
+                    count_tokens(content),
+                ),
+            )
+
+        self._submit(insert)
+        self._submit(
+            "UPDATE conversations SET updated_at = ? WHERE id = ?",
+            (now, conversation_id),
+        )
+
+    def add_image(
+        self,
+        url: str,
+        model: str | None = None,
+        prediction_id: str | None = None,
+        s3_key: str | None = None,
+        conversation_id: str | None = None,
+    ):
+        """Remember an image output for the gallery."""
+        self._submit(
+            "INSERT INTO images(conversation_id, prediction_id, model, url,"
+            " s3_key, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (conversation_id, prediction_id, model, url, s3_key, time.time()),
+        )
+
+    def _submit(self, op, params: tuple = ()):
+        """Queue an SQL statement (or a callable taking the connection)."""
+        with self._pending_cv:
+            self._pending += 1
+        self._q.put(op if callable(op) else (op, params))
+
+    def _write_loop(self):
+        conn = self._conn()
+        while True:
+            item = self._q.get()
+            batch = [item]
+            # всё, что накопилось, — одним коммитом; у каждой операции своя
+            # точка сохранения (_apply), ошибка одной не откатывает остальные
+            while True:
+                try:
+                    batch.append(self._q.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(op is _STOP for op in batch)
+            try:
+                with conn:
+                    for op in batch:
+                        if op is not _STOP:
+                            self._apply(conn, op)
+            except sqlite3.Error as e:
+                log.error("ошибка записи: %s", e)
+            with self._pending_cv:
+                self._pending -= sum(1 for op in batch if op is not _STOP)
+                self._pending_cv.notify_all()
+            if stop:
+                return
+
+    @staticmethod
+    def _apply(conn: sqlite3.Connection, op):
+        # у каждой операции своя точка сохранения: ошибка откатывает только
+        # её, остальные записи пакета (в т.ч. других чатов) остаются
+        conn.execute("SAVEPOINT op")
+        try:
+            if callable(op):
+                op(conn)
+            else:
+                conn.execute(*op)
+        except Exception as e:
+            conn.execute("ROLLBACK TO op")
+            what = getattr(op, "__qualname__", None) or op[0]
+            log.error("операция записи пропущена: %s (%s)", e, what)
+        conn.execute("RELEASE op")
+
+    def flush(self, timeout: float | None = 5.0) -> bool:
+        """Wait until queued writes are committed."""
+        with self._pending_cv:
+            return self._pending_cv.wait_for(lambda: self._pending <= 0, timeout)
+
+    def close(self):
+        self._q.put(_STOP)
+        self._writer.join(timeout=5)
+
+    # ---- reads ----
+    def list_conversations(
+        self, before: float | None = None, limit: int = PAGE_SIZE
+    ) -> list[dict]:
+        """One page of conversations, newest first. Pass the last row's
+        updated_at as `before` to get the next page."""
+        sql = "SELECT id, title, created_at, updated_at FROM conversations"
+        params: tuple = ()
+        if before is not None:
+            sql += " WHERE updated_at < ?"
+            params = (before,)
+        sql += " ORDER BY updated_at DESC LIMIT ?"
+        rows = self._conn().execute(sql, params + (limit,)).fetchall()
+        return [dict(r) for r in rows]
+
+    def messages(
+        self, conversation_id: str, after_id: int = 0, limit: int | None = None
+    ) -> list[dict]:
+        sql = (
+            "SELECT id, role, model, content, prediction_id, created_at,"
+            " token_count FROM messages WHERE conversation_id = ? AND id > ?"
+            " ORDER BY id"
+        )
+        params: tuple = (conversation_id, after_id)
+        if limit:
+            sql += " LIMIT ?"
+            params += (limit,)
+        return [dict(r) for r in self._conn().execute(sql, params).fetchall()]
+
+    def iter_recent(self, conversation_id: str, page: int = 20):
+        """Messages of a conversation from the newest backwards, read page by
+        page so a caller that stops early never loads the whole thread."""
+        conn = self._conn()
+        before = None
+        while True:
+            sql = (
+                "SELECT id, role, model, content, prediction_id, created_at,"
+                " token_count FROM messages WHERE conversation_id = ?"
+            )
+            params: tuple = (conversation_id,)
+            if before is not None:
+                sql += " AND id < ?"
+                params += (before,)
+            sql += " ORDER BY id DESC LIMIT ?"
+            rows = conn.execute(sql, params + (page,)).fetchall()
+            for r in rows:
+                yield dict(r)
+            if len(rows) < page:
+                return
+            before = rows[-1]["id"]
+
+    def list_images(
+        self, before_id: int | None = None, limit: int = PAGE_SIZE
+    ) -> list[dict]:
+        """One page of gallery images, newest first (keyset by id)."""
+        sql = (
+            "SELECT id, conversation_id, prediction_id, model, url, s3_key,"
+            " created_at FROM images"
+        )
+        params: tuple = ()
+        if before_id is not None:
+            sql += " WHERE id < ?"
+            params = (before_id,)
+        sql += " ORDER BY id DESC LIMIT ?"
+        rows = self._conn().execute(sql, params + (limit,)).fetchall()
+        return [dict(r) for r in rows]
+
+    def search(self, query: str, limit: int = PAGE_SIZE) -> list[dict]:
+        """Full-text search over prompts and outputs -> conversations with a
+        snippet of the best matching message."""
+        query = query.strip()
+        if not query:
+            return []
+        conn = self._conn()
+        if self.has_fts:
+            # каждое слово — префиксный токен в кавычках, без синтаксиса FTS
+            terms = " ".join(
+                '"' + w.replace('"', '""') + '"*' for w in query.split()
+            )
+            sql = """
+                SELECT c.id, c.title, c.created_at, c.updated_at,
+                       snippet(messages_fts, 0, '«', '»', '…', 12) AS snippet
+                FROM messages_fts
+                JOIN messages m ON m.id = messages_fts.rowid
+                JOIN conversations c ON c.id = m.conversation_id
+                WHERE messages_fts MATCH ?
+                ORDER BY rank LIMIT ?
+            """
+            rows = conn.execute(sql, (terms, limit * 4)).fetchall()
+        else:
+            sql = """
+                SELECT c.id, c.title, c.created_at, c.updated_at,
+                       substr(m.content, 1, 80) AS snippet
+                FROM messages m JOIN conversations c ON c.id = m.conversation_id
+                WHERE m.content LIKE ? ORDER BY m.id DESC LIMIT ?
+            """
+            rows = conn.execute(sql, (f"%{query}%", limit * 4)).fetchall()
+        seen, out = set(), []
+        for r in rows:
+            if r["id"] in seen:
+                continue
+            seen.add(r["id"])
+            out.append(dict(r))
+            if len(out) >= limit:
+                break
+        return out
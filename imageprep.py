@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Подготовка изображений перед загрузкой: уменьшение до max_edge по длинной
+стороне, удаление метаданных (EXIF, GPS, ICC-профили камер) и
+перекодирование с заданным качеством.
+
+Настраивается в конфиге модели:
+    "preprocess": {"max_edge": 1536, "quality": 85, "format": "jpeg"}
+
+Результат кешируется на диске по хешу исходника и параметрам, поэтому
+повторное вложение того же файла не пережимается. Pillow — опциональная
+зависимость: без неё файлы уходят как есть.
+"""
+import os
+
+PREPROCESS_DIR = os.getenv("AIHUB_PREPROCESS_DIR")
+DEFAULT_MAX_EDGE = 1536
+DEFAULT_QUALITY = 85
+FORMAT_EXT = {"jpeg": ".jpg", "png": ".png", "webp": ".webp"}
+# режимы, которые формат сохраняет без преобразования
+SAVE_MODES = {
+    "jpeg": ("RGB", "L"),
+    "png": ("RGB", "RGBA", "L", "LA", "P", "1"),
+    "webp": ("RGB", "RGBA"),
+}
+
+
+def options(cfg: dict | None) -> dict | None:
+    """Normalized preprocess options from a model config, or None."""
+    raw = (cfg or {}).get("preprocess")
+    if not raw:
+        return None
+    fmt = str(raw.get("format", "jpeg")).lower()
+    if fmt == "jpg":
+        fmt = "jpeg"
+    if fmt not in FORMAT_EXT:
+        fmt = "jpeg"
+    return {
+        "max_edge": int(raw.get("max_edge", DEFAULT_MAX_EDGE)),
+        "quality": int(raw.get("quality", DEFAULT_QUALITY)),
+        "format": fmt,
+    }
+
+
+def signature(opts: dict) -> str:
+    return f"{opts['max_edge']}-q{opts['quality']}-{opts['format']}"
+
+
+def _cache_path(digest: str, opts: dict) -> str:
+    name = f"{digest[:32]}_{signature(opts)}{FORMAT_EXT[opts['format']]}"
+    if PREPROCESS_DIR:
+        os.makedirs(PREPROCESS_DIR, exist_ok=True)
+        return os.path.join(PREPROCESS_DIR, name)
+    from paths import data_path
+
+    return data_path("preprocessed", name)
+
+
+def prepare(path: str, opts: dict | None, digest: str) -> str:
+    """Return the path of the file to upload: a downscaled, metadata-free
+    copy for images, or the original path (non-images, no Pillow)."""
+    if not opts:
+        return path
+    out = _cache_path(digest, opts)
+    if os.path.exists(out):
+        return out
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return path
+
+    try:
+        im = Image.open(path)
+    except Exception:
+        # не изображение (pdf, аудио…) — отправляем как есть
+        return path
+    with im:
+        edge = opts["max_edge"]
+        fmt = opts["format"]
+        # JPEG декодируется сразу в уменьшенном масштабе (1/2, 1/4, 1/8) —
+        # для 40-мегапиксельных оригиналов это основная экономия
+        if im.format == "JPEG":
+            im.draft("RGB", (edge, edge))
+        # поворот из EXIF применяем до того, как метаданные выкинем
+        im = ImageOps.exif_transpose(im)
+        im.thumbnail((edge, edge), Image.LANCZOS, reducing_gap=3.0)
+        im = _to_savable(im, fmt, Image)
+        save = {"optimize": True}
+        if fmt in ("jpeg", "webp"):
+            save["quality"] = opts["quality"]
+        if fmt == "jpeg":
+            save["progressive"] = True
+        # Pillow берёт icc_profile/exif/xmp из im.info по умолчанию (PNG,
+        # WebP) — оставляем только прозрачность, метаданные в копию не идут
+        im.info = {k: v for k, v in im.info.items() if k == "transparency"}
+        tmp = f"{out}.{os.getpid()}.tmp"
+        try:
+            im.save(tmp, format=fmt.upper(), **save)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+    os.replace(tmp, out)
+    return out
+
+
+def _to_savable(im, fmt: str, Image):
+    # CMYK, YCbCr, 16-битные и т.п. режимы не всякий формат сохраняет
+    if im.mode in SAVE_MODES[fmt]:
+        return im
+    has_alpha = "A" in im.getbands() or "transparency" in im.info
+    if not has_alpha:
+        return im.convert("RGB")
+    im = im.convert("RGBA")
+    if fmt != "jpeg":
+        return im
+    # у JPEG нет прозрачности — кладём на белый фон
+    bg = Image.new("RGB", im.size, (255, 255, 255))
+    bg.paste(im, mask=im.getchannel("A"))
+    return bg
+
+
+def upload_name(original_name: str, upload_path: str) -> str:
+    """Original file name with the extension of the re-encoded copy."""
+    stem, ext = os.path.splitext(original_name)
+    new_ext = os.path.splitext(upload_path)[1]
+    return stem + new_ext if new_ext and new_ext != ext else original_name
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+Журнал задач в SQLite (общий для окна, main.py и сервиса) и общий кеш.
+
+jobs  — состояние каждой задачи: модель, input и его хеш, стадия
+        (jobs.QUEUED ... DONE), prediction_id, итог. Запись появляется
+        до create, prediction_id — сразу после, поэтому после закрытия
+        окна или падения процесса незавершённую задачу можно довести:
+        статус берётся по prediction_id, новый prediction не создаётся
+        (S3-ключи выводов тоже от prediction_id — повторная загрузка
+        перезапишет те же объекты). origin — кто хозяин задачи
+        (app / cli / server): каждый продолжает только свои.
+        В режиме пула воркер сервиса забирает следующую задачу одним
+        UPDATE ... RETURNING — одну задачу не возьмут два процесса;
+cache — ключ/значение с TTL для данных, которые дорого получать каждому
+        процессу заново (sniff выводов и т.п.).
+
+WAL и busy_timeout: читатели не ждут писателя, писатели — друг друга
+не дольше таймаута. Соединение — одно на процесс под замком.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import jobs
+from store import input_hash
+
+JOBS_DB = os.getenv("AIHUB_JOBS_DB")
+CACHE_TTL = 24 * 3600
+# сколько раз задачу сервиса можно начать заново после падения воркера
+MAX_ATTEMPTS = 3
+
+APP = "app"
+CLI = "cli"
+SERVER = "server"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    origin TEXT NOT NULL DEFAULT 'server',
+    model TEXT NOT NULL,
+    input TEXT NOT NULL,
+    input_hash TEXT,
+    context TEXT,
+    priority INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL,
+    status TEXT,
+    prediction_id TEXT,
+    worker INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    result TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+INDEXES = """
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs(origin, state, priority, id);
+CREATE INDEX IF NOT EXISTS jobs_worker ON jobs(worker, state);
+"""
+_ADDED_COLUMNS = {
+    "origin": "TEXT NOT NULL DEFAULT 'server'",
+    "input_hash": "TEXT",
+    "context": "TEXT",
+}
+
+_FINAL = tuple(jobs.FINAL_STATES)
+_COLUMNS = (
+    "state",
+    "status",
+    "prediction_id",
+    "worker",
+    "error",
+    "result",
+    "started_at",
+    "finished_at",
+)
+
+
+def default_path() -> str:
+    if JOBS_DB:
+        return JOBS_DB
+    from paths import data_path
+
+    return data_path("jobs.sqlite3")
+
+
+class _DB:
+    def __init__(self, path: str | None = None):
+        self.path = path or default_path()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        cols = {r["name"] for r in self._conn.execute("PRAGMA table_info(jobs)")}
+        for name, decl in _ADDED_COLUMNS.items():
+            if name not in cols:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {decl}")
+        self._conn.executescript(INDEXES)
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JobDB(_DB):
+    def add(
+        self,
+        model: str,
+        input: dict,
+        priority: int = 0,
+        origin: str = SERVER,
+        state: str = jobs.QUEUED,
+        context: dict | None = None,
+    ) -> int:
+        now = time.time()
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "INSERT INTO jobs(origin, model, input, input_hash, context,"
+                " priority, state, created_at, started_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    origin,
+                    model,
+                    json.dumps(input, ensure_ascii=False, default=str),
+                    input_hash(model, input),
+                    json.dumps(context, ensure_ascii=False) if context else None,
+                    priority,
+                    state,
+                    now,
+                    None if state == jobs.QUEUED else now,
+                ),
+            )
+            return cur.lastrowid
+
+    def claim_next(self, worker: int, origin: str = SERVER) -> dict | None:
+        """Take the next queued job (by priority) for `worker`, or None."""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "UPDATE jobs SET state = ?, worker = ?, attempts = attempts + 1,"
+                " started_at = ? WHERE id = (SELECT id FROM jobs WHERE origin = ?"
+                " AND state = ? ORDER BY priority, id LIMIT 1) AND state = ?"
+                " RETURNING *",
+                (
+                    jobs.CREATING,
+                    worker,
+                    time.time(),
+                    origin,
+                    jobs.QUEUED,
+                    jobs.QUEUED,
+                ),
+            ).fetchone()
+        return _row(row)
+
+    def update(self, job_id: int, **fields):
+        cols = [c for c in fields if c in _COLUMNS]
+        if not cols:
+            return
+        values = [
+            json.dumps(fields[c], ensure_ascii=False, default=str)
+            if c == "result" and not isinstance(fields[c], (str, type(None)))
+            else fields[c]
+            for c in cols
+        ]
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE jobs SET {', '.join(c + ' = ?' for c in cols)} WHERE id = ?",
+                (*values, job_id),
+            )
+
+    def cancel_queued(self, job_id: int) -> bool:
+        """Cancel a job nobody has claimed yet."""
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "UPDATE jobs SET state = ?, finished_at = ? WHERE id = ? AND state = ?",
+                (jobs.CANCELLED, time.time(), job_id, jobs.QUEUED),
+            )
+            return cur.rowcount == 1
+
+    def get(self, job_id: int) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return _row(row)
+
+    def unfinished(
+        self, worker: int | None = None, origin: str | None = None
+    ) -> list[dict]:
+        sql = f"SELECT * FROM jobs WHERE state NOT IN ({', '.join('?' * len(_FINAL))})"
+        params: list = list(_FINAL)
+        if worker is not None:
+            sql += " AND worker = ?"
+            params.append(worker)
+        if origin is not None:
+            sql += " AND origin = ?"
+            params.append(origin)
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY priority, id", params)
+            return [_row(r) for r in rows.fetchall()]
+
+    def requeue(self, job_id: int):
+        """Back to the queue; a known prediction_id is kept for resuming."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, worker = NULL WHERE id = ?",
+                (jobs.QUEUED, job_id),
+            )
+
+    def purge(self, older_than_s: float):
+        """Drop finished jobs older than the given age."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"DELETE FROM jobs WHERE state IN ({', '.join('?' * len(_FINAL))})"
+                " AND finished_at < ?",
+                (*_FINAL, time.time() - older_than_s),
+            )
+
+
+class Recorder:
+    """JobQueue subscriber that mirrors attached jobs of one front-end
+    (app, cli) into the job table."""
+
+    def __init__(self, db: JobDB, origin: str):
+        self.db = db
+        self.origin = origin
+        self._rows: dict[int, int] = {}  # Job.id -> jobs.id в базе
+
+    def attach(self, job: jobs.Job, **context) -> int:
+        """Start recording `job`; call right before create, when the input
+        is final."""
+        row_id = self.db.add(
+            job.model,
+            job.input,
+            job.priority,
+            origin=self.origin,
+            state=jobs.CREATING,
+            context=context,
+        )
+        self._rows[job.id] = row_id
+        return row_id
+
+    def adopt(self, job: jobs.Job, row_id: int):
+        """Continue recording into an existing row (resumed job)."""
+        self._rows[job.id] = row_id
+
+    def __call__(self, job: jobs.Job):
+        row_id = self._rows.get(job.id)
+        if row_id is None:
+            return
+        fields = {
+            "state": job.state,
+            "status": job.status,
+            "prediction_id": job.prediction_id,
+            "error": job.error,
+        }
+        if job.finished:
+            fields["finished_at"] = job.finished_at
+            if isinstance(job.result, str):
+                fields["result"] = {"text": job.result}
+            self._rows.pop(job.id, None)
+        self.db.update(row_id, **fields)
+
+
+class SharedCache(_DB):
+    """Small TTL key/value cache shared by all processes."""
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM cache WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, value, ttl: float = CACHE_TTL):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache(key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time() + ttl),
+            )
+
+    def expire(self):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM cache WHERE expires_at <= ?", (time.time(),)
+            )
+
+
+def _row(row) -> dict | None:
+    if row is None:
+        return None
+    d = dict(row)
+    d["input"] = json.loads(d["input"])
+    for k in ("result", "context"):
+        if d.get(k):
+            d[k] = json.loads(d[k])
+    return d
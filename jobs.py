@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Очередь задач на отправку: фиксированный пул воркеров вместо потока на
+каждый клик. У задачи есть состояние, приоритет и возможность отмены;
+подписчики получают уведомление при каждом изменении задачи.
+
+Колбэки подписчиков вызываются из потоков пула — UI должен сам
+перекинуть обновление в Tk-поток (after).
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+
+import logs
+
+QUEUED = "queued"
+CREATING = "creating"
+RUNNING = "running"
+UPLOADING = "uploading"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINAL_STATES = (DONE, FAILED, CANCELLED)
+MAX_WORKERS = int(os.getenv("AIHUB_MAX_WORKERS", "3"))
+
+log = logs.get_logger("jobs")
+
+
+@dataclass
+class Job:
+    id: int
+    model: str
+    input: dict
+    priority: int = 0
+    state: str = QUEUED
+    prediction_id: str | None = None
+    status: str = ""  # последний статус prediction от провайдера
+    prompt_tokens: int | None = None  # оценка входа (контекст + промпт)
+    result: object = None
+    error: str | None = None
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished_at or time.time()
+        return end - (self.started_at or self.created_at)
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINAL_STATES
+
+
+class JobQueue:
+    """Fixed-size worker pool fed from a priority queue.
+
+    runner(job, queue) performs the work and may call queue.set_state();
+    it should check job.cancel_event. Lower priority value runs first,
+    ties run in submission order."""
+
+    def __init__(self, max_workers: int = MAX_WORKERS):
+        self.max_workers = max(1, max_workers)
+        self._cv = threading.Condition()
+        self._heap: list[tuple[int, int, Job, object]] = []
+        self._seq = itertools.count()
+        self._ids = itertools.count(1)
+        self._jobs: dict[int, Job] = {}
+        self._listeners: list = []
+        self._threads: list[threading.Thread] = []
+        self._closed = False
+
+    # ---- public ----
+    def subscribe(self, callback):
+        self._listeners.append(callback)
+
+    def submit(self, model: str, input: dict, runner, priority: int = 0) -> Job:
+        job = Job(id=next(self._ids), model=model, input=input, priority=priority)
+        with self._cv:
+            self._jobs[job.id] = job
+            heapq.heappush(self._heap, (priority, next(self._seq), job, runner))
+            self._ensure_workers()
+            self._cv.notify()
+        self._emit(job)
+        return job
+
+    def cancel(self, job_id: int) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None or job.finished:
+            return False
+        job.cancel_event.set()
+        if job.state == QUEUED:
+            # воркер пропустит её при выборке
+            self.set_state(job, CANCELLED)
+        return True
+
+    def prioritize(self, job_id: int, priority: int = -1):
+        """Move a queued job ahead of the others."""
+        with self._cv:
+            for i, (_, seq, job, runner) in enumerate(self._heap):
+                if job.id == job_id:
+                    job.priority = priority
+                    self._heap[i] = (priority, seq, job, runner)
+                    heapq.heapify(self._heap)
+                    break
+            else:
+                return
+        self._emit(job)
+
+    def set_state(self, job: Job, state: str, **changes):
+        for k, v in changes.items():
+            setattr(job, k, v)
+        if job.state != state:
+            log.info(
+                "задача",
+                extra={
+                    "job": job.id,
+                    "stage": state,
+                    "model": job.model,
+                    "prediction_id": job.prediction_id,
+                    "error": job.error,
+                },
+            )
+        job.state = state
+        if state in FINAL_STATES and job.finished_at is None:
+            job.finished_at = time.time()
+        self._emit(job)
+
+    def jobs(self) -> list[Job]:
+        return list(self._jobs.values())
+
+    def forget(self, job_id: int):
+        job = self._jobs.get(job_id)
+        if job is not None and job.finished:
+            del self._jobs[job_id]
+
+    def shutdown(self):
+        with self._cv:
+            self._closed = True
+            self._cv.notify_all()
+
+    # ---- internals ----
+    def _ensure_workers(self):
+        # потоки создаются по мере надобности, но не больше max_workers
+        self._threads = [t for t in self._threads if t.is_alive()]
+        busy = sum(1 for j in self._jobs.values() if j.state not in FINAL_STATES)
+        while len(self._threads) < min(self.max_workers, busy):
+            t = threading.Thread(
+                target=self._worker,
+                daemon=True,
+                name=f"job-worker-{len(self._threads) + 1}",
+            )
+            self._threads.append(t)
+            t.start()
+
+    def _worker(self):
+        while True:
+            with self._cv:
+                while not self._heap and not self._closed:
+                    self._cv.wait()
+                if self._closed:
+                    return
+                _, _, job, runner = heapq.heappop(self._heap)
+            if job.cancel_event.is_set() or job.finished:
+                continue
+            job.started_at = time.time()
+            try:
+                runner(job, self)
+            except Exception as e:
+                if not job.finished:
+                    self.set_state(job, FAILED, error=str(e))
+            else:
+                if not job.finished:
+                    self.set_state(job, DONE)
+
+    def _emit(self, job: Job):
+        for cb in list(self._listeners):
+            try:
+                cb(job)
+            except Exception:
+                pass
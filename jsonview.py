@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Потоковый pretty-print больших структурных ответов (сегменты, эмбеддинги,
+трассы tool calls) вместо json.dumps(indent=2) целиком.
+
+- iter_pretty() — генератор кусков текста в формате json.dumps(indent=2);
+  память зависит от глубины вложенности, а не от размера ответа;
+- длинные массивы чисел (эмбеддинги) сворачиваются в одну строку:
+  первые элементы, длина, min/max;
+- PrettyStream отдаёт текст страницами по байтовому бюджету
+  (AIHUB_JSON_BUDGET_KB), следующая страница — по «Загрузить ещё».
+"""
+import json
+import os
+
+JSON_BUDGET = int(os.getenv("AIHUB_JSON_BUDGET_KB", "256")) * 1024
+COLLAPSE_NUMBERS = 32  # длиннее — массив чисел сворачивается
+NUMBERS_SHOWN = 8
+
+
+def _is_number(x) -> bool:
+    return isinstance(x, (int, float)) and not isinstance(x, bool)
+
+
+def _scalar(x) -> str:
+    return json.dumps(x, ensure_ascii=False)
+
+
+def _collapsed_numbers(arr: list) -> str:
+    head = ", ".join(_scalar(x) for x in arr[:NUMBERS_SHOWN])
+    return (
+        f"[{head}, … ]  // {len(arr)} чисел,"
+        f" min {min(arr):.4g}, max {max(arr):.4g}"
+    )
+
+
+def iter_pretty(obj, indent: int = 2, collapse_numbers: int = COLLAPSE_NUMBERS):
+    """Yield the pretty-printed JSON of obj in small chunks.
+
+    Iterative (explicit stack), so deep or huge payloads neither recurse
+    nor build one big string."""
+    pad = " " * indent
+    # стек: (итератор по элементам, уровень, это dict?, первый ли элемент)
+    stack: list[list] = []
+
+    def open_container(value, level):
+        if isinstance(value, dict):
+            if not value:
+                return "{}", None
+            return "{", [iter(value.items()), level + 1, True, True]
+        if isinstance(value, (list, tuple)):
+            if not value:
+                return "[]", None
+            if (
+                collapse_numbers
+                and len(value) > collapse_numbers
+                and all(_is_number(x) for x in value)
+            ):
+                return _collapsed_numbers(value), None
+            return "[", [iter(value), level + 1, False, True]
+        try:
+            return _scalar(value), None
+        except (TypeError, ValueError):
+            return _scalar(str(value)), None
+
+    text, frame = open_container(obj, 0)
+    yield text
+    if frame is not None:
+        stack.append(frame)
+    while stack:
+        frame = stack[-1]
+        it, level, is_dict, first = frame
+        try:
+            item = next(it)
+        except StopIteration:
+            stack.pop()
+            yield "\n" + pad * (level - 1) + ("}" if is_dict else "]")
+            continue
+        sep = "\n" if first else ",\n"
+        frame[3] = False
+        if is_dict:
+            key, value = item
+            prefix = f"{sep}{pad * level}{_scalar(str(key))}: "
+        else:
+            value = item
+            prefix = sep + pad * level
+        text, child = open_container(value, level)
+        yield prefix + text
+        if child is not None:
+            stack.append(child)
+
+
+class PrettyStream:
+    """Budgeted pages of a pretty-printed payload."""
+
+    def __init__(self, obj, budget: int = JSON_BUDGET):
+        self.budget = budget
+        self._gen = iter_pretty(obj)
+        self._pending = ""
+        self.exhausted = False
+        self.shown_bytes = 0
+
+    def next_page(self) -> str:
+        parts = [self._pending] if self._pending else []
+        size = len(self._pending.encode("utf-8"))
+        self._pending = ""
+        for chunk in self._gen:
+            n = len(chunk.encode("utf-8"))
+            if size + n > self.budget and size > 0:
+                self._pending = chunk
+                break
+            parts.append(chunk)
+            size += n
+        else:
+            self.exhausted = True
+        self.shown_bytes += size
+        return "".join(parts)
+
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный прогон клиентского кода против fake_replicate.py.
+
+Сценарии повторяют настоящие пути вызовов:
+    cli    — как main.py: create → wait_for (поллинг) → classify;
+    gui    — как главное окно: JobQueue, create → wait_for со сменой
+             состояний задачи → classify → render_text;
+    stream — как окно сравнения: JobQueue, predictions.run() по SSE.
+
+Отчёт: пропускная способность, перцентили задержки (и TTFT для stream),
+число вызовов API по данным сервера, процессорное время и пик памяти
+клиента. Поддельный сервер запускается отдельным процессом, чтобы его
+работа не попадала в замер; --base-url — взять уже запущенный.
+В S3 ничего не копируется.
+
+    python loadtest.py --flow gui -n 500 -c 200 --output mix --fail-rate 0.05
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import fake_replicate
+import profiling
+from profiling import percentile
+
+FLOWS = ("cli", "gui", "stream")
+
+
+@dataclass
+class Sample:
+    status: str  # succeeded / failed / canceled / error
+    latency: float
+    ttft: float | None = None
+    error: str | None = None
+
+
+def _peak_rss_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return kb / 1024 if sys.platform != "darwin" else kb / 1024 / 1024
+
+
+# ---------------- сервер ----------------
+def spawn_server(args) -> tuple[subprocess.Popen, str]:
+    cmd = [
+        sys.executable,
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_replicate.py"),
+        "--port",
+        "0",
+        "--queue",
+        args.queue,
+        "--run",
+        args.run,
+        "--fail-rate",
+        str(args.fail_rate),
+        "--error-rate",
+        str(args.error_rate),
+        "--throttle-rate",
+        str(args.throttle_rate),
+        "--output",
+        args.output,
+        "--tokens",
+        str(args.tokens),
+        "--media-count",
+        str(args.media_count),
+    ]
+    if args.no_stream:
+        cmd.append("--no-stream")
+    if args.seed is not None:
+        cmd += ["--seed", str(args.seed)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    url = proc.stdout.readline().strip()
+    if not url.startswith("http"):
+        proc.kill()
+        raise SystemExit("не удалось запустить fake_replicate.py")
+    return proc, url
+
+
+def server_call(base_url: str, path: str, method: str = "GET") -> dict:
+    req = urllib.request.Request(base_url + path, method=method, data=None)
+    with urllib.request.urlopen(req, timeout=10) as resp:
+        return json.loads(resp.read())
+
+
+# ---------------- сценарии ----------------
+def cli_flow(client, model: str, input: dict, cancel_event) -> Sample:
+    with profiling.request_profile(model):
+        return _cli_flow(client, model, input, cancel_event)
+
+
+def _cli_flow(client, model: str, input: dict, cancel_event) -> Sample:
+    import outputs
+    import predictions
+
+    t0 = time.perf_counter()
+    try:
+        prediction = client.predictions.create(model=model, input=input)
+        profiling.tag(prediction_id=prediction.id)
+        prediction = predictions.wait_for(
+            client, prediction, cancel_event=cancel_event
+        )
+        if prediction.status == "succeeded":
+            outputs.classify(prediction.output)
+        return Sample(prediction.status, time.perf_counter() - t0)
+    except predictions.Cancelled:
+        return Sample("canceled", time.perf_counter() - t0)
+    except Exception as e:
+        return Sample("error", time.perf_counter() - t0, error=str(e))
+
+
+def gui_runner(client, samples: list, stream: bool):
+    """JobQueue runner shaped like the app's main/compare workers."""
+    import jobs
+    import outputs
+    import predictions
+
+    def run_job(job, queue):
+        with profiling.request_profile(job.model, job=job.id):
+            sample = _run_job(job, queue)
+        # состояние — после записи профиля, иначе прогон завершится раньше
+        samples.append(sample)
+        state = jobs.DONE if sample.status == "succeeded" else jobs.FAILED
+        queue.set_state(job, state)
+
+    def _run_job(job, queue):
+        t0 = time.perf_counter()
+        ttft = None
+        try:
+            if stream:
+                queue.set_state(job, jobs.RUNNING)
+                chunks = []
+                res = predictions.run(
+                    client,
+                    job.model,
+                    job.input,
+                    on_text=chunks.append,
+                    cancel_event=job.cancel_event,
+                )
+                prediction, ttft = res.prediction, res.ttft
+            else:
+                queue.set_state(job, jobs.CREATING)
+                prediction = client.predictions.create(
+                    model=job.model, input=job.input
+                )
+                queue.set_state(
+                    job,
+                    jobs.RUNNING,
+                    prediction_id=prediction.id,
+                    status=prediction.status,
+                )
+                prediction = predictions.wait_for(
+                    client,
+                    prediction,
+                    on_status=lambda p: queue.set_state(
+                        job, jobs.RUNNING, status=p.status
+                    ),
+                    cancel_event=job.cancel_event,
+                )
+            if prediction.status == "succeeded":
+                outputs.render_text(outputs.classify(prediction.output))
+            sample = Sample(prediction.status, time.perf_counter() - t0, ttft)
+        except predictions.Cancelled:
+            sample = Sample("canceled", time.perf_counter() - t0)
+        except Exception as e:
+            sample = Sample("error", time.perf_counter() - t0, error=str(e))
+        return sample
+
+    return run_job
+
+
+def run_flow(flow: str, args) -> tuple[list[Sample], float]:
+    import jobs
+    import predictions
+
+    client = predictions.get_client()
+    rng = random.Random(args.seed)
+    input = {"prompt": "How is perplexity measured?", "max_tokens": args.tokens}
+    samples: list[Sample] = []
+    t0 = time.perf_counter()
+    if flow == "cli":
+        cancels = [threading.Event() for _ in range(args.n)]
+        with ThreadPoolExecutor(max_workers=args.c) as pool:
+            futures = [
+                pool.submit(cli_flow, client, args.model, input, ev) for ev in cancels
+            ]
+            _schedule_cancels(rng, args, [ev.set for ev in cancels])
+            samples = [f.result() for f in futures]
+    else:
+        queue = jobs.JobQueue(max_workers=args.c)
+        done = threading.Semaphore(0)
+        queue.subscribe(lambda job: job.finished and done.release())
+        runner = gui_runner(client, samples, stream=flow == "stream")
+        submitted = [
+            queue.submit(args.model, dict(input), runner) for _ in range(args.n)
+        ]
+        _schedule_cancels(
+            rng, args, [lambda j=j: queue.cancel(j.id) for j in submitted]
+        )
+        for _ in submitted:
+            done.acquire()
+        queue.shutdown()
+        # отменённые до старта в samples не попали
+        samples += [Sample("canceled", 0.0)] * (args.n - len(samples))
+    return samples, time.perf_counter() - t0
+
+
+def _schedule_cancels(rng, args, cancel_fns):
+    for fn in cancel_fns:
+        if rng.random() < args.cancel_rate:
+            t = threading.Timer(rng.uniform(0.1, args.cancel_after), fn)
+            t.daemon = True
+            t.start()
+
+
+# ---------------- отчёт ----------------
+def report(flow: str, args, samples, wall, cpu, calls) -> dict:
+    lat = [s.latency for s in samples if s.status == "succeeded"]
+    ttft = [s.ttft for s in samples if s.ttft is not None]
+    by_status: dict[str, int] = {}
+    for s in samples:
+        by_status[s.status] = by_status.get(s.status, 0) + 1
+    errors = sorted({s.error for s in samples if s.error})[:5]
+    n_calls = sum(v for k, v in calls.items() if not k.endswith(" file"))
+    return {
+        "flow": flow,
+        "predictions": len(samples),
+        "concurrency": args.c,
+        "wall_s": round(wall, 3),
+        "throughput_per_s": round(len(samples) / wall, 2) if wall else None,
+        "by_status": by_status,
+        "latency_s": _pcts(lat),
+        "ttft_s": _pcts(ttft),
+        "api_calls": calls,
+        "api_calls_per_prediction": round(n_calls / max(1, len(samples)), 2),
+        "client_cpu_s": round(cpu, 2),
+        "client_cpu_pct": round(100 * cpu / wall, 1) if wall else None,
+        "client_peak_rss_mb": _round(_peak_rss_mb()),
+        "errors": errors,
+    }
+
+
+def _round(x, nd=1):
+    return None if x is None else round(x, nd)
+
+
+def _pcts(values: list[float]) -> dict:
+    if not values:
+        return {}
+    out = {f"p{q}": _round(percentile(values, q), 3) for q in (50, 90, 95, 99)}
+    out["max"] = _round(max(values), 3)
+    return out
+
+
+def print_report(r: dict):
+    print(
+        f"Сценарий {r['flow']}: {r['predictions']} предсказаний,"
+        f" параллельно {r['concurrency']}, за {r['wall_s']:.1f} c"
+    )
+    print(f"  пропускная способность: {r['throughput_per_s']} /c")
+    print("  итог: " + ", ".join(f"{k} {v}" for k, v in r["by_status"].items()))
+    for title, key in (("задержка", "latency_s"), ("TTFT", "ttft_s")):
+        if r[key]:
+            print(f"  {title}, c: " + " ".join(f"{k} {v}" for k, v in r[key].items()))
+    calls = ", ".join(f"{k} {v}" for k, v in sorted(r["api_calls"].items()))
+    print(f"  вызовы API: {calls}")
+    print(f"  вызовов на предсказание: {r['api_calls_per_prediction']}")
+    rss = r["client_peak_rss_mb"]
+    print(
+        f"  клиент: CPU {r['client_cpu_s']} c ({r['client_cpu_pct']}% ядра)"
+        + (f", пик RSS {rss} МБ" if rss is not None else "")
+    )
+    for e in r["errors"]:
+        print(f"  ошибка: {e}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Нагрузочный прогон клиента")
+    ap.add_argument("--flow", default="gui", choices=FLOWS + ("all",))
+    ap.add_argument("-n", type=int, default=200, help="сколько предсказаний")
+    ap.add_argument("-c", type=int, default=100, help="сколько параллельно")
+    ap.add_argument("--model", default="fake/model")
+    ap.add_argument("--poll", type=float, default=0.25, help="интервал поллинга")
+    ap.add_argument("--cancel-rate", type=float, default=0.0)
+    ap.add_argument("--cancel-after", type=float, default=1.0)
+    ap.add_argument("--base-url", help="уже запущенный fake_replicate.py")
+    ap.add_argument("--json", help="записать отчёт в файл")
+    fake_replicate.add_config_args(ap)
+    args = ap.parse_args(argv)
+
+    proc = None
+    base_url = args.base_url
+    if base_url is None:
+        proc, base_url = spawn_server(args)
+    # до первого импорта predictions: клиент и интервал читаются из env
+    os.environ["REPLICATE_BASE_URL"] = base_url
+    os.environ.setdefault("REPLICATE_API_KEY", "fake")
+    os.environ["REPLICATE_POLL_INTERVAL"] = str(args.poll)
+    reports = []
+    try:
+        for flow in FLOWS if args.flow == "all" else (args.flow,):
+            server_call(base_url, "/__reset", "POST")
+            cpu0 = time.process_time()
+            samples, wall = run_flow(flow, args)
+            cpu = time.process_time() - cpu0
+            calls = server_call(base_url, "/__stats")["calls"]
+            r = report(flow, args, samples, wall, cpu, calls)
+            print_report(r)
+            reports.append(r)
+    finally:
+        if proc is not None:
+            proc.terminate()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(
+                {"args": vars(args), "reports": reports}, f, ensure_ascii=False, indent=2
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
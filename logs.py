@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Структурные логи вместо print в фоновых потоках.
+
+- записи уходят в очередь (QueueHandler), в stderr/файл их пишет один
+  поток QueueListener — воркеры не ждут вывода;
+- формат — JSON по строке на запись (AIHUB_LOG_FORMAT=text — читаемый);
+- контекст запроса (prediction_id, model, job, stage) хранится в
+  contextvars и добавляется к каждой записи из этого потока;
+- частые события (тики поллинга) прореживаются: из записей с
+  extra={"sample": "poll"} пишется каждая AIHUB_LOG_POLL_SAMPLE-я
+  для каждого prediction, первая — всегда.
+
+    AIHUB_LOG_LEVEL=INFO  AIHUB_LOG_FILE=...  AIHUB_LOG_FORMAT=json|text
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+LOG_LEVEL = os.getenv("AIHUB_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("AIHUB_LOG_FORMAT", "json")
+LOG_FILE = os.getenv("AIHUB_LOG_FILE")
+POLL_SAMPLE = max(1, int(os.getenv("AIHUB_LOG_POLL_SAMPLE", "10")))
+ROOT = "aihub"
+
+_context: contextvars.ContextVar = contextvars.ContextVar("aihub_log", default=None)
+_setup_lock = threading.Lock()
+_listener: logging.handlers.QueueListener | None = None
+_handler: logging.Handler | None = None
+
+# атрибуты LogRecord, которые не считаются полями записи
+_STANDARD = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+# ---------------- контекст ----------------
+@contextmanager
+def context(**fields):
+    """Fields added to every record logged inside the block (this thread)."""
+    token = _context.set({**(_context.get() or {}), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def bind(**fields):
+    """Add fields to the current context (e.g. prediction_id after create)."""
+    ctx = _context.get()
+    if ctx is None:
+        _context.set(dict(fields))
+    else:
+        ctx.update(fields)
+
+
+class _ContextFilter(logging.Filter):
+    # работает в потоке, который пишет запись, — там и живёт контекст
+    def filter(self, record):
+        for k, v in (_context.get() or {}).items():
+            if not hasattr(record, k):
+                setattr(record, k, v)
+        return True
+
+
+class _SampleFilter(logging.Filter):
+    def __init__(self, every: int = POLL_SAMPLE):
+        super().__init__()
+        self.every = every
+        self._counts: dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = getattr(record, "sample", None)
+        if key is None:
+            return True
+        k = (key, getattr(record, "prediction_id", None))
+        with self._lock:
+            n = self._counts.get(k, 0)
+            if len(self._counts) > 10000:
+                self._counts.clear()
+            self._counts[k] = n + 1
+        record.sample_every = self.every
+        return n % self.every == 0
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # текст и traceback собираем здесь, поля оставляем как есть
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+# ---------------- формат ----------------
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        out = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created))
+            + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for k, v in record.__dict__.items():
+            if k not in _STANDARD and k not in out:
+                out[k] = v
+        if record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        fields = " ".join(
+            f"{k}={v}" for k, v in record.__dict__.items() if k not in _STANDARD
+        )
+        line = (
+            f"{time.strftime('%H:%M:%S', time.localtime(record.created))}"
+            f" {record.levelname:<7} {record.name}: {record.getMessage()}"
+        )
+        if fields:
+            line += f"  [{fields}]"
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+
+# ---------------- настройка ----------------
+def setup(
+    level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, path: str | None = LOG_FILE
+):
+    """Install the queue handler on the 'aihub' logger (idempotent)."""
+    global _listener, _handler
+    with _setup_lock:
+        if _listener is not None:
+            return
+        formatter = TextFormatter() if fmt == "text" else JsonFormatter()
+        handlers = [logging.StreamHandler(sys.stderr)]
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            handlers.append(logging.FileHandler(path, encoding="utf-8"))
+        for h in handlers:
+            h.setFormatter(formatter)
+        q: queue.SimpleQueue = queue.SimpleQueue()
+        _handler = _QueueHandler(q)
+        _handler.addFilter(_ContextFilter())
+        _handler.addFilter(_SampleFilter())
+        root = logging.getLogger(ROOT)
+        root.setLevel(level)
+        root.addHandler(_handler)
+        root.propagate = False
+        _listener = logging.handlers.QueueListener(q, *handlers)
+        _listener.start()
+        atexit.register(shutdown)
+
+
+def shutdown():
+    """Flush queued records (registered with atexit)."""
+    global _listener, _handler
+    with _setup_lock:
+        if _listener is not None:
+            logging.getLogger(ROOT).removeHandler(_handler)
+            _listener.stop()
+            _listener = _handler = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    setup()
+    return logging.getLogger(f"{ROOT}.{name}")
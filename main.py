@@ -1,123 +1,164 @@
+import argparse
+import os
 import time
+
 from dotenv import load_dotenv
-import replicate
-import os
-from s3 import S3Client
-import asyncio
-
-load_dotenv()
-
-REPLICATE_API_KEY = os.getenv("REPLICATE_API_KEY")
-
-
-client = replicate.Client(api_token=REPLICATE_API_KEY)
-
-
-# --- Helper to detect Whisper-like output and extract transcription ---
-def _as_whisper_transcription(output):
-    """If output looks like Whisper (dict with 'transcription' and optional 'segments'),
-    return the transcription string; otherwise return None."""
-    if isinstance(output, dict):
-        t = output.get("transcription")
-        if isinstance(t, str) and t.strip():
-            return t
-    if isinstance(output, list) and output and isinstance(output[0], dict):
-        # sometimes models wrap single dict in a list
-        t = output[0].get("transcription")
-        if isinstance(t, str) and t.strip():
-            return t
-    return None
-
-
-async def upload_to_s3(file_path=None, file_url=None, prediction_id=None):
-    s3_client = S3Client()
-    url = await s3_client.upload_file(file_path, file_url, prediction_id)
-    return url
-
-
-# 1. Создаем prediction
-prediction = client.predictions.create(
-    model="ibm-granite/granite-3.3-8b-instruct",
-    input={
-        "tools": [],
-        "top_k": 50,
-        "top_p": 0.9,
-        "prompt": "How is perplexity measured for LLMs and why is it useful?",
-        "stream": False,
-        "messages": [],
-        "documents": [],
-        "max_tokens": 512,
-        "min_tokens": 0,
-        "temperature": 0.6,
-        "presence_penalty": 0,
-        "frequency_penalty": 0,
-        "chat_template_kwargs": {},
-        "add_generation_prompt": True,
-    },
-)
-
-# prediction.status будет "starting", "processing", "succeeded" и т.п.
-while prediction.status not in ("succeeded", "failed"):
-    print("Статус:", prediction.status)
-    time.sleep(1)
-    prediction = client.predictions.get(prediction.id)
-
-if prediction.status == "succeeded":
+
+import jobdb
+import jobs
+import logs
+import outputs
+import predictions
+import preview
+import profiling
+
+EXAMPLE_MODEL = "ibm-granite/granite-3.3-8b-instruct"
+EXAMPLE_INPUT = {
+    "tools": [],
+    "top_k": 50,
+    "top_p": 0.9,
+    "prompt": "How is perplexity measured for LLMs and why is it useful?",
+    "stream": False,
+    "messages": [],
+    "documents": [],
+    "max_tokens": 512,
+    "min_tokens": 0,
+    "temperature": 0.6,
+    "presence_penalty": 0,
+    "frequency_penalty": 0,
+    "chat_template_kwargs": {},
+    "add_generation_prompt": True,
+}
+
+
+def print_preview(info):
+    line = f"Превью: {info.summary} ({info.elapsed:.1f} c)"
+    if info.poster:
+        line += f", кадр: {info.poster}"
+    print(line)
+
+
+def print_output(prediction):
     out = prediction.output
+    items = outputs.classify(out)
     # --- Whisper-specific: if model returned a dict with 'transcription' ---
-    whisper_text = _as_whisper_transcription(out)
-    if whisper_text is not None:
+    if outputs.as_whisper_transcription(out) is not None:
         print("\n=== TEXT OUTPUT (Whisper transcription) ===")
-        print(whisper_text)
-    else:
-        # Если список и внутри ссылки — пройдёмся по всем
-        urls = []
-        if isinstance(out, list):
-            for item in out:
-                if isinstance(item, str) and item.startswith(("http://", "https://")):
-                    urls.append(item)
-            # если список и там только один элемент-строка
-            if not urls and len(out) == 1 and isinstance(out[0], str):
-                urls = [out[0]]
-
-        elif isinstance(out, str) and out.startswith(("http://", "https://")):
-            urls = [out]
-
-        if urls:
-            # определяем тип по расширению
-            for idx, u in enumerate(urls):
-                ext = os.path.splitext(u.split("?")[0])[1].lower()
-                if ext in (
-                    ".png",
-                    ".jpg",
-                    ".jpeg",
-                    ".webp",
-                    ".gif",
-                    ".bmp",
-                    ".tiff",
-                    ".mp4",
-                    ".mov",
-                    ".mkv",
-                    ".avi",
-                    ".webm",
-                    ".mp3",
-                    ".wav",
-                    ".m4a",
-                    ".flac",
-                    ".ogg",
-                ):
-                    pid = f"{prediction.id}-{idx}" if len(urls) > 1 else prediction.id
-                    presigned_url = asyncio.run(upload_to_s3(None, u, pid))
-                    print(f"Presigned URL: {presigned_url}")
-                else:
-                    # считаем это текстовым
-                    print(u)
+        print(items[0].text)
+        return
+    # медиа определяем по содержимому (первые байты), а не по расширению;
+    # превью (длительность, постер) — range-запросами, параллельно с копией в S3
+    for it in items:
+        if it.kind in (outputs.VIDEO, outputs.AUDIO):
+            preview.submit(it.url, it.kind, print_preview)
+    outputs.persist(items, prediction.id)
+    for it in items:
+        if it.is_media:
+            if it.persisted_url:
+                print(f"Presigned URL: {it.persisted_url}")
+            else:
+                print(f"Не удалось сохранить в S3: {it.url}")
         else:
-            # fallback: выводим как текст
-            print(out)
+            # считаем это текстовым
+            print(it.display)
 
-else:
-    print("Ошибка:", prediction.error)
 
-print("\n--- METRICS ---")
-print(prediction.metrics)  # тут input_token_count, output_token_count и пр.
+def finish(db: jobdb.JobDB, row_id: int, prediction):
+    """Print/persist a finished prediction and close its journal row."""
+    if prediction.status == "succeeded":
+        # S3-ключи от prediction.id: после сбоя загрузка перезапишет их же
+        db.update(row_id, state=jobs.UPLOADING, status=prediction.status)
+        print_output(prediction)
+        db.update(row_id, state=jobs.DONE, finished_at=time.time())
+    else:
+        print("Ошибка:", prediction.error)
+        db.update(
+            row_id,
+            state=jobs.FAILED,
+            status=prediction.status,
+            error=str(prediction.error),
+            finished_at=time.time(),
+        )
+
+
+def resume_unfinished(db: jobdb.JobDB):
+    """Finish predictions a previous run left behind (closed terminal,
+    crash): poll them by id and collect outputs — nothing is re-created."""
+    for row in db.unfinished(origin=jobdb.CLI):
+        if not row["prediction_id"]:
+            # create мог и не дойти до Replicate — повторять не будем
+            db.update(
+                row["id"],
+                state=jobs.FAILED,
+                error="прервано до создания prediction",
+                finished_at=time.time(),
+            )
+            continue
+        print(f"Продолжаю {row['model']} ({row['prediction_id']}) из прошлого запуска")
+        try:
+            with logs.context(model=row["model"], resumed=True):
+                res = predictions.resume(predictions.get_client(), row["prediction_id"])
+        except Exception as e:
+            # запись остаётся — попробуем при следующем запуске
+            print("Не удалось продолжить:", e)
+            continue
+        finish(db, row["id"], res.prediction)
+
+
+def run(
+    model: str = EXAMPLE_MODEL,
+    input: dict | None = None,
+    db: jobdb.JobDB | None = None,
+):
+    db = db or jobdb.JobDB()
+    input = input or EXAMPLE_INPUT
+    # профиль запроса пишется только при AIHUB_PROFILE_REQUESTS / --profile
+    with profiling.request_profile(model):
+        client = predictions.get_client()
+        # запись в журнале — до create: если процесс оборвётся, следующий
+        # запуск доведёт этот prediction, а не создаст второй
+        row_id = db.add(model, input, origin=jobdb.CLI, state=jobs.CREATING)
+        # 1. Создаем prediction
+        prediction = client.predictions.create(model=model, input=input)
+        db.update(
+            row_id,
+            state=jobs.RUNNING,
+            prediction_id=prediction.id,
+            status=prediction.status,
+        )
+        profiling.tag(prediction_id=prediction.id)
+
+        # prediction.status будет "starting", "processing", "succeeded" и т.п.;
+        # смены статуса и тики поллинга пишутся в структурный лог (stderr)
+        with logs.context(model=model, prediction_id=prediction.id):
+            prediction = predictions.wait_for(client, prediction)
+
+        finish(db, row_id, prediction)
+
+    print("\n--- METRICS ---")
+    print(prediction.metrics)  # тут input_token_count, output_token_count и пр.
+    return prediction
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Пример headless-запуска")
+    ap.add_argument(
+        "--profile",
+        action="store_true",
+        help="записать cProfile + tracemalloc профиль запроса",
+    )
+    ap.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="не доводить незавершённые запросы прошлых запусков",
+    )
+    args = ap.parse_args()
+    if args.profile:
+        profiling.enable_requests()
+    load_dotenv()
+    if not os.getenv("REPLICATE_API_KEY"):
+        raise SystemExit("REPLICATE_API_KEY не задан")
+    journal = jobdb.JobDB()
+    if not args.no_resume:
+        resume_unfinished(journal)
+    run(db=journal)
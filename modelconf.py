@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Конфиги моделей (models_conf/*/*.json) и сборка input для API — без UI,
+общие для окна и HTTP-сервиса.
+
+effective_input() берёт дефолты из конфига (включая скрытые поля) и
+поверх них — значения пользователя: переменные Tk из панели настроек
+или обычные значения из JSON-запроса.
+"""
+import glob
+import json
+import os
+
+MODELS_DIR = os.getenv(
+    "AIHUB_MODELS_DIR", os.path.join(os.path.dirname(__file__), "models_conf")
+)
+
+# ---- coercion helpers (bring types to what API expects) ----
+JSON_LIKE_KEYS = {
+    "tools",
+    "messages",
+    "documents",
+    "chat_template_kwargs",
+    "image_input",
+}
+
+
+def _parse_json_if_needed(val):
+    if isinstance(val, (dict, list)):
+        return val
+    if isinstance(val, str):
+        s = val.strip()
+        if (s.startswith("[") and s.endswith("]")) or (
+            s.startswith("{") and s.endswith("}")
+        ):
+            try:
+                return json.loads(s)
+            except Exception:
+                return val
+    return val
+
+
+def coerce_value(ctrl_type: str, key: str, val):
+    """Coerce a single value based on control type and known json-like keys."""
+    if ctrl_type == "checkbox":
+        if isinstance(val, bool):
+            return val
+        return str(val).strip().lower() in ("1", "true", "yes", "on")
+    if ctrl_type == "slider":
+        try:
+            return float(val)
+        except Exception:
+            return val
+    if ctrl_type == "int":
+        try:
+            return int(float(val))
+        except Exception:
+            return val
+    # text/select: keep string, but parse JSON for known keys
+    if key in JSON_LIKE_KEYS:
+        return _parse_json_if_needed(val)
+    return val
+
+
+def _raw(var):
+    # переменная Tk (StringVar/DoubleVar/...) или уже готовое значение
+    get = getattr(var, "get", None)
+    if callable(get) and not isinstance(var, dict):
+        return get()
+    return var
+
+
+def effective_input(cfg: dict | None, values: dict | None = None) -> dict:
+    """Config defaults (incl. hidden) overridden by user values (Tk variables
+    or plain values), coerced to the types the API expects."""
+    result = {}
+    controls = (cfg or {}).get("controls", [])
+
+    # 1) положим дефолты (включая скрытые) с приведением типов
+    for c in controls:
+        k = c.get("key")
+        if not k:
+            continue
+        ctype = (c.get("type") or "text").lower()
+        default_val = c.get("default")
+        result[k] = coerce_value(ctype, k, default_val)
+
+    # 2) перезапишем значениями пользователя
+    for k, var in (values or {}).items():
+        cdesc = next((c for c in controls if c.get("key") == k), None)
+        ctype = (cdesc or {}).get("type", "text").lower()
+        try:
+            raw = _raw(var)
+            if isinstance(raw, bool) or ctype == "checkbox":
+                # "false" из JSON-запроса разберёт coerce_value
+                val = raw
+            elif ctype == "slider":
+                val = float(raw)
+            elif ctype == "int":
+                val = int(float(raw))
+            else:
+                val = raw
+        except Exception:
+            val = _raw(var)
+        result[k] = coerce_value(ctype, k, val)
+
+    return result
+
+
+def apply_prompt(payload: dict, text: str):
+    """Put the user's text into `prompt` if the model has it, else
+    `user_prompt` (same rule as the send button)."""
+    if text:
+        if "prompt" in payload:
+            payload["prompt"] = text
+        else:
+            payload["user_prompt"] = text
+
+
+def read_model_configs(dirpath: str) -> dict:
+    """Read all *.json model configs in a directory -> {model_id: cfg}.
+    Pure file I/O, safe to call off the Tk thread."""
+    found = {}
+    for path in glob.glob(os.path.join(dirpath, "*.json")):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                cfg = json.load(f)
+        except Exception:
+            continue
+        mid = cfg.get("model_id")
+        if not mid:
+            continue
+        found[mid] = cfg
+    return found
+
+
+def read_all(root: str = MODELS_DIR) -> dict:
+    """Configs from every kind subfolder (text, img, ...) of models_conf."""
+    found = {}
+    for sub in sorted(os.listdir(root)):
+        path = os.path.join(root, sub)
+        if os.path.isdir(path):
+            found.update(read_model_configs(path))
+    return found
@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+"""
+Единая классификация вывода prediction для GUI и headless-запусков.
+
+Тип ссылки определяется не по расширению в URL (у ссылок доставки его
+часто нет), а по сигнатуре первых байт: ranged GET на SNIFF_BYTES,
+результат кешируется по URL. Дальше вывод раскладывается на элементы:
+    media (image/video/audio/binary) — сохранить в S3, показать превью;
+    text/json                        — показать как текст.
+"""
+import base64
+import mimetypes
+import os
+import threading
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from urllib.parse import urlsplit
+
+import jsonview
+import logs
+import tracing
+
+SNIFF_BYTES = int(os.getenv("AIHUB_SNIFF_BYTES", "4096"))
+SNIFF_TIMEOUT = float(os.getenv("AIHUB_SNIFF_TIMEOUT", "10"))
+SNIFF_CACHE_SIZE = 2048
+SNIFF_WORKERS = 8
+
+log = logs.get_logger("outputs")
+
+IMAGE, VIDEO, AUDIO, TEXT, JSON, BINARY = (
+    "image",
+    "video",
+    "audio",
+    "text",
+    "json",
+    "binary",
+)
+MEDIA_KINDS = (IMAGE, VIDEO, AUDIO, BINARY)
+
+# запасной вариант, если сигнатура не распознана и сервер не дал Content-Type
+_EXT_KIND = {
+    ".png": IMAGE,
+    ".jpg": IMAGE,
+    ".jpeg": IMAGE,
+    ".webp": IMAGE,
+    ".gif": IMAGE,
+    ".bmp": IMAGE,
+    ".tiff": IMAGE,
+    ".mp4": VIDEO,
+    ".mov": VIDEO,
+    ".mkv": VIDEO,
+    ".avi": VIDEO,
+    ".webm": VIDEO,
+    ".mp3": AUDIO,
+    ".wav": AUDIO,
+    ".m4a": AUDIO,
+    ".flac": AUDIO,
+    ".ogg": AUDIO,
+    ".txt": TEXT,
+    ".json": JSON,
+}
+
+
+# ---- whisper / текст ----
+def as_whisper_transcription(output):
+    """If output looks like Whisper (dict with 'transcription' and optional
+    'segments'), return the transcription string; otherwise None."""
+    if isinstance(output, dict):
+        t = output.get("transcription")
+        if isinstance(t, str) and t.strip():
+            return t
+    if isinstance(output, list) and output and isinstance(output[0], dict):
+        # sometimes models wrap single dict in a list
+        t = output[0].get("transcription")
+        if isinstance(t, str) and t.strip():
+            return t
+    return None
+
+
+def format_prediction_output(output) -> str:
+    t = as_whisper_transcription(output)
+    if t is not None:
+        return t
+    if isinstance(output, list):
+        urls = extract_urls(output)
+        if urls:
+            return "\n".join(urls)
+        if len(output) == 1 and isinstance(output[0], str):
+            return output[0]
+    if isinstance(output, str):
+        return output
+    # без json.dumps целиком: первая страница в пределах бюджета
+    stream = jsonview.PrettyStream(output)
+    text = stream.next_page()
+    if not stream.exhausted:
+        text += "\n… (вывод обрезан)"
+    return text
+
+
+def _is_url(x) -> bool:
+    return isinstance(x, str) and x.startswith(("http://", "https://", "data:"))
+
+
+def extract_urls(output) -> list[str]:
+    if _is_url(output):
+        return [output]
+    if isinstance(output, list):
+        return [x for x in output if _is_url(x)]
+    return []
+
+
+# ---- сигнатуры ----
+def sniff_bytes(head: bytes) -> tuple[str | None, str | None]:
+    """(kind, mime) from the first bytes of a file, (None, None) if unknown."""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return IMAGE, "image/png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return IMAGE, "image/jpeg"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return IMAGE, "image/gif"
+    if head[:4] == b"RIFF" and len(head) >= 12:
+        sub = head[8:12]
+        if sub == b"WEBP":
+            return IMAGE, "image/webp"
+        if sub == b"WAVE":
+            return AUDIO, "audio/wav"
+        if sub == b"AVI ":
+            return VIDEO, "video/x-msvideo"
+    if head.startswith(b"BM") and len(head) >= 26:
+        return IMAGE, "image/bmp"
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        return IMAGE, "image/tiff"
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand in (b"M4A ", b"M4B "):
+            return AUDIO, "audio/mp4"
+        if brand == b"qt  ":
+            return VIDEO, "video/quicktime"
+        if brand in (b"avif", b"avis"):
+            return IMAGE, "image/avif"
+        if brand in (b"heic", b"heix", b"mif1"):
+            return IMAGE, "image/heic"
+        return VIDEO, "video/mp4"
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        if b"webm" in head[:64]:
+            return VIDEO, "video/webm"
+        return VIDEO, "video/x-matroska"
+    if head.startswith(b"OggS"):
+        if b"theora" in head[:64]:
+            return VIDEO, "video/ogg"
+        return AUDIO, "audio/ogg"
+    if head.startswith(b"fLaC"):
+        return AUDIO, "audio/flac"
+    if head.startswith(b"ID3") or head[:2] in (b"\xff\xfb", b"\xff\xf3", b"\xff\xf2"):
+        return AUDIO, "audio/mpeg"
+    if head.startswith(b"%PDF"):
+        return BINARY, "application/pdf"
+    if head.startswith((b"PK\x03\x04", b"\x1f\x8b", b"7z\xbc\xaf")):
+        return BINARY, "application/octet-stream"
+    if not head or b"\x00" in head:
+        return None, None
+    try:
+        text = head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # кусок мог оборваться посреди многобайтного символа
+        if e.start < len(head) - 4:
+            return None, None
+        text = head[: e.start].decode("utf-8")
+    if text.lstrip()[:1] in ("{", "["):
+        return JSON, "application/json"
+    return TEXT, "text/plain"
+
+
+def _kind_from_mime(mime: str | None) -> str | None:
+    if not mime:
+        return None
+    mime = mime.split(";")[0].strip().lower()
+    major = mime.split("/")[0]
+    if major in (IMAGE, VIDEO, AUDIO):
+        return major
+    if mime == "application/json" or mime.endswith("+json"):
+        return JSON
+    if major == "text":
+        return TEXT
+    if mime == "application/octet-stream":
+        return None  # ничего не говорит о содержимом
+    return BINARY
+
+
+@dataclass
+class Sniffed:
+    url: str
+    kind: str
+    mime: str | None = None
+    size: int | None = None  # полный размер, если сервер его сообщил
+    source: str = "magic"  # magic / header / extension
+
+
+_cache: "OrderedDict[str, Sniffed]" = OrderedDict()
+_cache_lock = threading.Lock()
+# общий для процессов кеш (get/put, см. jobdb.SharedCache); ставит pool.py
+shared_cache = None
+
+
+def _cached(url: str) -> Sniffed | None:
+    with _cache_lock:
+        hit = _cache.get(url)
+        if hit is not None:
+            _cache.move_to_end(url)
+            return hit
+    if shared_cache is not None and not url.startswith("data:"):
+        try:
+            found = shared_cache.get("sniff:" + url)
+        except Exception:
+            found = None  # кеш — только ускорение
+        if found is not None:
+            return _remember(Sniffed(**found), share=False)
+    return None
+
+
+def _remember(s: Sniffed, share: bool = True) -> Sniffed:
+    with _cache_lock:
+        _cache[s.url] = s
+        while len(_cache) > SNIFF_CACHE_SIZE:
+            _cache.popitem(last=False)
+    if share and shared_cache is not None and not s.url.startswith("data:"):
+        try:
+            shared_cache.put("sniff:" + s.url, asdict(s))
+        except Exception:
+            pass
+    return s
+
+
+def _sniff_data_uri(url: str) -> Sniffed:
+    header, _, data = url.partition(",")
+    mime = header[5:].split(";")[0] or "text/plain"
+    kind = _kind_from_mime(mime)
+    if kind is None:
+        raw = base64.b64decode(data[:SNIFF_BYTES]) if ";base64" in header else b""
+        kind, mime = sniff_bytes(raw)
+    return Sniffed(url, kind or BINARY, mime, source="header")
+
+
+def sniff(url: str, nbytes: int = SNIFF_BYTES) -> Sniffed:
+    """Content kind of a URL from a ranged GET of its first bytes."""
+    hit = _cached(url)
+    if hit is not None:
+        return hit
+    if url.startswith("data:"):
+        return _remember(_sniff_data_uri(url))
+
+    head, header_mime, size = b"", None, None
+    with tracing.span("outputs.sniff") as sp:
+        try:
+            req = urllib.request.Request(
+                url, headers={"Range": f"bytes=0-{nbytes - 1}"}
+            )
+            with urllib.request.urlopen(req, timeout=SNIFF_TIMEOUT) as resp:
+                header_mime = resp.headers.get("Content-Type")
+                rng = resp.headers.get("Content-Range") or ""
+                if "/" in rng and rng.rsplit("/", 1)[1].isdigit():
+                    size = int(rng.rsplit("/", 1)[1])
+                elif resp.status == 200 and resp.headers.get("Content-Length"):
+                    size = int(resp.headers["Content-Length"])
+                # сервер мог проигнорировать Range — читаем не больше nbytes
+                head = resp.read(nbytes)
+        except Exception:
+            pass
+        sp.set(bytes=len(head))
+
+    kind, mime = sniff_bytes(head) if head else (None, None)
+    if kind is not None:
+        return _remember(Sniffed(url, kind, mime, size))
+    kind = _kind_from_mime(header_mime)
+    if kind is not None:
+        return _remember(Sniffed(url, kind, header_mime, size, source="header"))
+    ext = os.path.splitext(urlsplit(url).path)[1].lower()
+    # по расширению не кешируем: сеть могла быть недоступна лишь временно
+    return Sniffed(url, _EXT_KIND.get(ext, TEXT), header_mime, size, "extension")
+
+
+# ---- классификация и маршрутизация ----
+@dataclass
+class OutputItem:
+    kind: str
+    text: str | None = None  # для текстовых элементов
+    url: str | None = None
+    mime: str | None = None
+    size: int | None = None
+    persisted_url: str | None = None  # presigned-ссылка на копию в S3
+    s3_key: str | None = None  # ключ копии в S3 (ссылку можно переподписать)
+    more: object = None  # jsonview.PrettyStream, если показана не вся структура
+
+    @property
+    def is_media(self) -> bool:
+        return self.kind in MEDIA_KINDS
+
+    @property
+    def display(self) -> str:
+        return self.persisted_url or self.url or self.text or ""
+
+
+def classify(output) -> list[OutputItem]:
+    """Split a prediction output into text and media items."""
+    whisper = as_whisper_transcription(output)
+    if whisper is not None:
+        return [OutputItem(TEXT, text=whisper)]
+    urls = extract_urls(output)
+    if not urls:
+        if isinstance(output, (dict, list, tuple)) and not (
+            isinstance(output, list) and len(output) == 1 and isinstance(output[0], str)
+        ):
+            stream = jsonview.PrettyStream(output)
+            text = stream.next_page()
+            more = None if stream.exhausted else stream
+            return [OutputItem(JSON, text=text, more=more)]
+        return [OutputItem(TEXT, text=format_prediction_output(output))]
+    if len(urls) == 1:
+        found = [sniff(urls[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(SNIFF_WORKERS, len(urls))) as pool:
+            found = list(pool.map(sniff, urls))
+    return [OutputItem(s.kind, url=s.url, mime=s.mime, size=s.size) for s in found]
+
+
+def object_name(object_id: str, mime: str | None) -> str:
+    """S3 key for an output; the extension comes from the sniffed type."""
+    ext = mimetypes.guess_extension(mime.split(";")[0]) if mime else None
+    return f"{object_id}{ext or '.bin'}"
+
+
+def s3_persist(url: str, name: str) -> str:
+    """Copy a delivery URL into S3 under `name`, return a presigned URL."""
+    import asyncio
+
+    from s3 import S3Client
+
+    return asyncio.run(S3Client().upload_file(None, url, None, name))
+
+
+def s3_presign(key: str) -> str:
+    """Fresh presigned URL for an object persisted earlier."""
+    import asyncio
+
+    from s3 import S3_URL_TTL, S3Client
+
+    return asyncio.run(S3Client().get_file_url(key, expires_in=S3_URL_TTL))
+
+
+def s3_configured() -> bool:
+    return bool(os.getenv("S3_BUCKET") and os.getenv("S3_ENDPOINT"))
+
+
+def persist(items: list[OutputItem], prediction_id: str, upload=s3_persist):
+    """Copy media items to S3 (ids <prediction>-<n> for multiple outputs).
+    Failures leave persisted_url empty so the delivery URL is shown."""
+    media = [
+        it
+        for it in items
+        if it.is_media and it.url and not it.url.startswith("data:")
+    ]
+    for idx, it in enumerate(media):
+        pid = f"{prediction_id}-{idx}" if len(media) > 1 else prediction_id
+        name = object_name(pid, it.mime)
+        try:
+            it.persisted_url = upload(it.url, name)
+            it.s3_key = name
+        except Exception:
+            log.exception("не удалось сохранить вывод в S3", extra={"url": it.url})
+            it.persisted_url = None
+    return items
+
+
+def render_text(items: list[OutputItem]) -> str:
+    return "\n".join(it.display for it in items if it.display)
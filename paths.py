@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+"""Локальный каталог данных воркбенча (история, кеши, отчёты)."""
+import os
+
+DATA_DIR = os.path.expanduser(
+    os.getenv("AIHUB_DATA_DIR", os.path.join("~", ".ai_workbench"))
+)
+
+
+def data_path(*parts: str) -> str:
+    """Path inside DATA_DIR; parent directories are created on demand."""
+    path = os.path.join(DATA_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+Пул процессов для HTTP-сервиса: супервизор и N воркеров.
+
+Один процесс упирается в одно ядро (JSON, разбор выводов, sniff,
+хеширование), поэтому server.py --processes N раскладывает задачи по
+процессам:
+
+- задачи лежат в общей SQLite (jobdb.JobDB): HTTP-процесс добавляет
+  строку и кладёт «жетон» в очередь work_q, свободный воркер забирает
+  следующую задачу по приоритету атомарным UPDATE — одну задачу не
+  возьмут двое, а воркер с занятыми потоками просто не берёт жетонов;
+- у воркера свой пул потоков и своё соединение с Replicate; состояния
+  пишутся в базу и уходят событиями (state / text / done) в events_q,
+  откуда их читает HTTP-процесс для SSE и /result;
+- кеш sniff выводов общий (jobdb.SharedCache): URL, разобранный одним
+  процессом, другим качать не нужно;
+- упавший воркер перезапускается, его задачи возвращаются в очередь;
+  у задачи с prediction_id следующий воркер не создаёт новый prediction,
+  а доводит прежний (server.execute → predictions.resume). То же — для
+  задач, оставшихся после остановки всего сервиса. Задача, прерванная
+  на create до записи prediction_id, помечается ошибкой: create мог
+  дойти до Replicate, повтор создал бы второй prediction;
+- restart() (SIGHUP) — плавная замена воркеров: новый запускается
+  сразу, старый дорабатывает свои задачи и выходит.
+
+    AIHUB_SERVER_PROCESSES=4  AIHUB_POOL_DRAIN_S=300
+
+По умолчанию — один процесс-воркер; AIHUB_SERVER_PROCESSES=0 выполняет
+задачи в HTTP-процессе, но без журнала: после перезапуска они теряются.
+"""
+import itertools
+import multiprocessing as mp
+import os
+import queue as queue_mod
+import signal
+import threading
+import time
+
+import jobdb
+import jobs
+import logs
+
+SERVER_PROCESSES = int(os.getenv("AIHUB_SERVER_PROCESSES", "1"))
+DRAIN_S = float(os.getenv("AIHUB_POOL_DRAIN_S", "300"))
+IDLE_POLL_S = 1.0
+
+log = logs.get_logger("pool")
+
+
+# ---------------- воркер (отдельный процесс) ----------------
+class _Worker:
+    def __init__(self, wid, db_path, work_q, ctrl_q, events_q, threads):
+        self.wid = wid
+        self.db = jobdb.JobDB(db_path)
+        self.work_q = work_q
+        self.ctrl_q = ctrl_q
+        self.events_q = events_q
+        self.threads = max(1, threads)
+        # JobQueue здесь — только set_state (лог + подписчики), потоки свои
+        self.hub = jobs.JobQueue(max_workers=1)
+        self.hub.subscribe(self._on_job)
+        self.active: dict[int, jobs.Job] = {}
+        self._lock = threading.Lock()
+        self.draining = threading.Event()
+
+    def _emit(self, jid: int, kind: str, data: dict):
+        self.events_q.put((jid, kind, data))
+
+    def _on_job(self, job: jobs.Job):
+        fields = {
+            "state": job.state,
+            "status": job.status,
+            "prediction_id": job.prediction_id,
+            "error": job.error,
+        }
+        if job.finished:
+            fields["finished_at"] = job.finished_at
+        self.db.update(job.id, **fields)
+        self._emit(job.id, "state", fields)
+
+    def _run(self, job: jobs.Job):
+        import server  # тянет aiohttp и весь конвейер — только в воркере
+
+        try:
+            result = server.run(
+                job, self.hub, lambda kind, data: self._emit(job.id, kind, data)
+            )
+        except Exception as e:
+            log.exception("исключение в задаче")
+            if not job.finished:
+                self.hub.set_state(job, jobs.FAILED, error=str(e))
+            result = {"state": job.state, "error": str(e)}
+        self.db.update(job.id, result=result)
+        self._emit(job.id, "done", result)
+        with self._lock:
+            self.active.pop(job.id, None)
+
+    def _control(self):
+        while True:
+            msg = self.ctrl_q.get()
+            if msg[0] == "cancel":
+                with self._lock:
+                    job = self.active.get(msg[1])
+                if job is not None:
+                    job.cancel_event.set()
+            elif msg[0] == "drain":
+                self.draining.set()
+                return
+
+    def serve(self):
+        threading.Thread(target=self._control, daemon=True, name="pool-ctrl").start()
+        workers = [
+            threading.Thread(target=self._loop, daemon=True, name=f"pool-job-{i + 1}")
+            for i in range(self.threads)
+        ]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+
+    def _loop(self):
+        # каждый поток сам берёт следующую задачу, пока не велено закончить
+        while not self.draining.is_set():
+            row = self.db.claim_next(self.wid)
+            if row is None:
+                try:
+                    self.work_q.get(timeout=IDLE_POLL_S)
+                except queue_mod.Empty:
+                    pass
+                continue
+            job = jobs.Job(
+                id=row["id"],
+                model=row["model"],
+                input=row["input"],
+                priority=row["priority"],
+                state=row["state"],
+                prediction_id=row["prediction_id"],
+                created_at=row["created_at"],
+                started_at=row["started_at"],
+            )
+            with self._lock:
+                self.active[job.id] = job
+            with logs.context(worker=self.wid):
+                self._run(job)
+
+
+def worker_main(wid, db_path, work_q, ctrl_q, events_q, threads):
+    """Entry point of a worker process."""
+    # Ctrl+C получает вся группа — останавливает нас супервизор
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import outputs
+
+    outputs.shared_cache = jobdb.SharedCache(db_path)
+    worker = _Worker(wid, db_path, work_q, ctrl_q, events_q, threads)
+    signal.signal(signal.SIGTERM, lambda *_: worker.draining.set())
+    log.info("воркер запущен", extra={"worker": wid, "pid": os.getpid()})
+    worker.serve()
+    log.info("воркер остановлен", extra={"worker": wid})
+    logs.shutdown()
+
+
+# ---------------- супервизор (HTTP-процесс) ----------------
+class Supervisor:
+    """Keeps `processes` worker processes alive and relays their events
+    to on_event(job_id, kind, data) (called from a reader thread)."""
+
+    def __init__(self, processes: int, threads: int, db_path: str, on_event):
+        self.processes = max(1, processes)
+        self.threads = threads
+        self.db_path = db_path
+        self.db = jobdb.JobDB(db_path)
+        self.on_event = on_event
+        self._ctx = mp.get_context("spawn")
+        self.work_q = self._ctx.Queue()
+        self.events_q = self._ctx.Queue()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._slots: list[tuple[int, object, object]] = []  # (wid, proc, ctrl_q)
+        self._retiring: list[tuple[int, object, object, float]] = []
+        self._stopping = False
+
+    # ---- жизненный цикл ----
+    def start(self):
+        # воркеры прошлого запуска мертвы — их задачи разбираем сразу
+        for row in self.db.unfinished(origin=jobdb.SERVER):
+            self._orphan(row)
+        with self._lock:
+            self._slots = [self._spawn() for _ in range(self.processes)]
+        for target, name in (
+            (self._read_events, "pool-events"),
+            (self._monitor, "pool-monitor"),
+        ):
+            threading.Thread(target=target, daemon=True, name=name).start()
+
+    def restart(self):
+        """Rolling restart: fresh workers now, old ones finish their jobs."""
+        with self._lock:
+            if self._stopping:
+                return
+            old, self._slots = self._slots, [self._spawn() for _ in self._slots]
+            deadline = time.time() + DRAIN_S
+            for wid, proc, ctrl in old:
+                ctrl.put(("drain",))
+                self._retiring.append((wid, proc, ctrl, deadline))
+        log.info("перезапуск воркеров", extra={"workers": len(old)})
+
+    def stop(self, timeout: float = DRAIN_S):
+        """Let workers finish running jobs, then stop them."""
+        with self._lock:
+            self._stopping = True
+            procs = self._slots + [r[:3] for r in self._retiring]
+            self._slots, self._retiring = [], []
+        for _, _, ctrl in procs:
+            ctrl.put(("drain",))
+        deadline = time.time() + timeout
+        for wid, proc, _ in procs:
+            proc.join(max(0.0, deadline - time.time()))
+            if proc.is_alive():
+                proc.kill()
+                proc.join()
+            self._reap(wid)
+        self.events_q.put(None)
+
+    # ---- задачи ----
+    def dispatch(self, job_id: int):
+        self.work_q.put(job_id)
+
+    def cancel(self, job_id: int, worker: int) -> bool:
+        with self._lock:
+            for wid, _, ctrl, *_ in self._slots + self._retiring:
+                if wid == worker:
+                    ctrl.put(("cancel", job_id))
+                    return True
+        return False
+
+    def alive(self) -> int:
+        with self._lock:
+            return sum(1 for _, p, _ in self._slots if p.is_alive())
+
+    # ---- внутреннее ----
+    def _spawn(self) -> tuple[int, object, object]:
+        wid = next(self._ids)
+        ctrl = self._ctx.Queue()
+        proc = self._ctx.Process(
+            target=worker_main,
+            args=(wid, self.db_path, self.work_q, ctrl, self.events_q, self.threads),
+            name=f"aihub-worker-{wid}",
+            daemon=True,
+        )
+        proc.start()
+        return wid, proc, ctrl
+
+    def _monitor(self):
+        while True:
+            time.sleep(1.0)
+            with self._lock:
+                if self._stopping:
+                    return
+                dead = []
+                for i, (wid, proc, ctrl) in enumerate(self._slots):
+                    if not proc.is_alive():
+                        log.error(
+                            "воркер завершился",
+                            extra={"worker": wid, "exitcode": proc.exitcode},
+                        )
+                        dead.append(wid)
+                        self._slots[i] = self._spawn()
+                for item in list(self._retiring):
+                    wid, proc, _, deadline = item
+                    if proc.is_alive() and time.time() > deadline:
+                        proc.kill()
+                    if not proc.is_alive():
+                        self._retiring.remove(item)
+                        dead.append(wid)
+            for wid in dead:
+                self._reap(wid)
+
+    def _reap(self, wid: int):
+        for row in self.db.unfinished(worker=wid):
+            self._orphan(row)
+
+    def _orphan(self, row: dict):
+        jid = row["id"]
+        if row["state"] == jobs.QUEUED:
+            return
+        if row["state"] == jobs.CREATING and not row["prediction_id"]:
+            # как main.resume_unfinished: prediction мог быть создан,
+            # а id не записан — повтор создал бы второй
+            self._fail(row, "прервано до создания prediction")
+            return
+        if row["attempts"] < jobdb.MAX_ATTEMPTS:
+            self.db.requeue(jid)
+            self.on_event(jid, "state", {"state": jobs.QUEUED})
+            self.dispatch(jid)
+            return
+        # задача раз за разом роняет воркер — больше не пробуем
+        self._fail(row, "воркер завершался во время задачи, попытки исчерпаны")
+
+    def _fail(self, row: dict, err: str):
+        jid = row["id"]
+        result = {"state": jobs.FAILED, "error": err}
+        self.db.update(
+            jid, state=jobs.FAILED, error=err, finished_at=time.time(), result=result
+        )
+        self.on_event(jid, "done", {**result, "prediction_id": row["prediction_id"]})
+
+    def _read_events(self):
+        while True:
+            item = self.events_q.get()
+            if item is None:
+                return
+            try:
+                self.on_event(*item)
+            except Exception:
+                log.exception("ошибка обработки события воркера")
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Общий жизненный цикл prediction для GUI и headless-запусков:
+один Replicate-клиент на процесс, создание, поллинг статуса, отмена,
+потоковый вывод (SSE) с замером времени до первого токена и
+продолжение уже созданного prediction после перезапуска (resume).
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+import logs
+import profiling
+import tracing
+
+# "starting", "processing", "succeeded", "failed", "canceled"
+TERMINAL_STATUSES = ("succeeded", "failed", "canceled")
+POLL_INTERVAL = float(os.getenv("REPLICATE_POLL_INTERVAL", "1.0"))
+
+_client = None
+_client_lock = threading.Lock()
+log = logs.get_logger("predictions")
+
+
+class Cancelled(Exception):
+    pass
+
+
+def get_client():
+    """Shared replicate.Client (lazy import; one HTTP pool for all jobs)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            import replicate
+
+            _client = replicate.Client(api_token=os.getenv("REPLICATE_API_KEY"))
+        return _client
+
+
+def wait_for(
+    client,
+    prediction,
+    on_status=None,
+    cancel_event: threading.Event | None = None,
+    interval: float = POLL_INTERVAL,
+):
+    """Poll until the prediction reaches a terminal status and return it.
+    If cancel_event is set, the prediction is cancelled remotely and
+    Cancelled is raised."""
+    with tracing.span("prediction.wait", interval=interval) as sp:
+        polls = 0
+        last = prediction.status
+        sp.event(f"status {last}")
+        log.info("статус", extra={"prediction_id": prediction.id, "status": last})
+        while prediction.status not in TERMINAL_STATUSES:
+            if on_status is not None:
+                on_status(prediction)
+            if cancel_event is not None and cancel_event.wait(interval):
+                sp.set(polls=polls, cancelled=True)
+                log.info("отмена", extra={"prediction_id": prediction.id})
+                try:
+                    client.predictions.cancel(prediction.id)
+                except Exception:
+                    pass
+                raise Cancelled(prediction.id)
+            elif cancel_event is None:
+                time.sleep(interval)
+            prediction = client.predictions.get(prediction.id)
+            polls += 1
+            if prediction.status != last:
+                # время в очереди провайдера видно по смене starting → processing
+                last = prediction.status
+                sp.event(f"status {last}")
+                log.info(
+                    "статус",
+                    extra={"prediction_id": prediction.id, "status": last},
+                )
+            else:
+                log.info(
+                    "опрос",
+                    extra={
+                        "sample": "poll",
+                        "prediction_id": prediction.id,
+                        "status": last,
+                        "polls": polls,
+                    },
+                )
+        sp.set(polls=polls, status=prediction.status)
+        m = getattr(prediction, "metrics", None) or {}
+        if m.get("predict_time") is not None:
+            sp.set(predict_time=float(m["predict_time"]))
+    return prediction
+
+
+@dataclass
+class RunResult:
+    prediction: object
+    started: float  # perf_counter() перед create
+    first_output: float | None = None  # первый кусок вывода (TTFT)
+    finished: float | None = None
+
+    @property
+    def latency(self) -> float | None:
+        return None if self.finished is None else self.finished - self.started
+
+    @property
+    def ttft(self) -> float | None:
+        # своё измерение (с учётом очереди) точнее отражает ожидание
+        # пользователя; метрика провайдера — запасной вариант
+        if self.first_output is not None:
+            return self.first_output - self.started
+        m = getattr(self.prediction, "metrics", None) or {}
+        if m.get("time_to_first_token") is not None:
+            return float(m["time_to_first_token"])
+        return None
+
+
+def run(
+    client,
+    model: str,
+    input: dict,
+    on_text=None,
+    on_status=None,
+    cancel_event: threading.Event | None = None,
+    stream: bool = True,
+) -> RunResult:
+    """Create a prediction and wait for it. With stream=True and a model
+    that supports SSE, output chunks go to on_text(str) as they arrive;
+    otherwise falls back to polling."""
+    result = RunResult(prediction=None, started=time.perf_counter())
+    with tracing.span("prediction.create", model=model, stream=stream):
+        prediction = client.predictions.create(
+            model=model, input=input, stream=stream
+        )
+        tracing.set_prediction(prediction.id)
+    profiling.tag(prediction_id=prediction.id)
+    logs.bind(prediction_id=prediction.id, model=model)
+    result.prediction = prediction
+    if on_status is not None:
+        on_status(prediction)
+
+    urls = getattr(prediction, "urls", None) or {}
+    if stream and urls.get("stream"):
+        with tracing.span("prediction.stream") as sp:
+            for event in prediction.stream():
+                if cancel_event is not None and cancel_event.is_set():
+                    try:
+                        client.predictions.cancel(prediction.id)
+                    except Exception:
+                        pass
+                    raise Cancelled(prediction.id)
+                kind = getattr(event.event, "value", event.event)
+                if kind == "output":
+                    if result.first_output is None:
+                        result.first_output = time.perf_counter()
+                        sp.event("first output")
+                        log.info(
+                            "первый вывод",
+                            extra={
+                                "prediction_id": prediction.id,
+                                "ttft_s": round(
+                                    result.first_output - result.started, 3
+                                ),
+                            },
+                        )
+                    if on_text is not None:
+                        on_text(event.data)
+                elif kind in ("error", "done"):
+                    break
+            prediction = client.predictions.get(prediction.id)
+        if prediction.status not in TERMINAL_STATUSES:
+            prediction = wait_for(client, prediction, on_status, cancel_event)
+    else:
+
+        def status(p):
+            if result.first_output is None and p.output:
+                result.first_output = time.perf_counter()
+            if on_status is not None:
+                on_status(p)
+
+        prediction = wait_for(client, prediction, status, cancel_event)
+    result.prediction = prediction
+    result.finished = time.perf_counter()
+    return result
+
+
+def resume(
+    client,
+    prediction_id: str,
+    on_status=None,
+    cancel_event: threading.Event | None = None,
+) -> RunResult:
+    """Pick up a prediction created earlier (e.g. by a closed session):
+    fetch its status by id and poll until it finishes — never creates
+    a new one."""
+    result = RunResult(prediction=None, started=time.perf_counter())
+    with tracing.span("prediction.resume"):
+        prediction = client.predictions.get(prediction_id)
+        tracing.set_prediction(prediction.id)
+    profiling.tag(prediction_id=prediction.id)
+    logs.bind(prediction_id=prediction.id)
+    log.info("возобновление", extra={"prediction_id": prediction.id})
+    if on_status is not None:
+        on_status(prediction)
+    result.prediction = wait_for(client, prediction, on_status, cancel_event)
+    result.finished = time.perf_counter()
+    return result
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Быстрое превью видео/аудио-вывода, пока полная копия уходит в S3.
+
+ffprobe/ffmpeg читают URL сами и ходят по нему range-запросами: для
+длительности нужен только заголовок (moov/контейнер), для кадра-постера —
+заголовок и один ключевой кадр. Без ffmpeg длительность берётся из первых
+PROBE_BYTES байт (WAV-заголовок, mvhd у mp4 с moov в начале).
+
+Постеры кешируются на диске по URL.
+"""
+import hashlib
+import json
+import os
+import shutil
+import struct
+import subprocess
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+FFMPEG = os.getenv("AIHUB_FFMPEG", "ffmpeg")
+FFPROBE = os.getenv("AIHUB_FFPROBE", "ffprobe")
+PREVIEW_TIMEOUT = float(os.getenv("AIHUB_PREVIEW_TIMEOUT", "15"))
+POSTER_WIDTH = 480
+PROBE_BYTES = 256 * 1024
+PREVIEW_WORKERS = 4
+
+_pool: ThreadPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+@dataclass
+class MediaInfo:
+    url: str
+    kind: str  # video / audio
+    duration: float | None = None
+    width: int | None = None
+    height: int | None = None
+    codec: str | None = None
+    poster: str | None = None  # путь к JPEG кадра
+    elapsed: float = 0.0
+    error: str | None = None
+
+    @property
+    def summary(self) -> str:
+        parts = ["🎬" if self.kind == "video" else "🎧"]
+        if self.duration is not None:
+            m, s = divmod(int(round(self.duration)), 60)
+            parts.append(f"{m}:{s:02d}")
+        if self.width and self.height:
+            parts.append(f"{self.width}×{self.height}")
+        if self.codec:
+            parts.append(self.codec)
+        return " · ".join(parts)
+
+
+def has_ffmpeg() -> bool:
+    return bool(shutil.which(FFPROBE) and shutil.which(FFMPEG))
+
+
+def _poster_path(url: str) -> str:
+    from paths import data_path
+
+    key = hashlib.sha1(url.split("?")[0].encode("utf-8")).hexdigest()
+    return data_path("posters", f"{key}.jpg")
+
+
+# ---- ffmpeg ----
+def _ffprobe(url: str, info: MediaInfo):
+    out = subprocess.run(
+        [
+            FFPROBE,
+            "-v",
+            "error",
+            "-show_entries",
+            "format=duration:stream=codec_type,codec_name,width,height",
+            "-of",
+            "json",
+            url,
+        ],
+        capture_output=True,
+        text=True,
+        timeout=PREVIEW_TIMEOUT,
+        check=True,
+    ).stdout
+    data = json.loads(out or "{}")
+    dur = (data.get("format") or {}).get("duration")
+    if dur not in (None, "N/A"):
+        info.duration = float(dur)
+    for st in data.get("streams") or []:
+        if st.get("codec_type") == "video" and info.kind == "video":
+            info.width, info.height = st.get("width"), st.get("height")
+            info.codec = st.get("codec_name")
+            break
+        if st.get("codec_type") == "audio" and info.codec is None:
+            info.codec = st.get("codec_name")
+
+
+def _ffmpeg_poster(url: str, at: float, out: str):
+    tmp = f"{out}.{os.getpid()}.{threading.get_ident()}.jpg"
+    subprocess.run(
+        [
+            FFMPEG,
+            "-v",
+            "error",
+            "-y",
+            # -ss до -i: ffmpeg сам прыгает по range к ближайшему ключевому кадру
+            "-ss",
+            f"{at:.2f}",
+            "-i",
+            url,
+            "-frames:v",
+            "1",
+            "-vf",
+            f"scale='min({POSTER_WIDTH},iw)':-2",
+            "-q:v",
+            "4",
+            tmp,
+        ],
+        capture_output=True,
+        timeout=PREVIEW_TIMEOUT,
+        check=True,
+    )
+    os.replace(tmp, out)
+
+
+# ---- без ffmpeg: длительность из заголовка ----
+def _range_head(url: str, nbytes: int = PROBE_BYTES) -> tuple[bytes, int | None]:
+    req = urllib.request.Request(url, headers={"Range": f"bytes=0-{nbytes - 1}"})
+    with urllib.request.urlopen(req, timeout=PREVIEW_TIMEOUT) as resp:
+        rng = resp.headers.get("Content-Range") or ""
+        size = None
+        if "/" in rng and rng.rsplit("/", 1)[1].isdigit():
+            size = int(rng.rsplit("/", 1)[1])
+        elif resp.headers.get("Content-Length"):
+            size = int(resp.headers["Content-Length"])
+        return resp.read(nbytes), size
+
+
+def header_duration(head: bytes, size: int | None) -> float | None:
+    """Duration from a WAV header or an mp4 mvhd box in the first bytes."""
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        fmt = head.find(b"fmt ")
+        data = head.find(b"data")
+        if fmt >= 0 and data >= 0:
+            byte_rate = struct.unpack_from("<I", head, fmt + 16)[0]
+            data_len = struct.unpack_from("<I", head, data + 4)[0]
+            if size is not None:
+                data_len = min(data_len, size - data - 8)
+            if byte_rate:
+                return data_len / byte_rate
+    i = head.find(b"mvhd")
+    if i >= 4:
+        version = head[i + 4]
+        if version == 1 and len(head) >= i + 36:
+            timescale, duration = struct.unpack_from(">IQ", head, i + 24)
+        elif len(head) >= i + 24:
+            timescale, duration = struct.unpack_from(">II", head, i + 16)
+        else:
+            return None
+        if timescale:
+            return duration / timescale
+    return None
+
+
+# ---- публичное ----
+def probe(url: str, kind: str) -> MediaInfo:
+    """Duration, size and poster frame using only ranged reads of `url`."""
+    t0 = time.perf_counter()
+    info = MediaInfo(url=url, kind=kind)
+    try:
+        if has_ffmpeg():
+            _ffprobe(url, info)
+            if kind == "video":
+                poster = _poster_path(url)
+                if not os.path.exists(poster):
+                    at = min(1.0, (info.duration or 0) * 0.1)
+                    _ffmpeg_poster(url, at, poster)
+                info.poster = poster
+        else:
+            head, size = _range_head(url)
+            info.duration = header_duration(head, size)
+    except Exception as e:
+        info.error = str(e)
+    info.elapsed = time.perf_counter() - t0
+    return info
+
+
+def submit(url: str, kind: str, callback):
+    """Probe in the shared preview pool; callback(MediaInfo) runs there."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=PREVIEW_WORKERS, thread_name_prefix="preview"
+            )
+
+    def work():
+        info = probe(url, kind)
+        try:
+            callback(info)
+        except Exception:
+            pass
+
+    return _pool.submit(work)
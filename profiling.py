@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Профилирование старта и работы воркбенча.
+
+StartupProfiler — дешёвые метки времени (perf_counter) вокруг импортов и
+построения компонентов. Метки пишутся всегда, отчёт печатается только
+при запуске с --profile-startup.
+
+request_profile() — профиль одного запроса (прогон воркера on_send,
+окна сравнения или headless-запуска): cProfile потока воркера плюс
+разница снимков tracemalloc. Включается AIHUB_PROFILE_REQUESTS
+(1/all, cpu, mem) или ключом --profile-requests; выключенный — одна
+проверка флага. На каждый запрос пишутся <...>.prof (pstats, snakeviz)
+и <...>.txt со сводкой, с моделью и prediction id в имени.
+"""
+import contextvars
+import io
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+_mode = os.getenv("AIHUB_PROFILE_REQUESTS", "").lower()
+PROFILE_CPU = _mode in ("1", "all", "cpu")
+PROFILE_MEM = _mode in ("1", "all", "mem")
+PROFILE_DIR = os.getenv("AIHUB_PROFILE_DIR")
+PROFILE_TOP = 30
+TRACEMALLOC_FRAMES = 8
+
+_active: contextvars.ContextVar = contextvars.ContextVar(
+    "aihub_profile", default=None
+)
+
+
+class StartupProfiler:
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        # (group, name, start_offset_s, duration_s, thread_name)
+        self.records: list[tuple[str, str, float, float, str]] = []
+        self.marks: dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str, group: str = "build"):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.records.append(
+                    (
+                        group,
+                        name,
+                        start - self.t0,
+                        end - start,
+                        threading.current_thread().name,
+                    )
+                )
+
+    def mark(self, name: str):
+        """Record a milestone (first frame, configs ready…) once."""
+        with self._lock:
+            self.marks.setdefault(name, time.perf_counter() - self.t0)
+
+    def report(self) -> str:
+        with self._lock:
+            records = list(self.records)
+            marks = dict(self.marks)
+        lines = ["=== startup profile ==="]
+        for group in ("import", "build", "background"):
+            rows = [r for r in records if r[0] == group]
+            if not rows:
+                continue
+            total = sum(r[3] for r in rows)
+            lines.append(f"[{group}] total {total * 1000:8.1f} ms")
+            for _, name, start, dur, thread in rows:
+                where = "" if thread == "MainThread" else f"  ({thread})"
+                lines.append(
+                    f"  {name:<36} {dur * 1000:8.1f} ms  @ {start * 1000:8.1f} ms{where}"
+                )
+        if marks:
+            lines.append("[milestones]")
+            for name, at in sorted(marks.items(), key=lambda kv: kv[1]):
+                lines.append(f"  {name:<36} @ {at * 1000:8.1f} ms")
+        return "\n".join(lines)
+
+    def print_report(self, file=None):
+        print(self.report(), file=file or sys.stderr, flush=True)
+
+
+# ---------------- профили запросов ----------------
+def enable_requests(cpu: bool = True, mem: bool = True):
+    """Turn per-request profiling on (CLI switch)."""
+    global PROFILE_CPU, PROFILE_MEM
+    PROFILE_CPU, PROFILE_MEM = cpu, mem
+
+
+def _profile_dir() -> str:
+    if PROFILE_DIR:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        return PROFILE_DIR
+    from paths import data_path
+
+    return os.path.dirname(data_path("profiles", "x"))
+
+
+class RequestProfile:
+    """cProfile + tracemalloc around one request; dumps on exit."""
+
+    def __init__(self, model: str, tags: dict):
+        self.model = model
+        self.tags = tags
+        self.prof = None
+        self.snap0 = None
+        self.note = ""
+        self.path: str | None = None
+
+    def tag(self, **tags):
+        self.tags.update(tags)
+
+    def __enter__(self):
+        if PROFILE_MEM:
+            import tracemalloc
+
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+            self.snap0 = tracemalloc.take_snapshot()
+        if PROFILE_CPU:
+            import cProfile
+
+            self.prof = cProfile.Profile()
+            try:
+                self.prof.enable()
+            except ValueError:
+                # 3.12+: профилировщик один на процесс, параллельный запрос
+                # уже профилируется
+                self.prof = None
+                self.note = "CPU-профиль пропущен: занят другим запросом"
+        self._token = _active.set(self)
+        self.t0 = time.perf_counter()
+        self.cpu0 = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.t0
+        cpu = time.thread_time() - self.cpu0
+        if self.prof is not None:
+            self.prof.disable()
+        _active.reset(self._token)
+        if exc is not None:
+            self.tags.setdefault("error", f"{exc_type.__name__}: {exc}")
+        try:
+            self.path = self._dump(wall, cpu)
+            print(f"profile: {self.path}", file=sys.stderr, flush=True)
+        except Exception as e:
+            print("profile: не удалось записать:", e, file=sys.stderr)
+        return False
+
+    def _dump(self, wall: float, cpu: float) -> str:
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        ident = self.tags.get("prediction_id") or f"job{self.tags.get('job', '')}"
+        slug = "".join(c if c.isalnum() or c in "-." else "_" for c in self.model)
+        base = os.path.join(_profile_dir(), f"{stamp}-{slug}-{ident}")
+        lines = [f"model: {self.model}"]
+        lines += [f"{k}: {v}" for k, v in self.tags.items()]
+        lines.append(f"wall: {wall * 1000:.1f} ms, thread CPU: {cpu * 1000:.1f} ms")
+        if self.note:
+            lines.append(self.note)
+        if self.prof is not None:
+            import pstats
+
+            self.prof.dump_stats(base + ".prof")
+            out = io.StringIO()
+            st = pstats.Stats(self.prof, stream=out)
+            st.sort_stats("cumulative").print_stats(PROFILE_TOP)
+            lines += ["", "=== CPU (cumulative) ===", out.getvalue().strip()]
+        if self.snap0 is not None:
+            lines += ["", "=== allocations (growth during request) ==="]
+            lines += self._alloc_report()
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return base + ".txt"
+
+    def _alloc_report(self) -> list[str]:
+        import cProfile
+        import pstats
+        import tracemalloc
+
+        # без следов самого профилирования (в том числе соседних запросов)
+        snap = tracemalloc.take_snapshot().filter_traces(
+            [
+                tracemalloc.Filter(False, m.__file__)
+                for m in (tracemalloc, cProfile, pstats)
+            ]
+        )
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [
+            f"traced now {current / 1e6:.1f} MB, peak {peak / 1e6:.1f} MB"
+            " (весь процесс: параллельные запросы попадают в разницу)"
+        ]
+        for d in snap.compare_to(self.snap0, "lineno")[:PROFILE_TOP]:
+            if d.size_diff <= 0:
+                continue
+            lines.append(
+                f"  {d.size_diff / 1024:+10.1f} KiB {d.count_diff:+7d} блоков"
+                f"  {d.traceback}"
+            )
+        return lines
+
+
+class _NoopProfile:
+    def tag(self, **tags):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopProfile()
+
+
+def request_profile(model: str, **tags):
+    """Context manager profiling one request when profiling is enabled."""
+    if not (PROFILE_CPU or PROFILE_MEM):
+        return _NOOP
+    return RequestProfile(model, tags)
+
+
+def tag(**tags):
+    """Add tags (prediction_id, ...) to the request being profiled."""
+    p = _active.get() if (PROFILE_CPU or PROFILE_MEM) else None
+    if p is not None:
+        p.tag(**tags)
+
+
+def percentile(values, q: float) -> float | None:
+    """Nearest-rank percentile, q in 0..100 (None for no values)."""
+    if not values:
+        return None
+    s = sorted(values)
+    k = max(0, min(len(s) - 1, math.ceil(q * len(s) / 100) - 1))
+    return s[k]
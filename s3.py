@@ -8,6 +8,9 @@ from anyio import fail_after
 from dotenv import load_dotenv
 from smart_open import open as sopen
 
+import logs
+import tracing
+
 load_dotenv()
 
 
@@ -18,6 +21,8 @@ AWS_REGION = os.getenv("AWS_REGION")
 S3_BUCKET = os.getenv("S3_BUCKET")
 S3_URL_TTL = int(os.getenv("S3_URL_TTL", "3600"))  # seconds
 
+log = logs.get_logger("s3")
+
 
 class S3Client:
     def __init__(
@@ -34,53 +39,59 @@ class S3Client:
         file_path: str,
         file_url: str,
         prediction_id: str,
+        object_name: str | None = None,
     ):
         if file_path != None:
             session = aioboto3.Session()
-            object_name = file_path.split("/")[-1]
-            async with session.client(
-                "s3",
-                region_name=self.region_name,
-                endpoint_url=self.endpoint_url,
-                aws_access_key_id=self.access_key,
-                aws_secret_access_key=self.secret_key,
-            ) as client:
-                await client.upload_file(file_path, self.bucket_name, object_name)
+            object_name = object_name or file_path.split("/")[-1]
+            with tracing.span(
+                "s3.upload_file", key=object_name, size=os.path.getsize(file_path)
+            ):
+                async with session.client(
+                    "s3",
+                    region_name=self.region_name,
+                    endpoint_url=self.endpoint_url,
+                    aws_access_key_id=self.access_key,
+                    aws_secret_access_key=self.secret_key,
+                ) as client:
+                    await client.upload_file(file_path, self.bucket_name, object_name)
             # presigned URL after upload
             url = await self.get_file_url(object_name, expires_in=S3_URL_TTL)
             return url
         elif file_url != None:
             path = urlsplit(file_url).path
             ext = os.path.splitext(path)[1] or ".bin"
-            object_name = f"{prediction_id}{ext}"
+            object_name = object_name or f"{prediction_id}{ext}"
 
-            await asyncio.to_thread(
-                upload_via_smart_open,
-                file_url,
-                self.bucket_name,
-                object_name,
-                self.endpoint_url,
-                self.access_key,
-                self.secret_key,
-                self.region_name,
-            )
+            with tracing.span("s3.copy_from_url", key=object_name):
+                await asyncio.to_thread(
+                    upload_via_smart_open,
+                    file_url,
+                    self.bucket_name,
+                    object_name,
+                    self.endpoint_url,
+                    self.access_key,
+                    self.secret_key,
+                    self.region_name,
+                )
 
             # проверяем, что объект действительно записан
-            s3 = boto3.client(
-                "s3",
-                endpoint_url=self.endpoint_url,
-                aws_access_key_id=self.access_key,
-                aws_secret_access_key=self.secret_key,
-                region_name=self.region_name,
-                config=Config(
-                    s3={"addressing_style": "path"}, signature_version="s3v4"
-                ),
-            )
-            s3.head_object(Bucket=self.bucket_name, Key=object_name)
+            with tracing.span("s3.head_object", key=object_name):
+                s3 = boto3.client(
+                    "s3",
+                    endpoint_url=self.endpoint_url,
+                    aws_access_key_id=self.access_key,
+                    aws_secret_access_key=self.secret_key,
+                    region_name=self.region_name,
+                    config=Config(
+                        s3={"addressing_style": "path"}, signature_version="s3v4"
+                    ),
+                )
+                s3.head_object(Bucket=self.bucket_name, Key=object_name)
             url = await self.get_file_url(object_name, expires_in=S3_URL_TTL)
             return url
         else:
-            print("Ошибка")
+            log.error("upload_file: не задан ни file_path, ни file_url")
 
     async def get_file_url(
         self, object_name: str, expires_in: int | None = None
@@ -94,19 +105,20 @@ class S3Client:
             return f"{self.endpoint_url}/{self.bucket_name}/{object_name}"
 
         session = aioboto3.Session()
-        async with session.client(
-            "s3",
-            region_name=self.region_name,
-            endpoint_url=self.endpoint_url,
-            aws_access_key_id=self.access_key,
-            aws_secret_access_key=self.secret_key,
-        ) as client:
-            url = await client.generate_presigned_url(
-                ClientMethod="get_object",
-                Params={"Bucket": self.bucket_name, "Key": object_name},
-                ExpiresIn=expires_in,
-            )
-            return url
+        with tracing.span("s3.presign", key=object_name):
+            async with session.client(
+                "s3",
+                region_name=self.region_name,
+                endpoint_url=self.endpoint_url,
+                aws_access_key_id=self.access_key,
+                aws_secret_access_key=self.secret_key,
+            ) as client:
+                url = await client.generate_presigned_url(
+                    ClientMethod="get_object",
+                    Params={"Bucket": self.bucket_name, "Key": object_name},
+                    ExpiresIn=expires_in,
+                )
+        return url
 
 
 def upload_via_smart_open(
@@ -0,0 +1,599 @@
+# -*- coding: utf-8 -*-
+"""
+Headless HTTP-сервис воркбенча: один тёплый процесс на команду вместо
+копии приложения (и ключа) у каждого.
+
+Те же детали, что и в окне: конфиги models_conf и effective_input(),
+общий Replicate-клиент и очередь задач (JobQueue), predictions.run()
+(SSE, если модель умеет), classify/persist выводов в S3 и локальное
+хранилище выводов.
+
+    POST /v1/jobs                {"model", "prompt", "input"?, "attachments"?,
+                                  "priority"?} → 202 {"id", "state", ...}
+    GET  /v1/jobs/{id}           состояние задачи
+    GET  /v1/jobs/{id}/stream    SSE: state / text / done
+    POST /v1/jobs/{id}/cancel
+    GET  /v1/jobs/{id}/result    итог (?wait=секунды — дождаться)
+    GET  /v1/models              доступные модели и их контролы
+
+Если задан AIHUB_SERVER_TOKEN, запросы должны нести
+Authorization: Bearer <token>.
+
+--processes N (по умолчанию 1) — задачи выполняются в N
+процессах-воркерах (pool.py), состояние и кеш общие через SQLite
+(jobdb.py); этот процесс только принимает HTTP. kill -HUP — плавный
+перезапуск воркеров. Задачи, не завершённые к остановке сервиса,
+доводятся после запуска (по prediction_id, без повторного create) и
+доступны по прежним id. --processes 0 — всё в одном процессе, без
+журнала: незавершённые задачи при перезапуске теряются.
+
+    python server.py --host 0.0.0.0 --port 8080 [--processes 4]
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+from aiohttp import web
+
+import attachments
+import hedge
+import jobdb
+import jobs
+import logs
+import modelconf
+import outputs
+import pool
+import predictions
+import profiling
+import store
+import tracing
+
+SERVER_WORKERS = int(os.getenv("AIHUB_SERVER_WORKERS", "16"))
+SERVER_TOKEN = os.getenv("AIHUB_SERVER_TOKEN")
+KEEP_FINISHED_S = float(os.getenv("AIHUB_SERVER_KEEP_S", "3600"))
+MAX_WAIT_S = 300
+
+log = logs.get_logger("server")
+
+
+class JobView:
+    """What the HTTP side knows about a job: events for SSE replay and
+    the final result. Written from worker threads via the event loop."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.job: jobs.Job | None = None
+        self.loop = loop
+        self.events: list[tuple[str, dict]] = []
+        self.subscribers: set[asyncio.Queue] = set()
+        self.done = asyncio.Event()
+        self.result: dict | None = None
+
+    # ---- из потоков воркеров ----
+    def publish(self, kind: str, data: dict):
+        self.loop.call_soon_threadsafe(self._fanout, kind, data)
+
+    # ---- в цикле событий ----
+    def _fanout(self, kind: str, data: dict):
+        self.events.append((kind, data))
+        for q in self.subscribers:
+            q.put_nowait((kind, data))
+        if kind == "done":
+            self.done.set()
+
+    def status(self) -> dict:
+        j = self.job
+        return {
+            "id": j.id,
+            "model": j.model,
+            "state": j.state,
+            "status": j.status,
+            "prediction_id": j.prediction_id,
+            "elapsed": round(j.elapsed, 3),
+            "error": j.error,
+        }
+
+
+class Service:
+    def __init__(self, workers: int = SERVER_WORKERS):
+        self.configs = modelconf.read_all()
+        self.queue = jobs.JobQueue(max_workers=workers)
+        self.queue.subscribe(self._on_job)
+        self.views: dict[int, JobView] = {}
+        self.loop: asyncio.AbstractEventLoop | None = None
+
+    # ---- сборка запроса ----
+    def build_input(self, body: dict) -> tuple[str, dict]:
+        if not isinstance(body, dict):
+            raise _http_error(web.HTTPBadRequest, "ожидался JSON-объект")
+        model = body.get("model")
+        cfg = self.configs.get(model) if isinstance(model, str) else None
+        if cfg is None:
+            # URL задачи существует — неверно само тело запроса
+            raise _http_error(
+                web.HTTPUnprocessableEntity, f"нет конфига модели {model!r}"
+            )
+        values = body.get("input") or {}
+        prompt = body.get("prompt") or ""
+        urls = body.get("attachments") or []
+        if not isinstance(values, dict):
+            raise _http_error(web.HTTPBadRequest, "input должен быть объектом")
+        if not isinstance(prompt, str):
+            raise _http_error(web.HTTPBadRequest, "prompt должен быть строкой")
+        if not isinstance(urls, list) or not all(isinstance(u, str) for u in urls):
+            raise _http_error(web.HTTPBadRequest, "attachments — список ссылок")
+        payload = modelconf.effective_input(cfg, values)
+        modelconf.apply_prompt(payload, prompt.strip())
+        if urls:
+            key = attachments.attach_key(cfg, payload)
+            if key is None:
+                raise _http_error(web.HTTPBadRequest, "модель не принимает вложения")
+            payload[key] = urls
+        return model, payload
+
+    def submit(self, body: dict) -> JobView:
+        model, payload = self.build_input(body)
+        # вид создаётся до submit: воркер может взять задачу сразу
+        view = JobView(self.loop)
+        view.job = self.queue.submit(
+            model,
+            payload,
+            lambda job, queue: self._run(job, queue, view),
+            priority=_priority(body),
+        )
+        self.views[view.job.id] = view
+        # ранние смены состояния прошли мимо _on_job — отдаём текущее
+        view.publish("state", view.status())
+        return view
+
+    # ---- воркер (поток пула) ----
+    def _on_job(self, job: jobs.Job):
+        view = self.views.get(job.id)
+        if view is None:
+            return
+        view.publish("state", view.status())
+        if job.state == jobs.CANCELLED and view.result is None:
+            self._finish(view, {"state": jobs.CANCELLED})
+
+    def _finish(self, view: JobView, result: dict):
+        view.result = {**view.status(), **result}
+        view.publish("done", view.result)
+
+    def _run(self, job: jobs.Job, queue: jobs.JobQueue, view: JobView):
+        view.job = job
+        result = run(job, queue, view.publish)
+        if view.result is None:
+            self._finish(view, result)
+
+    def cancel(self, job_id: int) -> bool:
+        return self.queue.cancel(job_id)
+
+    # ---- уборка ----
+    async def reap(self):
+        """Forget finished jobs older than KEEP_FINISHED_S."""
+        while True:
+            await asyncio.sleep(60)
+            self._reap_once(time.time())
+
+    def _reap_once(self, now: float):
+        for jid, view in list(self.views.items()):
+            j = view.job
+            if j.finished and now - (j.finished_at or now) > KEEP_FINISHED_S:
+                self._forget(jid)
+
+    def _forget(self, jid: int):
+        self.views.pop(jid, None)
+        self.queue.forget(jid)
+
+    def start(self):
+        pass
+
+    def close(self):
+        self.queue.shutdown()
+
+
+class PoolService(Service):
+    """Service whose jobs run in pool.Supervisor worker processes.
+
+    Job state lives in jobdb; here are only mirror Job objects for the
+    HTTP views, updated from worker events."""
+
+    def __init__(
+        self,
+        processes: int,
+        threads: int = SERVER_WORKERS,
+        db_path: str | None = None,
+    ):
+        self.configs = modelconf.read_all()
+        self.views: dict[int, JobView] = {}
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.db = jobdb.JobDB(db_path)
+        # общий кеш воркеров (sniff выводов) — чистит просроченное HTTP-процесс
+        self.cache = jobdb.SharedCache(self.db.path)
+        self.supervisor = pool.Supervisor(
+            processes, threads, self.db.path, self._on_event
+        )
+
+    def start(self):
+        # задачи, оставшиеся от прошлого запуска, доводятся воркерами —
+        # их состояние и итог доступны по тем же id
+        for row in self.db.unfinished(origin=jobdb.SERVER):
+            view = JobView(self.loop)
+            view.job = jobs.Job(
+                id=row["id"],
+                model=row["model"],
+                input=row["input"],
+                priority=row["priority"],
+                prediction_id=row["prediction_id"],
+                created_at=row["created_at"],
+            )
+            self.views[row["id"]] = view
+        self.supervisor.start()
+
+    def submit(self, body: dict) -> JobView:
+        model, payload = self.build_input(body)
+        priority = _priority(body)
+        jid = self.db.add(model, payload, priority)
+        view = JobView(self.loop)
+        view.job = jobs.Job(id=jid, model=model, input=payload, priority=priority)
+        self.views[jid] = view
+        self.supervisor.dispatch(jid)
+        view.publish("state", view.status())
+        return view
+
+    def cancel(self, job_id: int) -> bool:
+        view = self.views.get(job_id)
+        if view is None or view.job.finished:
+            return False
+        if self.db.cancel_queued(job_id):
+            self._apply(job_id, "done", {"state": jobs.CANCELLED})
+            return True
+        row = self.db.get(job_id)
+        if not row or not row["worker"]:
+            return False
+        return self.supervisor.cancel(job_id, row["worker"])
+
+    # ---- события воркеров (поток чтения пула) ----
+    def _on_event(self, jid: int, kind: str, data: dict):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._apply, jid, kind, data)
+
+    def _apply(self, jid: int, kind: str, data: dict):
+        view = self.views.get(jid)
+        if view is None or view.result is not None:
+            return
+        if kind == "text":
+            view._fanout(kind, data)
+            return
+        job = view.job
+        for k in ("status", "prediction_id", "error"):
+            if data.get(k) is not None:
+                setattr(job, k, data[k])
+        job.state = data.get("state") or job.state
+        if job.state != jobs.QUEUED and job.started_at is None:
+            job.started_at = time.time()
+        if job.finished and job.finished_at is None:
+            job.finished_at = time.time()
+        if kind == "done":
+            view.result = {**view.status(), **data}
+            view._fanout("done", view.result)
+        else:
+            view._fanout("state", view.status())
+
+    def _reap_once(self, now: float):
+        super()._reap_once(now)
+        self.db.purge(KEEP_FINISHED_S)
+        self.cache.expire()
+
+    def _forget(self, jid: int):
+        self.views.pop(jid, None)
+
+    def close(self):
+        self.supervisor.stop()
+
+
+# ---------------- выполнение задачи ----------------
+def run(job: jobs.Job, queue: jobs.JobQueue, publish) -> dict:
+    """execute() inside the job's log context, trace span and profile;
+    shared by the in-process queue and pool workers."""
+    with logs.context(model=job.model, job=job.id), tracing.span(
+        "request", model=job.model, job=job.id, server=True
+    ):
+        with profiling.request_profile(job.model, job=job.id):
+            return execute(job, queue, publish)
+
+
+def execute(job: jobs.Job, queue: jobs.JobQueue, publish) -> dict:
+    """Prediction → outputs → store for one job; states go through
+    queue.set_state(), streamed text through publish("text", ...).
+    A job that already has a prediction_id is resumed, not re-created."""
+    client = predictions.get_client()
+
+    def on_status(p):
+        queue.set_state(job, jobs.RUNNING, prediction_id=p.id, status=p.status)
+
+    try:
+        if job.prediction_id:
+            # prediction уже создан прошлым воркером — только доводим его
+            res = predictions.resume(
+                client, job.prediction_id, on_status, job.cancel_event
+            )
+        else:
+            queue.set_state(job, jobs.CREATING)
+            # с блоком "hedge" в конфиге модели — дубль при долгом старте
+            res = hedge.run(
+                client,
+                job.model,
+                job.input,
+                on_text=lambda t: publish("text", {"text": t}),
+                on_status=on_status,
+                cancel_event=job.cancel_event,
+            )
+    except predictions.Cancelled:
+        queue.set_state(job, jobs.CANCELLED)
+        return {"state": jobs.CANCELLED}
+    except Exception as e:
+        log.exception("исключение при запросе")
+        queue.set_state(job, jobs.FAILED, error=str(e))
+        return {"state": jobs.FAILED, "error": str(e)}
+    pred = res.prediction
+    metrics = getattr(pred, "metrics", None) or {}
+    base = {
+        "prediction_id": pred.id,
+        "metrics": metrics,
+        "ttft": res.ttft,
+        "latency": res.latency,
+    }
+    if pred.status != "succeeded":
+        err = str(getattr(pred, "error", None) or pred.status)
+        queue.set_state(job, jobs.FAILED, status=pred.status, error=err)
+        return {**base, "state": jobs.FAILED, "error": err}
+    items = outputs.classify(pred.output)
+    if outputs.s3_configured() and any(i.is_media for i in items):
+        queue.set_state(job, jobs.UPLOADING, status="S3")
+        with tracing.span("outputs.persist"):
+            outputs.persist(items, pred.id)
+    store.get_store().record_items(items, pred.id, job.model, job.input)
+    queue.set_state(job, jobs.DONE, status=pred.status)
+    out = pred.output
+    if (
+        isinstance(out, list)
+        and all(isinstance(x, str) for x in out)
+        and not outputs.extract_urls(out)
+    ):
+        # LLM отдаёт список токенов — клиенту нужен склеенный текст
+        text = "".join(out)
+    else:
+        text = outputs.render_text(items)
+    return {
+        **base,
+        "state": jobs.DONE,
+        "text": text,
+        "outputs": [_item_json(it) for it in items],
+    }
+
+
+def _item_json(it: outputs.OutputItem) -> dict:
+    return {
+        "kind": it.kind,
+        "text": it.text,
+        "url": it.persisted_url or it.url,
+        "source_url": it.url,
+        "s3_key": it.s3_key,
+        "mime": it.mime,
+        "size": it.size,
+        "truncated": it.more is not None,
+    }
+
+
+# ---------------- HTTP ----------------
+def _http_error(cls, detail: str) -> web.HTTPException:
+    return cls(text=json.dumps({"detail": detail}), content_type="application/json")
+
+
+def _priority(body: dict) -> int:
+    value = body.get("priority")
+    if value is None:
+        return 0
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise _http_error(web.HTTPBadRequest, "priority должен быть числом")
+    try:
+        return int(value)
+    except (ValueError, OverflowError):
+        raise _http_error(web.HTTPBadRequest, "priority должен быть числом")
+
+
+def _view(request) -> JobView:
+    svc: Service = request.app["service"]
+    try:
+        view = svc.views.get(int(request.match_info["id"]))
+    except ValueError:
+        view = None
+    if view is None:
+        raise _http_error(web.HTTPNotFound, "нет такой задачи")
+    return view
+
+
+@web.middleware
+async def auth_middleware(request, handler):
+    if SERVER_TOKEN and request.path != "/healthz":
+        if request.headers.get("Authorization") != f"Bearer {SERVER_TOKEN}":
+            return web.json_response({"detail": "нужен токен"}, status=401)
+    return await handler(request)
+
+
+async def submit(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        return web.json_response({"detail": "ожидался JSON"}, status=400)
+    view = request.app["service"].submit(body)
+    return web.json_response(view.status(), status=202)
+
+
+async def status(request):
+    return web.json_response(_view(request).status())
+
+
+async def cancel(request):
+    view = _view(request)
+    ok = request.app["service"].cancel(view.job.id)
+    return web.json_response({**view.status(), "cancelled": ok})
+
+
+async def result(request):
+    view = _view(request)
+    try:
+        wait = min(float(request.query.get("wait", 0) or 0), MAX_WAIT_S)
+    except ValueError:
+        raise _http_error(web.HTTPBadRequest, "wait — число секунд")
+    if view.result is None and wait > 0:
+        try:
+            await asyncio.wait_for(view.done.wait(), wait)
+        except asyncio.TimeoutError:
+            pass
+    if view.result is None:
+        return web.json_response(view.status(), status=202)
+    return web.json_response(view.result)
+
+
+async def stream(request):
+    view = _view(request)
+    resp = web.StreamResponse(
+        headers={"Content-Type": "text/event-stream", "Cache-Control": "no-store"}
+    )
+    await resp.prepare(request)
+    q: asyncio.Queue = asyncio.Queue()
+    # сначала уже случившееся, затем новое; подписка без await между ними
+    backlog = list(view.events)
+    view.subscribers.add(q)
+    try:
+        for seq, (kind, data) in enumerate(backlog, 1):
+            await _send_event(resp, seq, kind, data)
+        seq = len(backlog)
+        finished = any(kind == "done" for kind, _ in backlog)
+        while not finished:
+            kind, data = await q.get()
+            seq += 1
+            await _send_event(resp, seq, kind, data)
+            finished = kind == "done"
+    except (ConnectionResetError, asyncio.CancelledError):
+        pass
+    finally:
+        view.subscribers.discard(q)
+    return resp
+
+
+async def _send_event(resp, seq: int, kind: str, data: dict):
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    await resp.write(f"event: {kind}\nid: {seq}\ndata: {payload}\n\n".encode("utf-8"))
+
+
+async def models(request):
+    svc: Service = request.app["service"]
+    return web.json_response(
+        [
+            {
+                "model_id": mid,
+                "label": cfg.get("label"),
+                "kind": cfg.get("kind"),
+                "controls": [
+                    c for c in cfg.get("controls", []) if not c.get("hidden")
+                ],
+            }
+            for mid, cfg in sorted(svc.configs.items())
+        ]
+    )
+
+
+async def healthz(request):
+    svc: Service = request.app["service"]
+    active = sum(1 for v in svc.views.values() if not v.job.finished)
+    out = {"ok": True, "active": active, "jobs": len(svc.views)}
+    if isinstance(svc, PoolService):
+        out["processes"] = svc.supervisor.alive()
+    return web.json_response(out)
+
+
+def make_app(service: Service | None = None) -> web.Application:
+    app = web.Application(middlewares=[auth_middleware])
+    app["service"] = service or Service()
+
+    async def on_startup(app):
+        svc = app["service"]
+        svc.loop = asyncio.get_running_loop()
+        svc.start()
+        app["reaper"] = asyncio.create_task(svc.reap())
+        if isinstance(svc, PoolService) and hasattr(signal, "SIGHUP"):
+            # kill -HUP — плавно заменить воркеров (новый код, утечки)
+            svc.loop.add_signal_handler(
+                signal.SIGHUP,
+                lambda: threading.Thread(target=svc.supervisor.restart).start(),
+            )
+
+    async def on_cleanup(app):
+        app["reaper"].cancel()
+        # пул дорабатывает начатые задачи — не в цикле событий
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, app["service"].close)
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.add_routes(
+        [
+            web.post("/v1/jobs", submit),
+            web.get("/v1/jobs/{id}", status),
+            web.get("/v1/jobs/{id}/stream", stream),
+            web.post("/v1/jobs/{id}/cancel", cancel),
+            web.get("/v1/jobs/{id}/result", result),
+            web.get("/v1/models", models),
+            web.get("/healthz", healthz),
+        ]
+    )
+    return app
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="HTTP-сервис воркбенча")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8080)
+    ap.add_argument(
+        "--workers",
+        type=int,
+        default=SERVER_WORKERS,
+        help="потоков на процесс",
+    )
+    ap.add_argument(
+        "--processes",
+        type=int,
+        default=pool.SERVER_PROCESSES,
+        help="процессов-воркеров (0 — всё в одном процессе, без журнала)",
+    )
+    args = ap.parse_args(argv)
+    try:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+    except ImportError:
+        pass
+    if not os.getenv("REPLICATE_API_KEY"):
+        raise SystemExit("REPLICATE_API_KEY не задан")
+    if args.processes > 0:
+        service = PoolService(args.processes, threads=args.workers)
+    else:
+        service = Service(workers=args.workers)
+    web.run_app(
+        make_app(service),
+        host=args.host,
+        port=args.port,
+        print=lambda msg: log.info(msg),
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+"""
+Локальное хранилище выводов с адресацией по содержимому.
+
+Файлы лежат в store/<sha256[:2]>/<sha256>, индекс — в SQLite:
+    blobs   — sha256, размер, mime, время последнего обращения (для LRU);
+    outputs — prediction id, номер вывода, модель, хеш входа, S3-ключ,
+              исходная ссылка и sha256 содержимого (когда уже скачано).
+
+Ссылки доставки живут недолго, поэтому fetch() берёт файл с диска, а если
+его нет — из S3 (свежая presigned-ссылка), и только потом по исходной
+ссылке; скачанное кладётся в хранилище. Общий объём ограничен
+AIHUB_STORE_MB, вытесняются давно не открывавшиеся файлы.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.request
+
+STORE_MB = int(os.getenv("AIHUB_STORE_MB", "2048"))
+STORE_DIR = os.getenv("AIHUB_STORE_DIR")
+FETCH_TIMEOUT = 60
+CHUNK = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mime TEXT,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blobs_lru ON blobs(last_access);
+CREATE TABLE IF NOT EXISTS outputs (
+    id INTEGER PRIMARY KEY,
+    prediction_id TEXT,
+    idx INTEGER NOT NULL DEFAULT 0,
+    model TEXT,
+    input_hash TEXT,
+    url TEXT,
+    s3_key TEXT,
+    sha256 TEXT,
+    mime TEXT,
+    created_at REAL NOT NULL,
+    UNIQUE (prediction_id, idx)
+);
+CREATE INDEX IF NOT EXISTS outputs_url ON outputs(url);
+CREATE INDEX IF NOT EXISTS outputs_s3 ON outputs(s3_key);
+CREATE INDEX IF NOT EXISTS outputs_input ON outputs(model, input_hash);
+"""
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def input_hash(model: str, input: dict) -> str:
+    """Stable hash of a request (same model + same input -> same hash)."""
+    blob = json.dumps(
+        {"model": model, "input": input},
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def get_store() -> "OutputStore":
+    """Shared store for the process."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = OutputStore()
+        return _store
+
+
+class OutputStore:
+    def __init__(self, root: str | None = None, max_bytes: int | None = None):
+        if root is None:
+            if STORE_DIR:
+                root = STORE_DIR
+            else:
+                from paths import data_path
+
+                root = os.path.dirname(data_path("store", "index.sqlite3"))
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.max_bytes = STORE_MB * 1024 * 1024 if max_bytes is None else max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            os.path.join(root, "index.sqlite3"), timeout=30, check_same_thread=False
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        # один и тот же объект не качаем параллельно из двух потоков
+        self._fetching: dict[str, threading.Lock] = {}
+
+    # ---- индекс ----
+    def record(
+        self,
+        prediction_id: str,
+        url: str | None,
+        model: str | None = None,
+        input_hash: str | None = None,
+        s3_key: str | None = None,
+        idx: int = 0,
+        mime: str | None = None,
+    ):
+        """Link an output to its prediction; content is fetched lazily."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO outputs(prediction_id, idx, model, input_hash, url,
+                                    s3_key, mime, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(prediction_id, idx) DO UPDATE SET
+                    url = COALESCE(excluded.url, url),
+                    s3_key = COALESCE(excluded.s3_key, s3_key),
+                    mime = COALESCE(excluded.mime, mime)
+                """,
+                (
+                    prediction_id,
+                    idx,
+                    model,
+                    input_hash,
+                    url,
+                    s3_key,
+                    mime,
+                    time.time(),
+                ),
+            )
+
+    def record_items(self, items, prediction_id: str, model: str, input: dict):
+        """Index media items of outputs.classify() for one prediction."""
+        ih = input_hash(model, input)
+        media = [it for it in items if it.is_media and it.url]
+        for idx, it in enumerate(media):
+            self.record(prediction_id, it.url, model, ih, it.s3_key, idx, it.mime)
+
+    def find(
+        self,
+        url: str | None = None,
+        s3_key: str | None = None,
+        prediction_id: str | None = None,
+    ) -> dict | None:
+        clauses, params = [], []
+        for col, val in (
+            ("s3_key", s3_key),
+            ("url", url),
+            ("prediction_id", prediction_id),
+        ):
+            if val:
+                clauses.append(f"{col} = ?")
+                params.append(val)
+        if not clauses:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM outputs WHERE "
+                + " OR ".join(clauses)
+                + " ORDER BY sha256 IS NULL, id DESC LIMIT 1",
+                params,
+            ).fetchone()
+        return dict(row) if row else None
+
+    def by_input(self, model: str, input_hash: str) -> list[dict]:
+        """Earlier outputs of an identical request."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM outputs WHERE model = ? AND input_hash = ?"
+                " ORDER BY id DESC",
+                (model, input_hash),
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    # ---- содержимое ----
+    def blob_path(self, sha: str) -> str:
+        return os.path.join(self.root, sha[:2], sha)
+
+    def local_path(
+        self, url: str | None = None, s3_key: str | None = None
+    ) -> str | None:
+        """Path of the cached content, or None (no network)."""
+        row = self.find(url=url, s3_key=s3_key)
+        if not row or not row["sha256"]:
+            return None
+        path = self.blob_path(row["sha256"])
+        if not os.path.exists(path):
+            return None
+        self._touch(row["sha256"])
+        return path
+
+    def fetch(
+        self, url: str | None = None, s3_key: str | None = None, presign=None
+    ) -> str:
+        """Local path of an output: disk, else S3 copy, else source URL."""
+        path = self.local_path(url, s3_key)
+        if path:
+            return path
+        ident = s3_key or url
+        with self._lock:
+            gate = self._fetching.setdefault(ident, threading.Lock())
+        try:
+            with gate:
+                path = self.local_path(url, s3_key)
+                if path:
+                    return path
+                sha = self._fetch_new(url, s3_key, presign)
+        finally:
+            with self._lock:
+                self._fetching.pop(ident, None)
+        # только что скачанный файл не вытесняем, даже если он больше лимита
+        self.evict(keep=(sha,))
+        return self.blob_path(sha)
+
+    def _fetch_new(self, url, s3_key, presign) -> str:
+        """Download from S3 (fresh presigned link) or the source URL."""
+        sources = []
+        if s3_key:
+            if presign is None:
+                from outputs import s3_presign as presign
+            try:
+                sources.append(presign(s3_key))
+            except Exception:
+                pass
+        if url:
+            sources.append(url)
+        err = None
+        for src in sources:
+            try:
+                sha, mime = self._download(src)
+                break
+            except Exception as e:
+                err = e
+        else:
+            raise RuntimeError(f"не удалось скачать: {err}")
+        match = "(url = ? AND ? IS NOT NULL) OR (s3_key = ? AND ? IS NOT NULL)"
+        keys = (url, url, s3_key, s3_key)
+        with self._lock, self._conn:
+            known = self._conn.execute(
+                f"SELECT id FROM outputs WHERE {match} LIMIT 1", keys
+            ).fetchone()
+            if known is None:
+                # открыли то, что не попало в индекс при генерации
+                self._conn.execute(
+                    "INSERT INTO outputs(url, s3_key, created_at)"
+                    " VALUES (?, ?, ?)",
+                    (url, s3_key, time.time()),
+                )
+            self._conn.execute(
+                "UPDATE outputs SET sha256 = ?, mime = COALESCE(mime, ?)"
+                f" WHERE {match}",
+                (sha, mime) + keys,
+            )
+        return sha
+
+    def read(self, url: str | None = None, s3_key: str | None = None) -> bytes:
+        with open(self.fetch(url, s3_key), "rb") as f:
+            return f.read()
+
+    def _download(self, src: str) -> tuple[str, str | None]:
+        h = hashlib.sha256()
+        tmp = os.path.join(self.root, f".dl-{os.getpid()}-{threading.get_ident()}")
+        size = 0
+        try:
+            with urllib.request.urlopen(src, timeout=FETCH_TIMEOUT) as resp, open(
+                tmp, "wb"
+            ) as out:
+                mime = resp.headers.get("Content-Type")
+                for chunk in iter(lambda: resp.read(CHUNK), b""):
+                    h.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        sha = h.hexdigest()
+        final = self.blob_path(sha)
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        os.replace(tmp, final)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO blobs(sha256, size, mime, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT(sha256) DO UPDATE"
+                " SET last_access = excluded.last_access",
+                (sha, size, mime, now, now),
+            )
+        return sha, mime
+
+    def _touch(self, sha: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE blobs SET last_access = ? WHERE sha256 = ?",
+                (time.time(), sha),
+            )
+
+    # ---- вытеснение ----
+    def total_bytes(self) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM blobs"
+            ).fetchone()
+        return int(row[0])
+
+    def evict(self, keep: tuple = ()):
+        """Drop least recently opened blobs (except `keep`) until under the
+        size cap. Index rows stay: the S3 key still lets us fetch them
+        again."""
+        total = self.total_bytes()
+        if total <= self.max_bytes:
+            return
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT sha256, size FROM blobs ORDER BY last_access"
+            ).fetchall()
+        for r in rows:
+            if total <= self.max_bytes:
+                break
+            if r["sha256"] in keep:
+                continue
+            try:
+                os.remove(self.blob_path(r["sha256"]))
+            except FileNotFoundError:
+                pass
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "DELETE FROM blobs WHERE sha256 = ?", (r["sha256"],)
+                )
+                self._conn.execute(
+                    "UPDATE outputs SET sha256 = NULL WHERE sha256 = ?", (r["sha256"],)
+                )
+            total -= r["size"]
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import http.server
+import os
+import sys
+import threading
+
+import pytest
+
+# модули лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def serve(tmp_path):
+    """Serve files from a temp dir over HTTP; yields (dir, base_url)."""
+    root = tmp_path / "www"
+    root.mkdir()
+
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=str(root), **kwargs)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield root, f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+
+
+@pytest.fixture
+def fake_replicate(monkeypatch):
+    """Factory: start(**FakeConfig fields) runs fake_replicate in a thread
+    and points predictions.get_client() (and child processes) at it."""
+    import fake_replicate
+    import predictions
+
+    servers = []
+
+    def start(**config):
+        server = fake_replicate.start(fake_replicate.FakeConfig(**config))
+        servers.append(server)
+        monkeypatch.setenv("REPLICATE_BASE_URL", server.url)
+        monkeypatch.setenv("REPLICATE_API_KEY", "fake")
+        monkeypatch.setattr(predictions, "_client", None)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+from context import build_messages, context_budget, summarize_turns
+
+
+def _turns(n: int, tokens: int) -> list[dict]:
+    """n alternating turns, oldest first: "Turn 1." (user), "Turn 2." ..."""
+    return [
+        {
+            "role": "user" if i % 2 else "assistant",
+            "content": f"Turn {i}. Details of turn {i}",
+            "token_count": tokens,
+        }
+        for i in range(1, n + 1)
+    ]
+
+
+def test_truncate_keeps_newest_turns_within_budget():
+    history = _turns(4, 10)
+    # промпт (~1 токен + 4) и две реплики по 10 + 4
+    messages, stats = build_messages(reversed(history), "hi", budget=33)
+
+    assert [m["content"] for m in messages] == [
+        "Turn 3. Details of turn 3",
+        "Turn 4. Details of turn 4",
+        "hi",
+    ]
+    assert messages[-1]["role"] == "user"
+    assert stats.included == 2
+    assert stats.dropped == 1  # чтение останавливается на первой невлезшей
+    assert stats.tokens <= 33
+
+
+def test_system_prompt_first_and_counted():
+    messages, stats = build_messages(
+        reversed(_turns(2, 10)), "hi", budget=1000, system_prompt="Be brief."
+    )
+    assert messages[0] == {"role": "system", "content": "Be brief."}
+    assert len(messages) == 4
+    assert stats.included == 2 and stats.dropped == 0
+
+
+def test_prompt_over_budget_is_cut_and_history_skipped():
+    prompt = "word " * 400
+    messages, stats = build_messages(reversed(_turns(4, 10)), prompt, budget=50)
+    assert len(messages) == 1
+    assert messages[0]["content"].endswith("…")
+    assert len(messages[0]["content"]) < len(prompt)
+    assert stats.included == 0
+
+
+def test_non_chat_roles_are_ignored():
+    history = [
+        {"role": "meta", "content": "preview", "token_count": 1},
+        {"role": "error", "content": "boom", "token_count": 1},
+    ] + _turns(2, 5)
+    messages, _ = build_messages(reversed(history), "hi", budget=1000)
+    assert [m["role"] for m in messages] == ["user", "assistant", "user"]
+
+
+def test_summarize_puts_older_turns_in_order_before_kept_ones():
+    history = _turns(8, 40)
+    messages, stats = build_messages(
+        reversed(history), "hi", budget=200, strategy="summarize"
+    )
+
+    summary = messages[0]
+    assert summary["role"] == "system"
+    assert summary["content"].startswith("Summary of the earlier conversation:")
+    lines = summary["content"].splitlines()[1:]
+    # выжимка в хронологическом порядке, из первых предложений реплик
+    assert lines == [
+        f"{'User' if i % 2 else 'Assistant'}: Turn {i}." for i in range(1, 6)
+    ]
+    assert [m["content"] for m in messages[1:-1]] == [
+        f"Turn {i}. Details of turn {i}" for i in range(6, 9)
+    ]
+    assert stats.included == 3
+    assert stats.summarized == 5
+
+
+def test_summary_over_budget_drops_oldest_lines():
+    turns = _turns(30, 10)
+    text = summarize_turns(turns, max_tokens=40)
+    lines = text.splitlines()[1:]
+    assert lines
+    assert lines[-1] == "Assistant: Turn 30."
+    assert "Turn 1." not in text
+
+
+def test_context_budget_from_config():
+    assert context_budget({"context": {"max_tokens": 6000, "strategy": "x"}}) == (
+        6000,
+        "x",
+    )
+    budget, strategy = context_budget({"context": {"max_tokens": "bad"}})
+    assert strategy == "truncate" and budget > 0
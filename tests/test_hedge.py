@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+
+import hedge
+import predictions
+import profiling
+
+# порог фиксирован: min_s = max_s, замеров нет
+CFG = {"hedge": {"min_s": 0.3, "max_s": 0.3, "fallback_s": 0.3}}
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    s = hedge.HedgeStore(str(tmp_path / "hedge.sqlite3"))
+    monkeypatch.setattr(hedge, "_store", s)
+    monkeypatch.setattr(hedge, "_thresholds", {})
+    return s
+
+
+@pytest.fixture
+def fake(fake_replicate):
+    """Fake API whose queue times are taken in order from fake.queue."""
+    server = fake_replicate(run="0.3", tokens=6, output="text")
+    server.queue = []
+    server.state.queue_dist = lambda rng: server.queue.pop(0)
+    return server
+
+
+def _race(fake, *queue_s):
+    fake.queue[:] = queue_s
+    texts = []
+    res = hedge.run(
+        predictions.get_client(), "fake/text", {"prompt": "hi"}, CFG, texts.append
+    )
+    for t in threading.enumerate():
+        if t.name == "hedge-settle":
+            t.join(10)
+    return res, "".join(texts)
+
+
+def _created(fake) -> list:
+    """Fake predictions in creation order."""
+    return sorted(fake.state.predictions.values(), key=lambda p: p.created)
+
+
+def test_hedge_wins_when_primary_is_stuck(store, fake):
+    res, text = _race(fake, 30.0, 0.05)
+
+    primary, dup = _created(fake)
+    assert res.prediction.id == dup.id and res.prediction.status == "succeeded"
+    assert text == "".join(dup.tokens)
+    assert primary.canceled_at is not None  # проигравший отменён
+    (row,) = store.report(1)
+    assert row["fired"] == 1 and row["hedge_won"] == 1
+
+
+def test_first_leg_with_output_wins(store, fake):
+    # дубль уходит на 0.3 c, основной начинает выдавать вывод на 0.8 c
+    res, text = _race(fake, 0.8, 30.0)
+
+    primary, dup = _created(fake)
+    assert res.prediction.id == primary.id
+    assert text == "".join(primary.tokens)
+    assert dup.canceled_at is not None and primary.canceled_at is None
+    assert fake.state.stats()["by_status"] == {"succeeded": 1, "canceled": 1}
+    (row,) = store.report(1)
+    assert row["fired"] == 1 and row["hedge_won"] == 0
+
+
+def test_no_hedge_before_threshold(store, fake):
+    res, _ = _race(fake, 0.0)
+
+    assert len(fake.state.predictions) == 1
+    assert res.prediction.status == "succeeded"
+    (row,) = store.report(1)
+    assert row["fired"] == 0 and row["skipped"] == 0
+    assert len(store.start_times("fake/text")) == 1
+
+
+def test_exhausted_budget_skips_hedge(store, fake, monkeypatch):
+    monkeypatch.setattr(hedge, "HEDGE_MAX_PER_DAY", 0)
+
+    res, _ = _race(fake, 0.8)
+
+    assert len(fake.state.predictions) == 1
+    assert res.prediction.status == "succeeded"
+    (row,) = store.report(1)
+    assert row["fired"] == 0 and row["skipped"] == 1
+
+
+def test_threshold_is_nearest_rank_percentile(store):
+    for s in range(1, 21):
+        store.add_latency("m", float(s), None)
+    pol = hedge.Policy(percentile=95, min_s=0, max_s=100, min_samples=20)
+
+    assert hedge.threshold("m", pol) == 19.0
+    assert profiling.percentile(range(1, 21), 95) == 19
+    assert profiling.percentile([5], 50) == 5
+    assert profiling.percentile([], 50) is None
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import imageprep
+
+Image = pytest.importorskip("PIL.Image")
+ImageCms = pytest.importorskip("PIL.ImageCms")
+
+
+@pytest.fixture
+def photo(tmp_path):
+    """3000x2000 JPEG with EXIF (camera, GPS) and an ICC profile."""
+    im = Image.new("RGB", (3000, 2000), (200, 120, 40))
+    exif = Image.Exif()
+    exif[0x010F] = "CameraMaker"  # Make
+    exif[0x8825] = {1: "N"}  # GPSInfo
+    icc = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+    path = tmp_path / "photo.jpg"
+    im.save(path, exif=exif.tobytes(), icc_profile=icc)
+    with Image.open(path) as src:
+        assert src.info.get("icc_profile") and src.getexif()
+    return str(path)
+
+
+@pytest.mark.parametrize("fmt", ["jpeg", "png", "webp"])
+def test_prepare_caps_size_and_strips_metadata(tmp_path, monkeypatch, photo, fmt):
+    monkeypatch.setattr(imageprep, "PREPROCESS_DIR", str(tmp_path / "out"))
+    opts = imageprep.options({"preprocess": {"max_edge": 512, "format": fmt}})
+
+    out = imageprep.prepare(photo, opts, "d" * 64)
+
+    assert out != photo and out.endswith(imageprep.FORMAT_EXT[fmt])
+    with Image.open(out) as im:
+        assert max(im.size) == 512
+        assert not im.info.get("icc_profile")
+        assert not im.info.get("exif")
+        assert len(im.getexif()) == 0
+
+
+def test_prepare_converts_cmyk_for_png(tmp_path, monkeypatch):
+    monkeypatch.setattr(imageprep, "PREPROCESS_DIR", str(tmp_path / "out"))
+    src = tmp_path / "cmyk.jpg"
+    Image.new("CMYK", (800, 600), (0, 50, 100, 0)).save(src)
+    opts = imageprep.options({"preprocess": {"max_edge": 400, "format": "png"}})
+
+    out = imageprep.prepare(str(src), opts, "c" * 64)
+
+    with Image.open(out) as im:
+        assert im.mode == "RGB" and im.size == (400, 300)
+    assert not [p for p in (tmp_path / "out").iterdir() if p.suffix == ".tmp"]
+
+
+def test_non_image_is_sent_as_is(tmp_path, monkeypatch):
+    monkeypatch.setattr(imageprep, "PREPROCESS_DIR", str(tmp_path / "out"))
+    src = tmp_path / "notes.pdf"
+    src.write_bytes(b"%PDF-1.4 not an image")
+    opts = imageprep.options({"preprocess": {"format": "jpeg"}})
+    assert imageprep.prepare(str(src), opts, "e" * 64) == str(src)
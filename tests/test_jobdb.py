@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import multiprocessing as mp
+import time
+
+import jobdb
+import jobs
+
+
+def _claim_all(db_path, wid, out):
+    """Worker-process body: claim until the queue is empty."""
+    db = jobdb.JobDB(db_path)
+    claimed = []
+    while (row := db.claim_next(wid)) is not None:
+        claimed.append(row["id"])
+    out.put((wid, claimed))
+
+
+def test_two_processes_never_claim_the_same_job(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    db = jobdb.JobDB(path)
+    ids = {db.add("fake/text", {"prompt": str(i)}) for i in range(200)}
+
+    ctx = mp.get_context("spawn")
+    out = ctx.Queue()
+    procs = [ctx.Process(target=_claim_all, args=(path, w, out)) for w in (1, 2)]
+    for p in procs:
+        p.start()
+    claimed = dict(out.get(timeout=60) for _ in procs)
+    for p in procs:
+        p.join(10)
+
+    assert not set(claimed[1]) & set(claimed[2])
+    assert set(claimed[1]) | set(claimed[2]) == ids
+    for wid, got in claimed.items():
+        for jid in got:
+            row = db.get(jid)
+            assert row["state"] == jobs.CREATING
+            assert row["worker"] == wid and row["attempts"] == 1
+
+
+def test_claim_order_follows_priority(tmp_path):
+    db = jobdb.JobDB(str(tmp_path / "jobs.sqlite3"))
+    low = db.add("m", {}, priority=5)
+    high = db.add("m", {}, priority=0)
+    db.add("m", {}, origin=jobdb.CLI)  # чужие задачи не берутся
+
+    assert db.claim_next(1)["id"] == high
+    assert db.claim_next(1)["id"] == low
+    assert db.claim_next(1) is None
+
+
+def test_requeue_keeps_prediction_id(tmp_path):
+    db = jobdb.JobDB(str(tmp_path / "jobs.sqlite3"))
+    jid = db.add("m", {})
+    db.claim_next(1)
+    db.update(jid, state=jobs.RUNNING, prediction_id="p1")
+
+    db.requeue(jid)
+    row = db.claim_next(2)
+
+    assert row["id"] == jid and row["prediction_id"] == "p1"
+    assert row["attempts"] == 2 and row["worker"] == 2
+
+
+def test_shared_cache_expire_drops_only_stale_keys(tmp_path):
+    cache = jobdb.SharedCache(str(tmp_path / "jobs.sqlite3"))
+    cache.put("old", {"v": 1}, ttl=0.01)
+    cache.put("new", {"v": 2})
+    time.sleep(0.05)
+
+    assert cache.get("old") is None
+    cache.expire()
+
+    keys = [r[0] for r in cache._conn.execute("SELECT key FROM cache")]
+    assert keys == ["new"]
+    assert cache.get("new") == {"v": 2}
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import json
+import sys
+
+import pytest
+
+from jsonview import PrettyStream, iter_pretty
+
+SAMPLES = [
+    {},
+    [],
+    "строка",
+    3.5,
+    None,
+    {"a": [1, 2, {"b": None, "c": [True, False]}], "d": {}, "e": [], "ключ": "ё"},
+    [[], [[]], {"x": {"y": {"z": [1, "2", 3.25]}}}],
+]
+
+
+@pytest.mark.parametrize("obj", SAMPLES)
+def test_matches_json_dumps(obj):
+    text = "".join(iter_pretty(obj, collapse_numbers=0))
+    assert text == json.dumps(obj, indent=2, ensure_ascii=False)
+    assert json.loads(text) == obj
+
+
+def test_deep_nesting_round_trips_without_recursion():
+    depth = sys.getrecursionlimit() * 3
+    obj = leaf = {}
+    for _ in range(depth):
+        leaf["n"] = [{}]
+        leaf = leaf["n"][0]
+    leaf["end"] = 1
+
+    text = "".join(iter_pretty(obj))
+
+    assert text.count('"n"') == depth
+    assert text.rstrip().endswith("}")
+    assert '"end": 1' in text
+
+
+def test_long_number_arrays_are_collapsed():
+    text = "".join(iter_pretty({"embedding": [0.5] * 1000}, collapse_numbers=32))
+    assert "1000 чисел" in text
+    assert text.count("0.5") < 20
+
+
+def test_pages_respect_budget_and_join_to_full_text():
+    obj = {"segments": [{"id": i, "text": f"сегмент {i}"} for i in range(500)]}
+    full = "".join(iter_pretty(obj))
+    stream = PrettyStream(obj, budget=2048)
+
+    pages = []
+    while not stream.exhausted:
+        pages.append(stream.next_page())
+
+    assert len(pages) > 1
+    assert "".join(pages) == full
+    assert all(len(p.encode("utf-8")) <= 2048 for p in pages)
+    assert stream.shown_bytes == len(full.encode("utf-8"))
+    assert json.loads(full) == obj
+
+
+def test_chunk_larger_than_budget_still_makes_progress():
+    stream = PrettyStream({"text": "x" * 5000}, budget=100)
+    pages = []
+    while not stream.exhausted:
+        pages.append(stream.next_page())
+    assert json.loads("".join(pages)) == {"text": "x" * 5000}
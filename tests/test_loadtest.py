@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import subprocess
+import sys
+
+from profiling import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile([3, 1, 2], 50) == 2
+    assert percentile([7], 99) == 7
+    assert percentile([], 95) is None
+
+
+def test_loadtest_smoke_all_flows(tmp_path):
+    out = tmp_path / "report.json"
+    env = {**os.environ, "AIHUB_DATA_DIR": str(tmp_path), "AIHUB_LOG_LEVEL": "ERROR"}
+    proc = subprocess.run(
+        [
+            sys.executable,
+            os.path.join(ROOT, "loadtest.py"),
+            "--flow",
+            "all",
+            "-n",
+            "12",
+            "-c",
+            "4",
+            "--queue",
+            "0.01",
+            "--run",
+            "0.05",
+            "--tokens",
+            "4",
+            "--poll",
+            "0.02",
+            "--seed",
+            "1",
+            "--json",
+            str(out),
+        ],
+        cwd=str(tmp_path),
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert proc.returncode == 0, proc.stderr
+    reports = json.loads(out.read_text(encoding="utf-8"))["reports"]
+    assert [r["flow"] for r in reports] == ["cli", "gui", "stream"]
+    for r in reports:
+        assert r["predictions"] == 12
+        assert r["by_status"] == {"succeeded": 12}
+        assert r["latency_s"]["p50"] <= r["latency_s"]["p99"] <= r["latency_s"]["max"]
+    assert reports[2]["ttft_s"]
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import queue
+
+import pytest
+
+import jobdb
+import jobs
+import pool
+
+
+@pytest.fixture
+def sup(tmp_path):
+    """Supervisor that is never started: no worker processes, events
+    collected in sup.events."""
+    events = []
+    s = pool.Supervisor(
+        1, 1, str(tmp_path / "jobs.sqlite3"), lambda *e: events.append(e)
+    )
+    s.events = events
+    yield s
+    s.db.close()
+
+
+def _claimed(db, wid, **fields) -> int:
+    jid = db.add("fake/text", {"prompt": "hi"})
+    assert db.claim_next(wid)["id"] == jid
+    if fields:
+        db.update(jid, **fields)
+    return jid
+
+
+def _dispatched(s) -> list[int]:
+    out = []
+    while True:
+        try:
+            out.append(s.work_q.get(timeout=0.5))
+        except queue.Empty:
+            return out
+
+
+def test_reap_requeues_running_job_of_dead_worker(sup):
+    jid = _claimed(sup.db, 7, state=jobs.RUNNING, prediction_id="p1")
+    other = _claimed(sup.db, 8, state=jobs.RUNNING, prediction_id="p2")
+
+    sup._reap(7)
+
+    row = sup.db.get(jid)
+    assert row["state"] == jobs.QUEUED and row["worker"] is None
+    assert row["prediction_id"] == "p1"
+    assert sup.db.get(other)["state"] == jobs.RUNNING  # чужой воркер жив
+    assert sup.events == [(jid, "state", {"state": jobs.QUEUED})]
+    assert _dispatched(sup) == [jid]
+
+
+def test_reap_gives_up_after_max_attempts(sup):
+    jid = _claimed(sup.db, 7, state=jobs.RUNNING, prediction_id="p1")
+    with sup.db._conn:  # attempts пишет только claim_next
+        sup.db._conn.execute(
+            "UPDATE jobs SET attempts = ? WHERE id = ?", (jobdb.MAX_ATTEMPTS, jid)
+        )
+
+    sup._reap(7)
+
+    row = sup.db.get(jid)
+    assert row["state"] == jobs.FAILED and "попытки исчерпаны" in row["error"]
+    assert row["finished_at"]
+    (event,) = sup.events
+    assert event[:2] == (jid, "done") and event[2]["prediction_id"] == "p1"
+    assert _dispatched(sup) == []
+
+
+def test_requeued_job_is_claimed_again_until_exhausted(sup):
+    jid = _claimed(sup.db, 1, state=jobs.RUNNING, prediction_id="p1")
+    for wid in range(1, jobdb.MAX_ATTEMPTS):
+        sup._reap(wid)
+        assert sup.db.claim_next(wid + 1)["id"] == jid
+    sup._reap(jobdb.MAX_ATTEMPTS)
+
+    assert sup.db.get(jid)["state"] == jobs.FAILED
+    assert sup.db.claim_next(99) is None
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""Restart paths: jobs left behind by a dead process are finished by id,
+never re-created; jobs cut before create are failed."""
+import threading
+
+import pytest
+
+import jobdb
+import jobs
+import pool
+import predictions
+
+
+@pytest.fixture
+def fake(fake_replicate):
+    return fake_replicate(queue="0.01", run="0.1", tokens=3, output="text")
+
+
+def _created(fake) -> str:
+    """A prediction the "previous run" created; returns its id."""
+    client = predictions.get_client()
+    p = client.predictions.create(model="fake/text", input={"prompt": "hi"})
+    return p.id
+
+
+def _orphan_row(db, origin, state, prediction_id=None, worker=None) -> int:
+    jid = db.add("fake/text", {"prompt": "hi"}, origin=origin, state=state)
+    db.update(jid, prediction_id=prediction_id, worker=worker)
+    return jid
+
+
+def test_cli_resume_polls_by_id_and_fails_cut_rows(tmp_path, fake, capsys):
+    main = pytest.importorskip("main")
+    db = jobdb.JobDB(str(tmp_path / "jobs.sqlite3"))
+    pid = _created(fake)
+    cut = _orphan_row(db, jobdb.CLI, jobs.CREATING)
+    running = _orphan_row(db, jobdb.CLI, jobs.RUNNING, pid)
+    server_row = _orphan_row(db, jobdb.SERVER, jobs.RUNNING, pid, worker=1)
+
+    main.resume_unfinished(db)
+
+    assert db.get(cut)["state"] == jobs.FAILED
+    assert db.get(cut)["error"] == "прервано до создания prediction"
+    row = db.get(running)
+    assert row["state"] == jobs.DONE and row["finished_at"]
+    assert db.get(server_row)["state"] == jobs.RUNNING  # чужой журнал
+    assert pid in capsys.readouterr().out
+    assert fake.state.stats()["calls"].get("POST create") == 1
+
+
+def test_cli_resume_keeps_row_when_prediction_is_unreachable(tmp_path, fake):
+    main = pytest.importorskip("main")
+    db = jobdb.JobDB(str(tmp_path / "jobs.sqlite3"))
+    jid = _orphan_row(db, jobdb.CLI, jobs.RUNNING, "no-such-id")
+
+    main.resume_unfinished(db)
+
+    row = db.get(jid)
+    assert row["state"] == jobs.RUNNING and row["prediction_id"] == "no-such-id"
+
+
+def test_supervisor_start_resumes_jobs_of_previous_run(tmp_path, monkeypatch, fake):
+    pytest.importorskip("aiohttp")  # воркер выполняет задачи через server.py
+    monkeypatch.setenv("AIHUB_DATA_DIR", str(tmp_path / "data"))
+    path = str(tmp_path / "jobs.sqlite3")
+    db = jobdb.JobDB(path)
+    pid = _created(fake)
+    cut = _orphan_row(db, jobdb.SERVER, jobs.CREATING, worker=3)
+    running = _orphan_row(db, jobdb.SERVER, jobs.RUNNING, pid, worker=3)
+
+    done = threading.Event()
+    events = []
+
+    def on_event(jid, kind, data):
+        events.append((jid, kind, data))
+        if jid == running and kind == "done":
+            done.set()
+
+    sup = pool.Supervisor(1, 1, path, on_event)
+    sup.start()
+    try:
+        assert done.wait(60)
+    finally:
+        sup.stop(timeout=10)
+
+    assert db.get(cut)["state"] == jobs.FAILED
+    assert (cut, "done") in [e[:2] for e in events]
+    row = db.get(running)
+    assert row["state"] == jobs.DONE and row["prediction_id"] == pid
+    assert row["result"]["prediction_id"] == pid and row["result"]["text"]
+    assert fake.state.stats()["calls"].get("POST create") == 1
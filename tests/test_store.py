@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+import os
+
+from store import OutputStore
+
+
+def test_blob_larger_than_cap_is_kept_after_fetch(tmp_path, serve):
+    root, base = serve
+    data = os.urandom(300_000)
+    (root / "big.bin").write_bytes(data)
+    store = OutputStore(root=str(tmp_path / "store"), max_bytes=100_000)
+
+    assert store.read(url=f"{base}/big.bin") == data
+    assert store.local_path(url=f"{base}/big.bin") is not None
+
+
+def test_older_blobs_evicted_first(tmp_path, serve):
+    root, base = serve
+    (root / "a.bin").write_bytes(os.urandom(60_000))
+    (root / "b.bin").write_bytes(os.urandom(60_000))
+    store = OutputStore(root=str(tmp_path / "store"), max_bytes=100_000)
+
+    store.fetch(url=f"{base}/a.bin")
+    store.fetch(url=f"{base}/b.bin")
+
+    assert store.local_path(url=f"{base}/a.bin") is None
+    assert store.local_path(url=f"{base}/b.bin") is not None
+    assert store.total_bytes() <= 100_000
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from transcribe import MISSING_TEXT, plan_chunks, split_points, stitch
+
+
+def test_split_points_prefer_nearest_pause():
+    silences = [(590.0, 592.0), (640.0, 641.0), (1195.0, 1197.0)]
+    cuts = split_points(1800.0, silences, chunk_s=600, search_s=60)
+    assert cuts == [0.0, 591.0, 1196.0, 1800.0]
+
+
+def test_split_points_hard_cut_without_pause():
+    assert split_points(1500.0, [], chunk_s=600) == [0.0, 600.0, 1200.0, 1500.0]
+
+
+def test_short_recording_is_one_cut():
+    assert split_points(700.0, [], chunk_s=600) == [0.0, 700.0]
+
+
+def test_plan_chunks_overlap_clamped_to_recording():
+    chunks = plan_chunks(30.0, [0.0, 10.0, 20.0, 30.0], overlap=2.0)
+    assert [(c.start, c.end) for c in chunks] == [
+        (0.0, 12.0),
+        (8.0, 22.0),
+        (18.0, 30.0),
+    ]
+    assert [(c.own_start, c.own_end) for c in chunks] == [
+        (0.0, 10.0),
+        (10.0, 20.0),
+        (20.0, 30.0),
+    ]
+
+
+def _seg(start, end, text):
+    return {"start": start, "end": end, "text": text}
+
+
+def test_stitch_shifts_timestamps_and_dedups_overlap():
+    chunks = plan_chunks(20.0, [0.0, 10.0, 20.0], overlap=2.0)
+    # кусок 1 начинается на 8.0: «stitched» (середина 9.0) — в зоне куска 0
+    chunks[0].output = {"segments": [_seg(0, 4, "Hello"), _seg(8, 10.5, "stitched")]}
+    chunks[1].output = {"segments": [_seg(0, 2, "stitched"), _seg(3, 6, "world")]}
+
+    segments, text = stitch(chunks)
+
+    assert text == "Hello stitched world"
+    assert [(s["start"], s["end"]) for s in segments] == [
+        (0.0, 4.0),
+        (8.0, 10.5),
+        (11.0, 14.0),
+    ]
+    assert [s["id"] for s in segments] == [0, 1, 2]
+
+
+def test_stitch_text_only_outputs_drop_repeated_words():
+    chunks = plan_chunks(30.0, [0.0, 10.0, 20.0, 30.0], overlap=2.0)
+    chunks[0].output = "Hello there, my friend. How are you"
+    chunks[1].output = "how are you doing today? Fine thanks."
+    chunks[2].output = [{"transcription": "Fine thanks. Bye now"}]
+
+    _, text = stitch(chunks)
+
+    assert (
+        text == "Hello there, my friend. How are you doing today? Fine thanks. Bye now"
+    )
+
+
+def test_stitch_marks_missing_chunks():
+    chunks = plan_chunks(30.0, [0.0, 10.0, 20.0, 30.0], overlap=2.0)
+    chunks[0].output = "first part"
+    chunks[2].output = "third part"
+
+    segments, text = stitch(chunks)
+
+    assert text == f"first part {MISSING_TEXT} third part"
+    missing = [s for s in segments if s.get("missing")]
+    assert [(s["start"], s["end"]) for s in missing] == [(10.0, 20.0)]
+
+
+@pytest.mark.parametrize("output", [None, "", []])
+def test_stitch_empty(output):
+    chunks = plan_chunks(5.0, [0.0, 5.0], overlap=0.0)
+    chunks[0].output = output
+    segments, text = stitch(chunks)
+    if output is None:
+        assert text == MISSING_TEXT
+    else:
+        assert segments == [] and text == ""
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Миниатюры для галереи изображений.
+
+- миниатюра делается один раз: исходник скачивается, JPEG декодируется
+  сразу в уменьшенном масштабе (draft), результат пишется в дисковый кеш;
+- в памяти — LRU готовых миниатюр с ограничением по байтам
+  (THUMB_MEM_MB), дальше — диск, и только потом сеть;
+- загрузка идёт в небольшом пуле потоков, один и тот же ключ не качается
+  дважды, даже если его запросили несколько раз подряд.
+
+Pillow нужен только здесь (и в просмотрщике); импортируется лениво.
+"""
+import hashlib
+import io
+import os
+import threading
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+THUMB_PX = int(os.getenv("AIHUB_THUMB_PX", "256"))
+THUMB_MEM_MB = int(os.getenv("AIHUB_THUMB_MEM_MB", "64"))
+THUMB_DIR = os.getenv("AIHUB_THUMB_DIR")
+THUMB_WORKERS = 4
+FETCH_TIMEOUT = 30
+
+
+def thumb_key(source: str) -> str:
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+
+def fetch_bytes(url: str) -> bytes:
+    with urllib.request.urlopen(url, timeout=FETCH_TIMEOUT) as resp:
+        return resp.read()
+
+
+class ThumbCache:
+    """Memory LRU (bounded by bytes) over an on-disk thumbnail cache."""
+
+    def __init__(
+        self,
+        size: int = THUMB_PX,
+        max_bytes: int = THUMB_MEM_MB * 1024 * 1024,
+        cache_dir: str | None = None,
+        fetch=fetch_bytes,
+        workers: int = THUMB_WORKERS,
+    ):
+        self.size = size
+        self.max_bytes = max_bytes
+        if cache_dir is None:
+            if THUMB_DIR:
+                cache_dir = THUMB_DIR
+            else:
+                from paths import data_path
+
+                cache_dir = os.path.dirname(data_path("thumbs", "x"))
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self._fetch = fetch
+        self._lock = threading.Lock()
+        self._mem: "OrderedDict[str, tuple[object, int]]" = OrderedDict()
+        self._mem_bytes = 0
+        self._inflight: dict[str, list] = {}
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="thumb"
+        )
+        self.stats = {"mem": 0, "disk": 0, "fetched": 0, "fetched_bytes": 0}
+
+    # ---- public ----
+    def get(self, key: str):
+        """PIL image from memory or None; never touches disk or network."""
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is None:
+                return None
+            self._mem.move_to_end(key)
+            self.stats["mem"] += 1
+            return hit[0]
+
+    def request(self, key: str, source_fn, callback):
+        """Load a thumbnail in the background. source_fn() -> whatever
+        `fetch` accepts (a URL by default) is called only if the thumbnail
+        is not cached on disk.
+        callback(key, image_or_None) runs in a worker thread."""
+        img = self.get(key)
+        if img is not None:
+            callback(key, img)
+            return
+        with self._lock:
+            waiters = self._inflight.get(key)
+            if waiters is not None:
+                waiters.append(callback)
+                return
+            self._inflight[key] = [callback]
+        self._pool.submit(self._load, key, source_fn)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    # ---- internals ----
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.jpg")
+
+    def _load(self, key: str, source_fn):
+        img = None
+        try:
+            from PIL import Image
+
+            path = self._disk_path(key)
+            if os.path.exists(path):
+                with Image.open(path) as im:
+                    im.load()
+                    img = im.copy()
+                self.stats["disk"] += 1
+            else:
+                data = self._fetch(source_fn())
+                self.stats["fetched"] += 1
+                self.stats["fetched_bytes"] += len(data)
+                img = self._make_thumb(data)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = f"{path}.{threading.get_ident()}.tmp"
+                img.save(tmp, format="JPEG", quality=82, optimize=True)
+                os.replace(tmp, path)
+            self._remember(key, img)
+        except Exception:
+            img = None
+        with self._lock:
+            waiters = self._inflight.pop(key, [])
+        for cb in waiters:
+            try:
+                cb(key, img)
+            except Exception:
+                pass
+
+    def _make_thumb(self, data: bytes):
+        from PIL import Image, ImageOps
+
+        im = Image.open(io.BytesIO(data))
+        if im.format == "JPEG":
+            im.draft("RGB", (self.size, self.size))
+        im = ImageOps.exif_transpose(im)
+        im.thumbnail((self.size, self.size), Image.LANCZOS, reducing_gap=3.0)
+        if im.mode != "RGB":
+            im = im.convert("RGB")
+        return im
+
+    def _remember(self, key: str, img):
+        nbytes = img.width * img.height * len(img.getbands())
+        with self._lock:
+            if key in self._mem:
+                return
+            self._mem[key] = (img, nbytes)
+            self._mem_bytes += nbytes
+            while self._mem_bytes > self.max_bytes and len(self._mem) > 1:
+                _, (_, n) = self._mem.popitem(last=False)
+                self._mem_bytes -= n
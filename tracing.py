@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+"""
+Лёгкая трассировка запроса: create → ожидание/поллинг → выгрузка в S3 →
+presign, вложенными спанами с привязкой к prediction id.
+
+Включается AIHUB_TRACE=1 (выключенная трассировка — один if на спан).
+Спаны пишет фоновый поток в JSONL-файл в формате OTLP/JSON
+(resourceSpans → scopeSpans → spans), одна пачка спанов на строку —
+файл читается любым инструментом, который понимает OTLP JSON.
+
+Текущий спан хранится в contextvars, поэтому вложенность сохраняется
+внутри asyncio.run()/asyncio.to_thread (S3Client), но не переносится в
+чужие потоки — корневой спан запроса открывается в потоке воркера.
+
+Сводка по критическому пути:
+    python tracing.py [файл] [--prediction ID] [--last N]
+"""
+import argparse
+import atexit
+import contextvars
+import json
+import os
+import queue
+import secrets
+import sys
+import threading
+import time
+from collections import defaultdict
+
+TRACE_ENABLED = os.getenv("AIHUB_TRACE", "") not in ("", "0")
+TRACE_FILE = os.getenv("AIHUB_TRACE_FILE")
+SERVICE_NAME = "ai-workbench"
+FLUSH_INTERVAL = 1.0
+
+STATUS_OK, STATUS_ERROR = 1, 2
+
+_current: contextvars.ContextVar = contextvars.ContextVar("aihub_span", default=None)
+
+
+def trace_path() -> str:
+    if TRACE_FILE:
+        return TRACE_FILE
+    from paths import data_path
+
+    return data_path("traces", "spans.jsonl")
+
+
+def _attr_value(v) -> dict:
+    if isinstance(v, bool):
+        return {"boolValue": v}
+    if isinstance(v, int):
+        return {"intValue": str(v)}  # OTLP JSON: int64 строкой
+    if isinstance(v, float):
+        return {"doubleValue": v}
+    return {"stringValue": str(v)}
+
+
+class Span:
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent",
+        "start_ns",
+        "end_ns",
+        "attrs",
+        "events",
+        "status",
+        "message",
+        "_token",
+    )
+
+    def __init__(self, name: str, parent: "Span | None", attrs: dict):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.start_ns = 0
+        self.end_ns = 0
+        self.attrs = attrs
+        self.events: list = []
+        self.status = STATUS_OK
+        self.message = ""
+        self._token = None
+
+    @property
+    def root(self) -> "Span":
+        s = self
+        while s.parent is not None:
+            s = s.parent
+        return s
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def event(self, name: str, **attrs):
+        self.events.append((time.time_ns(), name, attrs))
+
+    def __enter__(self):
+        self.start_ns = time.time_ns()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        _current.reset(self._token)
+        if exc is not None:
+            self.status = STATUS_ERROR
+            self.message = f"{exc_type.__name__}: {exc}"
+        _exporter.put(self)
+        return False
+
+    def to_otlp(self) -> dict:
+        d = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [
+                {"key": k, "value": _attr_value(v)}
+                for k, v in self.attrs.items()
+                if v is not None
+            ],
+            "status": {"code": self.status},
+        }
+        if self.parent is not None:
+            d["parentSpanId"] = self.parent.span_id
+        if self.message:
+            d["status"]["message"] = self.message
+        if self.events:
+            d["events"] = [
+                {
+                    "timeUnixNano": str(t),
+                    "name": n,
+                    "attributes": [
+                        {"key": k, "value": _attr_value(v)} for k, v in a.items()
+                    ],
+                }
+                for t, n, a in self.events
+            ]
+        return d
+
+
+class _NoopSpan:
+    """Returned when tracing is off: every call is a no-op."""
+
+    def set(self, **attrs):
+        pass
+
+    def event(self, name: str, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name: str, **attrs):
+    """Context manager for a child of the current span (or a new trace)."""
+    if not TRACE_ENABLED:
+        return _NOOP
+    return Span(name, _current.get(), attrs)
+
+
+def current():
+    s = _current.get() if TRACE_ENABLED else None
+    return s if s is not None else _NOOP
+
+
+def set_prediction(prediction_id: str, **attrs):
+    """Key the whole trace by prediction id (set on the root span)."""
+    s = _current.get() if TRACE_ENABLED else None
+    if s is None:
+        return
+    s.root.attrs["prediction.id"] = prediction_id
+    s.attrs["prediction.id"] = prediction_id
+    s.root.attrs.update(attrs)
+
+
+class _Exporter:
+    """Batches finished spans and appends them to the JSONL file."""
+
+    def __init__(self):
+        self._q: queue.Queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def put(self, span: Span):
+        self._q.put(span)
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._loop, daemon=True, name="trace-exporter"
+                    )
+                    self._thread.start()
+                    atexit.register(self.flush)
+
+    def _loop(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        spans = []
+        while True:
+            try:
+                spans.append(self._q.get_nowait())
+            except queue.Empty:
+                break
+        if not spans:
+            return
+        batch = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {"key": "service.name", "value": _attr_value(SERVICE_NAME)},
+                            {"key": "process.pid", "value": _attr_value(os.getpid())},
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "aihub.tracing"},
+                            "spans": [s.to_otlp() for s in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+        try:
+            with self._lock, open(trace_path(), "a", encoding="utf-8") as f:
+                f.write(json.dumps(batch, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print("tracing: не удалось записать спаны:", e, file=sys.stderr)
+
+
+_exporter = _Exporter()
+
+
+def flush():
+    _exporter.flush()
+
+
+# ---------------- сводка ----------------
+def _attrs(d: dict) -> dict:
+    out = {}
+    for a in d.get("attributes", []):
+        v = a.get("value", {})
+        out[a["key"]] = next(iter(v.values()), None)
+    return out
+
+
+def load_traces(path: str) -> dict[str, list[dict]]:
+    traces: dict[str, list[dict]] = defaultdict(list)
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                batch = json.loads(line)
+            except ValueError:
+                continue
+            for rs in batch.get("resourceSpans", []):
+                for ss in rs.get("scopeSpans", []):
+                    for s in ss.get("spans", []):
+                        s["_start"] = int(s["startTimeUnixNano"])
+                        s["_end"] = int(s["endTimeUnixNano"])
+                        s["_attrs"] = _attrs(s)
+                        traces[s["traceId"]].append(s)
+    return traces
+
+
+def _critical(node: dict, by_parent: dict) -> list[tuple[dict, int]]:
+    # идём от конца узла назад: на каждом шаге — ребёнок, который закончился
+    # последним до текущей точки; промежутки между детьми — своё время узла
+    children = by_parent.get(node["spanId"], [])
+    cursor = node["_end"]
+    self_ns = 0
+    chain: list[tuple[dict, int]] = []
+    while True:
+        done = [c for c in children if c["_end"] <= cursor]
+        if not done:
+            self_ns += max(0, cursor - node["_start"])
+            break
+        c = max(done, key=lambda c: c["_end"])
+        self_ns += cursor - c["_end"]
+        chain = _critical(c, by_parent) + chain
+        cursor = c["_start"]
+    return [(node, self_ns)] + chain
+
+
+def critical_path(spans: list[dict]) -> list[tuple[dict, int]]:
+    """Spans on the critical path of the longest root, with the self time
+    (ns) each contributed; the self times add up to the root duration."""
+    by_parent = defaultdict(list)
+    ids = {s["spanId"] for s in spans}
+    roots = []
+    for s in spans:
+        p = s.get("parentSpanId")
+        if p and p in ids:
+            by_parent[p].append(s)
+        else:
+            roots.append(s)
+    if not roots:
+        return []
+    root = max(roots, key=lambda s: s["_end"] - s["_start"])
+    return _critical(root, by_parent)
+
+
+def summarize(trace: list[dict]) -> str:
+    start = min(s["_start"] for s in trace)
+    end = max(s["_end"] for s in trace)
+    pid = next(
+        (s["_attrs"]["prediction.id"] for s in trace if "prediction.id" in s["_attrs"]),
+        "—",
+    )
+    total = (end - start) / 1e6
+    lines = [f"prediction {pid}: {total:.0f} мс, спанов {len(trace)}"]
+
+    # дерево
+    by_parent = defaultdict(list)
+    ids = {s["spanId"] for s in trace}
+    for s in sorted(trace, key=lambda s: s["_start"]):
+        p = s.get("parentSpanId")
+        by_parent[p if p in ids else None].append(s)
+
+    def walk(parent, depth):
+        for s in by_parent.get(parent, []):
+            dur = (s["_end"] - s["_start"]) / 1e6
+            offset = (s["_start"] - start) / 1e6
+            err = " ✕" if s.get("status", {}).get("code") == STATUS_ERROR else ""
+            extra = ""
+            if "polls" in s["_attrs"]:
+                extra = f" (опросов: {s['_attrs']['polls']})"
+            lines.append(
+                f"  {'  ' * depth}{s['name']:<{36 - 2 * depth}}"
+                f" +{offset:8.0f} мс {dur:8.0f} мс{extra}{err}"
+            )
+            walk(s["spanId"], depth + 1)
+
+    walk(None, 0)
+    lines.append("  критический путь (собственное время):")
+    for s, self_ns in critical_path(trace):
+        share = 100 * self_ns / max(1, end - start)
+        lines.append(f"    {s['name']:<34} {self_ns / 1e6:8.0f} мс {share:5.1f}%")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Сводка по трассам запросов")
+    ap.add_argument("path", nargs="?", default=None)
+    ap.add_argument("--prediction", help="только этот prediction id")
+    ap.add_argument("--last", type=int, default=5, help="сколько последних трасс")
+    args = ap.parse_args(argv)
+    traces = load_traces(args.path or trace_path())
+    items = sorted(traces.values(), key=lambda t: min(s["_start"] for s in t))
+    if args.prediction:
+        items = [
+            t
+            for t in items
+            if any(s["_attrs"].get("prediction.id") == args.prediction for s in t)
+        ]
+    else:
+        items = items[-args.last :]
+    if not items:
+        print("Трасс не найдено")
+        return 1
+    for t in items:
+        print(summarize(t))
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
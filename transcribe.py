@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+"""
+Параллельная транскрипция длинных записей Whisper-подобными моделями.
+
+Вместо одного prediction на час аудио:
+1. ffmpeg silencedetect ищет паузы; точки разреза — ближайшая к целевой
+   границе (каждые CHUNK_S секунд) середина паузы, иначе жёсткий разрез;
+2. каждый кусок вырезается с перекрытием OVERLAP_S с обеих сторон и
+   перекодируется в моно 16 кГц (меньше загрузка, Whisper всё равно
+   работает на 16 кГц);
+3. куски грузятся через S3Client и транскрибируются параллельно,
+   упавший кусок перезапускается, а не весь файл;
+4. сегменты сшиваются: таймкоды сдвигаются на начало куска, а из зоны
+   перекрытия берётся сегмент того куска, которому принадлежит его
+   середина — дублей на стыках нет; у вывода без таймкодов повтор слов
+   на стыке вырезается по тексту. Кусок, который так и не удалось
+   распознать, остаётся в тексте пометкой MISSING_TEXT.
+
+Результат в формате Whisper: {"transcription", "segments", ...}.
+
+Пока это отдельная команда: в окне нет аудио-моделей (загружаются
+только models_conf/text), поэтому отправки Whisper через GUI нет.
+
+    python transcribe.py lecture.mp3 --parallel 6
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+
+import predictions
+
+TRANSCRIBE_MODEL = os.getenv("AIHUB_TRANSCRIBE_MODEL", "openai/whisper")
+TRANSCRIBE_AUDIO_KEY = os.getenv("AIHUB_TRANSCRIBE_AUDIO_KEY", "audio")
+PARALLEL = int(os.getenv("AIHUB_TRANSCRIBE_PARALLEL", "4"))
+CHUNK_S = float(os.getenv("AIHUB_TRANSCRIBE_CHUNK_S", "600"))
+OVERLAP_S = 2.0
+SEARCH_S = 60.0  # насколько далеко от целевой границы искать паузу
+SILENCE_DB = -35
+SILENCE_MIN_S = 0.4
+CHUNK_RETRIES = 2
+OVERLAP_WORDS = 30  # сколько слов на стыке сравнивать, если нет таймкодов
+MISSING_TEXT = "[не распознано]"
+FFMPEG = os.getenv("AIHUB_FFMPEG", "ffmpeg")
+FFPROBE = os.getenv("AIHUB_FFPROBE", "ffprobe")
+
+
+@dataclass
+class Chunk:
+    index: int
+    own_start: float  # отрезок записи, за который кусок «отвечает»
+    own_end: float
+    start: float  # реально вырезанный отрезок (с перекрытием)
+    end: float
+    path: str | None = None
+    url: str | None = None
+    output: object = None
+    attempts: int = 0
+    error: str | None = None
+
+
+@dataclass
+class TranscribeResult:
+    transcription: str
+    segments: list = field(default_factory=list)
+    chunks: int = 0
+    duration: float = 0.0
+    wall_time: float = 0.0
+    failed: list = field(default_factory=list)  # индексы кусков без текста
+    errors: dict = field(default_factory=dict)  # индекс куска -> ошибка
+
+    def as_output(self) -> dict:
+        return {
+            "transcription": self.transcription,
+            "segments": self.segments,
+            "chunks": self.chunks,
+            "failed_chunks": self.failed,
+            "errors": self.errors,
+        }
+
+
+# ---- ffmpeg ----
+def probe_duration(path: str) -> float:
+    out = subprocess.run(
+        [
+            FFPROBE,
+            "-v",
+            "error",
+            "-show_entries",
+            "format=duration",
+            "-of",
+            "default=noprint_wrappers=1:nokey=1",
+            path,
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return float(out.strip())
+
+
+_SILENCE_START = re.compile(r"silence_start:\s*(-?[\d.]+)")
+_SILENCE_END = re.compile(r"silence_end:\s*([\d.]+)")
+
+
+def detect_silences(path: str) -> list[tuple[float, float]]:
+    """(start, end) of pauses longer than SILENCE_MIN_S."""
+    proc = subprocess.run(
+        [
+            FFMPEG,
+            "-hide_banner",
+            "-nostats",
+            "-i",
+            path,
+            "-vn",
+            "-af",
+            f"silencedetect=noise={SILENCE_DB}dB:d={SILENCE_MIN_S}",
+            "-f",
+            "null",
+            "-",
+        ],
+        capture_output=True,
+        text=True,
+    )
+    silences, start = [], None
+    for line in proc.stderr.splitlines():
+        m = _SILENCE_START.search(line)
+        if m:
+            start = max(0.0, float(m.group(1)))
+            continue
+        m = _SILENCE_END.search(line)
+        if m and start is not None:
+            silences.append((start, float(m.group(1))))
+            start = None
+    return silences
+
+
+def split_points(
+    duration: float,
+    silences: list[tuple[float, float]],
+    chunk_s: float = CHUNK_S,
+    search_s: float = SEARCH_S,
+) -> list[float]:
+    """Cut points in seconds, [0, ..., duration]."""
+    mids = [(a + b) / 2 for a, b in silences]
+    cuts = [0.0]
+    while duration - cuts[-1] > chunk_s * 1.25:
+        target = cuts[-1] + chunk_s
+        near = [m for m in mids if abs(m - target) <= search_s and m > cuts[-1]]
+        cuts.append(min(near, key=lambda m: abs(m - target)) if near else target)
+    cuts.append(duration)
+    return cuts
+
+
+def plan_chunks(
+    duration: float, cuts: list[float], overlap: float = OVERLAP_S
+) -> list[Chunk]:
+    chunks = []
+    for i, (a, b) in enumerate(zip(cuts, cuts[1:])):
+        chunks.append(
+            Chunk(
+                index=i,
+                own_start=a,
+                own_end=b,
+                start=max(0.0, a - overlap),
+                end=min(duration, b + overlap),
+            )
+        )
+    return chunks
+
+
+def extract_chunk(src: str, chunk: Chunk, out_dir: str) -> str:
+    out = os.path.join(out_dir, f"chunk_{chunk.index:04d}.mp3")
+    subprocess.run(
+        [
+            FFMPEG,
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-y",
+            "-ss",
+            f"{chunk.start:.3f}",
+            "-t",
+            f"{chunk.end - chunk.start:.3f}",
+            "-i",
+            src,
+            "-vn",
+            "-ac",
+            "1",
+            "-ar",
+            "16000",
+            "-b:a",
+            "48k",
+            out,
+        ],
+        check=True,
+    )
+    return out
+
+
+# ---- сшивка ----
+def _segments_of(output) -> tuple[list, str]:
+    if isinstance(output, list) and output and isinstance(output[0], dict):
+        output = output[0]
+    if not isinstance(output, dict):
+        return [], output if isinstance(output, str) else ""
+    return output.get("segments") or [], output.get("transcription") or ""
+
+
+def _words(text: str) -> list[str]:
+    return [re.sub(r"\W", "", w.lower()) for w in text.split()]
+
+
+def _drop_overlap(before: str, text: str, max_words: int = OVERLAP_WORDS) -> str:
+    """Cut from `text` the leading words that repeat the end of `before`
+    (overlap of neighbouring chunks when there are no timestamps)."""
+    tail, words = _words(before)[-max_words:], text.split()
+    head = _words(" ".join(words[:max_words]))
+    for n in range(min(len(tail), len(head)), 1, -1):
+        if tail[-n:] == head[:n]:
+            return " ".join(words[n:])
+    return text
+
+
+def stitch(chunks: list[Chunk]) -> tuple[list[dict], str]:
+    """Merge chunk outputs into one timeline; overlap goes to the chunk
+    whose owned range contains the segment midpoint. A chunk without
+    output leaves a MISSING_TEXT segment marked "missing"."""
+    segments = []
+    prev = None  # предыдущий кусок с текстом и был ли он без таймкодов
+    for chunk in sorted(chunks, key=lambda c: c.index):
+        if chunk.output is None:
+            segments.append(
+                {
+                    "start": chunk.own_start,
+                    "end": chunk.own_end,
+                    "text": MISSING_TEXT,
+                    "missing": True,
+                }
+            )
+            prev = None
+            continue
+        segs, text = _segments_of(chunk.output)
+        added = []
+        if not segs:
+            # модель вернула только текст — берём целиком
+            if text.strip():
+                added.append(
+                    {
+                        "start": chunk.own_start,
+                        "end": chunk.own_end,
+                        "text": text.strip(),
+                    }
+                )
+        last = chunk.index == len(chunks) - 1
+        for s in segs:
+            start = float(s.get("start", 0.0)) + chunk.start
+            end = float(s.get("end", 0.0)) + chunk.start
+            mid = (start + end) / 2
+            if mid < chunk.own_start or (mid >= chunk.own_end and not last):
+                continue
+            seg = dict(s)
+            seg["start"], seg["end"] = round(start, 3), round(end, 3)
+            seg["text"] = (s.get("text") or "").strip()
+            added.append(seg)
+        if added and prev is not None and prev[0] == chunk.index - 1:
+            # без таймкодов (у этого куска или у соседа) перекрытие по
+            # середине не отрезать — убираем повтор слов на стыке
+            if prev[1] or not segs:
+                before = " ".join(s["text"] for s in segments[-5:])
+                added[0]["text"] = _drop_overlap(before, added[0]["text"])
+                if not added[0]["text"]:
+                    added.pop(0)
+        segments.extend(added)
+        prev = (chunk.index, not segs)
+    for i, seg in enumerate(segments):
+        seg["id"] = i
+    text = " ".join(s["text"] for s in segments if s["text"])
+    return segments, text
+
+
+# ---- запуск ----
+def transcribe(
+    path: str,
+    model: str = TRANSCRIBE_MODEL,
+    extra_input: dict | None = None,
+    parallel: int = PARALLEL,
+    chunk_s: float = CHUNK_S,
+    on_progress=None,
+    cancel_event: threading.Event | None = None,
+    upload=None,
+    client=None,
+) -> TranscribeResult:
+    """Split, upload and transcribe `path` concurrently.
+
+    on_progress(done, total) is called from worker threads.
+    upload(path, object_name) -> url defaults to S3Client."""
+    if upload is None:
+        from attachments import s3_upload as upload
+    from attachments import file_sha256
+
+    client = client or predictions.get_client()
+    t0 = time.perf_counter()
+    duration = probe_duration(path)
+    digest = file_sha256(path)[:16]
+
+    with tempfile.TemporaryDirectory(prefix="transcribe-") as tmp:
+        if duration <= chunk_s * 1.25:
+            chunks = plan_chunks(duration, [0.0, duration], overlap=0.0)
+            chunks[0].path = path
+        else:
+            cuts = split_points(duration, detect_silences(path), chunk_s)
+            chunks = plan_chunks(duration, cuts)
+
+        done = 0
+        lock = threading.Lock()
+
+        def work(chunk: Chunk):
+            nonlocal done
+            payload = dict(extra_input or {})
+            while chunk.attempts <= CHUNK_RETRIES:
+                chunk.attempts += 1
+                try:
+                    # ffmpeg и S3 тоже повторяем: сбой куска не роняет весь файл
+                    if chunk.path is None:
+                        chunk.path = extract_chunk(path, chunk, tmp)
+                    if chunk.url is None:
+                        ext = os.path.splitext(chunk.path)[1]
+                        chunk.url = upload(
+                            chunk.path, f"transcribe/{digest}/{chunk.index:04d}{ext}"
+                        )
+                        if not chunk.url:
+                            raise RuntimeError("S3 не вернул ссылку")
+                    payload[TRANSCRIBE_AUDIO_KEY] = chunk.url
+                    res = predictions.run(
+                        client, model, payload, cancel_event=cancel_event, stream=False
+                    )
+                    p = res.prediction
+                    if p.status != "succeeded":
+                        raise RuntimeError(p.error or p.status)
+                    chunk.output, chunk.error = p.output, None
+                    break
+                except predictions.Cancelled:
+                    raise
+                except Exception as e:
+                    chunk.error = str(e)
+            with lock:
+                done += 1
+                if on_progress is not None:
+                    on_progress(done, len(chunks))
+
+        with ThreadPoolExecutor(
+            max_workers=max(1, parallel), thread_name_prefix="transcribe"
+        ) as pool:
+            futures = [pool.submit(work, c) for c in chunks]
+            for f in as_completed(futures):
+                f.result()
+
+    segments, text = stitch(chunks)
+    return TranscribeResult(
+        transcription=text,
+        segments=segments,
+        chunks=len(chunks),
+        duration=duration,
+        wall_time=time.perf_counter() - t0,
+        failed=[c.index for c in chunks if c.output is None],
+        errors={c.index: c.error for c in chunks if c.output is None},
+    )
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Параллельная транскрипция")
+    ap.add_argument("path")
+    ap.add_argument("--model", default=TRANSCRIBE_MODEL)
+    ap.add_argument("--parallel", type=int, default=PARALLEL)
+    ap.add_argument("--chunk", type=float, default=CHUNK_S, help="секунд в куске")
+    args = ap.parse_args(argv)
+
+    def progress(done, total):
+        print(f"Кусков готово: {done}/{total}", file=sys.stderr)
+
+    res = transcribe(
+        args.path,
+        model=args.model,
+        parallel=args.parallel,
+        chunk_s=args.chunk,
+        on_progress=progress,
+    )
+    print(res.transcription)
+    print(
+        f"\n--- {res.chunks} кусков, {res.duration:.0f} c аудио"
+        f" за {res.wall_time:.1f} c ---",
+        file=sys.stderr,
+    )
+    if res.failed:
+        for index, error in res.errors.items():
+            print(f"Не распознан кусок {index}: {error}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    sys.exit(main())
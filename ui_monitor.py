@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+Монитор «подвисаний» Tk-цикла (опционально, выключен по умолчанию).
+
+- heartbeat: каждые interval_ms через after() меряем, насколько поздно
+  сработал тик (lag);
+- watchdog-поток: если тик не приходил дольше threshold_ms, снимает стек
+  главного потока — видно, какой обработчик держит цикл;
+- track(name): обёртка для обработчиков (_rebuild_settings, <Configure>,
+  <KeyRelease>, отрисовка ответа), имя попадает в отчёт о зависании;
+- отчёт: JSON с агрегатами по обработчикам и последними N зависаниями,
+  перезаписывается не чаще раза в несколько секунд;
+- overlay: маленькая метка в углу окна с lag и долей кадров сверх бюджета.
+
+Включение: app.py --monitor-ui [--ui-overlay] или AIHUB_UI_MONITOR=1.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from functools import wraps
+
+UI_MONITOR_ENABLED = os.getenv("AIHUB_UI_MONITOR", "") not in ("", "0")
+UI_STALL_THRESHOLD_MS = float(os.getenv("AIHUB_UI_STALL_MS", "200"))
+UI_REPORT_PATH = os.getenv("AIHUB_UI_REPORT", "ui_stalls.json")
+FRAME_BUDGET_MS = 1000.0 / 60
+
+_active = None  # текущий StallMonitor или None
+
+
+def track(name: str):
+    """Decorator: attribute time spent in the wrapped Tk handler to `name`.
+    Costs one global lookup when the monitor is off."""
+
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            mon = _active
+            if mon is None:
+                return fn(*args, **kwargs)
+            mon._enter(name)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                mon._exit(name)
+
+        return wrapper
+
+    return deco
+
+
+class StallMonitor:
+    def __init__(
+        self,
+        root,
+        interval_ms: int = 50,
+        threshold_ms: float = UI_STALL_THRESHOLD_MS,
+        report_path: str = UI_REPORT_PATH,
+        keep: int = 200,
+        overlay: bool = False,
+    ):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.threshold_ms = threshold_ms
+        self.report_path = report_path
+        self.overlay = overlay
+
+        self._main_ident = threading.main_thread().ident
+        self._lock = threading.Lock()
+        self._handlers: list[tuple[str, float]] = []  # стек активных обработчиков
+        self._last_beat = time.perf_counter()
+        self._expected = None
+        self._stall_open = None  # данные текущего (ещё не закрытого) зависания
+
+        self.lags: deque = deque(maxlen=max(1, int(1000 / interval_ms)))
+        self.stalls: deque = deque(maxlen=keep)
+        self.by_handler: dict[str, dict] = {}
+        self.beats = 0
+        self.over_budget = 0
+
+        self._stop = threading.Event()
+        self._dirty = False
+        self._last_write = 0.0
+        self._overlay_label = None
+
+    # ---- lifecycle ----
+    def start(self):
+        global _active
+        _active = self
+        self._last_beat = time.perf_counter()
+        self._expected = self._last_beat + self.interval_ms / 1000.0
+        self.root.after(self.interval_ms, self._tick)
+        threading.Thread(
+            target=self._watchdog, daemon=True, name="ui-watchdog"
+        ).start()
+        if self.overlay:
+            self._make_overlay()
+        return self
+
+    def stop(self):
+        global _active
+        self._stop.set()
+        if _active is self:
+            _active = None
+        self.write_report(force=True)
+
+    # ---- handler attribution (Tk thread only) ----
+    def _enter(self, name: str):
+        with self._lock:
+            self._handlers.append((name, time.perf_counter()))
+
+    def _exit(self, name: str):
+        now = time.perf_counter()
+        with self._lock:
+            if not self._handlers:
+                return
+            _, started = self._handlers.pop()
+        ms = (now - started) * 1000.0
+        agg = self.by_handler.setdefault(
+            name, {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "stalls": 0}
+        )
+        agg["calls"] += 1
+        agg["total_ms"] += ms
+        agg["max_ms"] = max(agg["max_ms"], ms)
+        if ms >= self.threshold_ms:
+            agg["stalls"] += 1
+
+    # ---- heartbeat ----
+    def _tick(self):
+        if self._stop.is_set():
+            return
+        now = time.perf_counter()
+        lag_ms = max(0.0, (now - self._expected) * 1000.0)
+        self._last_beat = now
+        self._expected = now + self.interval_ms / 1000.0
+        self.lags.append(lag_ms)
+        self.beats += 1
+        if lag_ms > FRAME_BUDGET_MS:
+            self.over_budget += 1
+
+        with self._lock:
+            stall = self._stall_open
+            self._stall_open = None
+        if stall is not None or lag_ms >= self.threshold_ms:
+            stall = stall or {"at": time.time(), "handlers": [], "stack": []}
+            stall["lag_ms"] = round(lag_ms, 1)
+            self.stalls.append(stall)
+            self._dirty = True
+
+        if self._overlay_label is not None:
+            self._update_overlay()
+        self.write_report()
+        self.root.after(self.interval_ms, self._tick)
+
+    def _watchdog(self):
+        # снимаем стек главного потока, пока он «висит»
+        poll = min(self.threshold_ms, 100) / 1000.0
+        while not self._stop.wait(poll):
+            silent_ms = (time.perf_counter() - self._last_beat) * 1000.0
+            if silent_ms < self.threshold_ms + self.interval_ms:
+                continue
+            with self._lock:
+                if self._stall_open is not None:
+                    continue
+                handlers = [h for h, _ in self._handlers]
+            frame = sys._current_frames().get(self._main_ident)
+            stack = []
+            if frame is not None:
+                for fs in traceback.extract_stack(frame)[-8:]:
+                    stack.append(
+                        f"{os.path.basename(fs.filename)}:{fs.lineno} {fs.name}"
+                    )
+            with self._lock:
+                self._stall_open = {
+                    "at": time.time(),
+                    "handlers": handlers,
+                    "stack": stack,
+                }
+
+    # ---- report ----
+    def summary(self) -> dict:
+        lags = sorted(self.lags)
+        p95 = lags[int(len(lags) * 0.95) - 1] if lags else 0.0
+        return {
+            "threshold_ms": self.threshold_ms,
+            "interval_ms": self.interval_ms,
+            "beats": self.beats,
+            "over_frame_budget": self.over_budget,
+            "lag_p95_ms_last_second": round(p95, 1),
+            "handlers": {
+                k: {
+                    **v,
+                    "total_ms": round(v["total_ms"], 1),
+                    "max_ms": round(v["max_ms"], 1),
+                }
+                for k, v in sorted(
+                    self.by_handler.items(), key=lambda kv: -kv[1]["max_ms"]
+                )
+            },
+            "stalls": list(self.stalls),
+        }
+
+    def write_report(self, force: bool = False, every_s: float = 5.0):
+        now = time.perf_counter()
+        if not force and (not self._dirty or now - self._last_write < every_s):
+            return
+        self._dirty = False
+        self._last_write = now
+        tmp = self.report_path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.report_path)
+        except Exception:
+            pass
+
+    # ---- overlay ----
+    def _make_overlay(self):
+        import tkinter as tk
+
+        self._overlay_label = tk.Label(
+            self.root,
+            text="",
+            bg="#202028",
+            fg="#b8ffb8",
+            font=("Courier", 10),
+            padx=6,
+            pady=2,
+        )
+        self._overlay_label.place(relx=1.0, rely=1.0, x=-4, y=-4, anchor="se")
+
+    def _update_overlay(self):
+        lags = list(self.lags)
+        if not lags:
+            return
+        worst = max(lags)
+        over = sum(1 for x in lags if x > FRAME_BUDGET_MS)
+        if worst < FRAME_BUDGET_MS:
+            color = "#b8ffb8"
+        elif worst < self.threshold_ms:
+            color = "#ffe08a"
+        else:
+            color = "#ff8a8a"
+        self._overlay_label.configure(
+            text=(
+                f"lag {lags[-1]:5.1f} ms | max/1s {worst:5.1f} | "
+                f"over budget {over}/{len(lags)}"
+            ),
+            fg=color,
+        )